@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks des quatre programmes du VOCAL sur données synthétiques (synthetic.py).
+
+Pour chaque taille (lignes de prélèvements ; par défaut 10 000, 100 000 et 1 000 000) :
+1. génération des GeoPackages (prélèvements, autorisations DDTM, zonage, zonage englobant, zone
+   d'étude) dans le dossier de travail, repris tels quels s'ils existent déjà ;
+2. exécution de chaque programme avec son rapport des étapes (OUTPUT_REPORT) : une exécution
+   cache vide ('froid') puis `--repeat - 1` exécutions cache rempli ('chaud') ;
+3. résultats réunis dans un JSON horodaté (dossier results/), réécrit après chaque exécution :
+   machine, versions, moteur de calcul, jeux de données, durée et étapes de chaque exécution.
+`--compare ancien.json` liste les étapes nettement plus lentes que dans un résultat précédent
+(code de sortie 1 s'il y en a).
+
+À lancer avec le Python de QGIS (OSGeo4W Shell : python-qgis ; Linux : python3 avec PyQGIS) :
+    python benchmarks/run_benchmarks.py --sizes 10000 100000 --granularity 16
+"""
+
+import argparse
+import datetime
+import gc
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (
+    Qgis,
+    QgsApplication,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+    QgsFeature,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProcessingContext,
+    QgsProcessingFeedback,
+    QgsProject,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+
+# générateur (à côté de ce script) et moteur partagé (dossier scripts du dépôt)
+_BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(_BENCH_DIR), 'scripts')
+for _path in (_BENCH_DIR, SCRIPTS_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+from synthetic import (
+    CRS,
+    AUTOR_FIELDS,
+    ZONE_FIELDS,
+    PARENT_FIELDS,
+    STUDY_FIELDS,
+    SyntheticDataset,
+)
+from vocal_core import METHODS, SinkWriter, backend_summary
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+# une étape est signalée si elle est plus lente que la référence d'au moins ce facteur
+REGRESSION_RATIO = 1.25
+# durées trop courtes pour être comparées (bruit de mesure)
+MIN_COMPARED_S = 0.05
+
+# programme -> (script, classe)
+ALGORITHMS = {
+    'pentes_ouvrages': ('compute_slopes_qgis_ouvrages.py', 'ComputeSlopesByOuvrage'),
+    'pentes_zonages': ('compute_slopes_qgis_zonages.py', 'ZonesSlopesAlgorithm'),
+    'ratio_ouvrages': ('compute_ratio_VPVA_ouvrages.py', 'ComparePrelevementsAutorises'),
+    'ratio_zonages': ('compute_ratio_VPVA_zonages.py', 'ZonesComparePrelevAutorise'),
+}
+
+# couche (fichier <couche>.gpkg, même nom de couche) -> type de géométrie
+LAYERS = {
+    'prelevements': 'point',
+    'autorisations': None,
+    'zonage': 'polygon',
+    'zonage_parent': 'polygon',
+    'zone_etude': 'polygon',
+}
+_WKB = {'point': QgsWkbTypes.Point, 'polygon': QgsWkbTypes.Polygon, None: QgsWkbTypes.NoGeometry}
+
+
+class BenchFeedback(QgsProcessingFeedback):
+    """Feedback qui garde les erreurs (rapportées dans le JSON) et affiche le journal si verbose."""
+
+    def __init__(self, verbose=False):
+        super().__init__()
+        self.verbose = verbose
+        self.errors = []
+
+    def pushInfo(self, info):
+        if self.verbose:
+            print('    ' + info)
+
+    def reportError(self, error, fatalError=False):
+        self.errors.append(error)
+        if self.verbose:
+            print('    ERREUR ' + error)
+
+
+# ---------- jeux de données ----------
+def write_layer(path, fields, geometry, rows):
+    """Écrit les lignes de synthetic (attributs, géométrie) dans un GeoPackage ; retourne le nombre d'entités."""
+    qfields = QgsFields()
+    for name, kind in fields:
+        qfields.append(QgsField(name, QVariant.Int if kind == 'int' else QVariant.String))
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = os.path.splitext(os.path.basename(path))[0]
+    writer = QgsVectorFileWriter.create(path, qfields, _WKB[geometry], QgsCoordinateReferenceSystem(CRS),
+                                        QgsCoordinateTransformContext(), options)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise RuntimeError(f"Écriture de {path} impossible : {writer.errorMessage()}")
+    with SinkWriter(writer) as out:
+        for attrs, geom in rows:
+            feat = QgsFeature(qfields)
+            feat.setAttributes(attrs)
+            if isinstance(geom, tuple):
+                feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(*geom)))
+            elif geom is not None:
+                feat.setGeometry(QgsGeometry.fromWkt(geom))
+            out.add(feat)
+    written = out.written
+    # fermeture du fichier (le SinkWriter garde une référence au writer)
+    del out, writer
+    return written
+
+
+def prepare_dataset(data, folder):
+    """
+    GeoPackages du jeu `data` dans `folder`, générés s'ils n'existent pas encore (dataset.json
+    n'est écrit qu'une fois tous les fichiers complets). Retourne le résumé du jeu.
+    """
+    meta_path = os.path.join(folder, 'dataset.json')
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            return json.load(f)
+    os.makedirs(folder, exist_ok=True)
+    content = {
+        'prelevements': (data.prelev_fields(), data.prelevements),
+        'autorisations': (AUTOR_FIELDS, data.autorisations),
+        'zonage': (ZONE_FIELDS, data.zoning),
+        'zonage_parent': (PARENT_FIELDS, data.parent_zoning),
+        'zone_etude': (STUDY_FIELDS, data.study_zone),
+    }
+    summary = data.summary()
+    summary['generation_s'] = {}
+    summary['features'] = {}
+    for name, (fields, rows) in content.items():
+        t0 = time.perf_counter()
+        summary['features'][name] = write_layer(os.path.join(folder, name + '.gpkg'), fields, LAYERS[name], rows())
+        summary['generation_s'][name] = round(time.perf_counter() - t0, 3)
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def load_layers(folder):
+    layers = {}
+    for name in LAYERS:
+        layer = QgsVectorLayer(f"{os.path.join(folder, name + '.gpkg')}|layername={name}", name, 'ogr')
+        if not layer.isValid():
+            raise RuntimeError(f"Couche {name} illisible dans {folder}.")
+        layers[name] = layer
+    return layers
+
+
+# ---------- exécutions ----------
+def load_script(script_name):
+    """Module du script Processing `script_name` (dossier scripts du dépôt)."""
+    path = os.path.join(SCRIPTS_DIR, script_name)
+    spec = importlib.util.spec_from_file_location('bench_' + os.path.splitext(script_name)[0], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def algorithm_parameters(name, layers, data, args, out_dir):
+    """Paramètres Processing du programme `name` sur les couches du jeu (toutes les années de la période)."""
+    start, end = data.years
+    prelev = layers['prelevements']
+
+    def output(suffix):
+        return os.path.join(out_dir, f"{name}_{suffix}.gpkg")
+
+    common = {'METHOD': args.method, 'MIN_YEARS': 5, 'START_YEAR': start, 'END_YEAR': end,
+              'APPLY_QML': False, 'QML_PATH': '', 'OUTPUT': output('sortie')}
+    if name == 'pentes_ouvrages':
+        return dict(common, ZONE=layers['zone_etude'], INPUT=prelev, YEAR='annee', OUVRAGE='code_ouvrage',
+                    OUV_NAME='libelle_ouvrage', INTERLOC='contribuable', VOL='assiette',
+                    WINDOW_LENGTH=args.window, OUTPUT_WINDOWS=output('fenetres') if args.window else None)
+    if name == 'pentes_zonages':
+        return dict(common, ZONES=layers['zonage'], ZONE_ID='code_zone', OUVRAGES=prelev, YEAR='annee',
+                    OUV_ID='code_ouvrage', VOL='assiette', OUTPUT_ZONE_YEAR=None,
+                    ROLLUP_LAYERS=[layers['zonage_parent']], ROLLUP_FIELDS='code_parent',
+                    OUTPUT_ROLLUP=output('niveaux'))
+    autor = {'AUTOR': layers['autorisations'], 'YEAR': 0, 'ALL_YEARS': True,
+             'START_YEAR': start, 'END_YEAR': end, 'APPLY_QML': False, 'QML_PATH': '', 'OUTPUT': output('sortie')}
+    if name == 'ratio_ouvrages':
+        return dict(autor, ZONE=layers['zone_etude'], PRELEV=prelev, PRELEV_YEAR_FIELD='annee',
+                    PRELEV_OUV_FIELD='code_ouvrage', PRELEV_ASSIETTE_FIELD='assiette', PRELEV_MILIEU_FIELD='milieu',
+                    PRELEV_OUV_NAME='libelle_ouvrage', PRELEV_INTERLOC='contribuable',
+                    AUTOR_OUV_FIELD='code_ouvrage', AUTOR_VOL_FIELD='volume_autorise', AUTOR_DDTM_FIELD='id_ddtm',
+                    INCLUDE_UNMATCHED=True)
+    return dict(autor, ZONES=layers['zonage'], ZONE_LABEL='code_zone', PRELEV=prelev, PRELEV_YEAR='annee',
+                PRELEV_OUV='code_ouvrage', PRELEV_ASSIETTE='assiette',
+                AUTOR_OUV='code_ouvrage', AUTOR_VOL='volume_autorise', AUTOR_DDTM='id_ddtm')
+
+
+def run_algorithm(name, layers, data, args, run_dir, label):
+    """Une exécution du programme `name` ; retourne son entrée du résultat (rapport des étapes compris)."""
+    script_name, class_name = ALGORITHMS[name]
+    out_dir = os.path.join(run_dir, 'sorties')
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+    params = algorithm_parameters(name, layers, data, args, out_dir)
+    report_path = os.path.join(run_dir, f"{name}_{label}.json")
+    params['OUTPUT_REPORT'] = report_path
+    alg = getattr(load_script(script_name), class_name)().create()
+    context = QgsProcessingContext()
+    context.setProject(QgsProject.instance())
+    feedback = BenchFeedback(args.verbose)
+    gc.collect()
+    t0 = time.perf_counter()
+    try:
+        _, ok = alg.run(params, context, feedback)
+    except Exception as e:
+        ok = False
+        feedback.errors.append(str(e))
+    wall = time.perf_counter() - t0
+    report = None
+    if os.path.exists(report_path):
+        with open(report_path, encoding='utf-8') as f:
+            report = json.load(f)
+    del context
+    if not args.keep_outputs:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return {
+        'algorithm': name,
+        'size': data.n_rows,
+        'cache': label.split('_')[0],
+        'run': label,
+        'status': 'ok' if ok else 'error',
+        'errors': feedback.errors[-5:],
+        'wall_s': round(wall, 4),
+        'report': report,
+    }
+
+
+# ---------- résultats ----------
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=_BENCH_DIR,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def stage_times(result):
+    """(programme, taille, cache, étape) -> durée (s) ; minimum des exécutions répétées, 'Total' = durée mesurée."""
+    times = {}
+    for run in result.get('runs', []):
+        key = (run['algorithm'], run['size'], run['cache'])
+        entries = [(s['name'], s['seconds']) for s in (run.get('report') or {}).get('stages', [])]
+        for stage, seconds in entries + [('Total', run['wall_s'])]:
+            k = key + (stage,)
+            times[k] = min(times.get(k, seconds), seconds)
+    return times
+
+
+def compare(reference, result, ratio=REGRESSION_RATIO):
+    """Lignes de texte des étapes plus lentes que dans `reference` d'au moins `ratio`."""
+    old = stage_times(reference)
+    lines = []
+    for key, seconds in sorted(stage_times(result).items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        before = old.get(key)
+        if before is None or max(before, seconds) < MIN_COMPARED_S:
+            continue
+        if seconds >= before * ratio:
+            name, size, cache, stage = key
+            lines.append(f"{name} n={size} {cache} | {stage} : {before:.2f} s -> {seconds:.2f} s (x{seconds / max(before, 1e-9):.2f})")
+    return lines
+
+
+def print_summary(result):
+    print('\nprogramme         lignes     cache   total (s)  pic (Mo)  étape la plus longue')
+    for run in result['runs']:
+        report = run.get('report') or {}
+        stages = report.get('stages') or []
+        slowest = max(stages, key=lambda s: s['seconds']) if stages else None
+        peak = report.get('peak_mb')
+        print(f"{run['algorithm']:<17} {run['size']:>9}  {run['cache']:<6} {run['wall_s']:>9.2f}  "
+              f"{(f'{peak:.1f}' if peak is not None else '-'):>8}  "
+              f"{(slowest['name'] + ' ' + format(slowest['seconds'], '.2f') + ' s') if slowest else run['status']}")
+
+
+def write_result(result, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des programmes VOCAL sur données synthétiques.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="lignes de prélèvements par jeu")
+    parser.add_argument('--algorithms', nargs='+', choices=list(ALGORITHMS), default=list(ALGORITHMS))
+    parser.add_argument('--granularity', type=int, default=16, help="mailles par côté du zonage (granularité² zones)")
+    parser.add_argument('--parent-step', type=int, default=4, help="mailles par côté d'une zone englobante")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--text-years', action='store_true', help="champ année en texte plutôt qu'entier")
+    parser.add_argument('--method', type=int, choices=range(len(METHODS)), default=0,
+                        help="pentes : " + ', '.join(f"{i} = {m}" for i, m in enumerate(METHODS)))
+    parser.add_argument('--window', type=int, default=0, help="fenêtres glissantes de pentes_ouvrages (0 = sans)")
+    parser.add_argument('--repeat', type=int, default=2, help="exécutions par programme (la première cache vide)")
+    parser.add_argument('--workdir', default=os.path.join(_BENCH_DIR, 'data'), help="jeux générés, caches et sorties")
+    parser.add_argument('--out', default=os.path.join(_BENCH_DIR, 'results'), help="dossier des résultats JSON")
+    parser.add_argument('--compare', help="résultat JSON de référence")
+    parser.add_argument('--generate-only', action='store_true')
+    parser.add_argument('--keep-outputs', action='store_true', help="garder les couches produites")
+    parser.add_argument('--verbose', action='store_true', help="afficher le journal des programmes")
+    args = parser.parse_args(argv)
+
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    started = datetime.datetime.now()
+    result = {
+        'started': started.isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'qgis': Qgis.QGIS_VERSION,
+        },
+        'backend': backend_summary(scipy=True),
+        'config': {
+            'sizes': args.sizes,
+            'algorithms': args.algorithms,
+            'granularity': args.granularity,
+            'parent_step': args.parent_step,
+            'seed': args.seed,
+            'text_years': args.text_years,
+            'method': METHODS[args.method],
+            'window': args.window,
+            'repeat': args.repeat,
+            'tracemalloc': os.environ.get('VOCAL_TRACEMALLOC', '1'),
+        },
+        'datasets': {},
+        'runs': [],
+    }
+    os.makedirs(args.out, exist_ok=True)
+    result_path = os.path.join(args.out, f"bench_{started:%Y%m%d_%H%M%S}.json")
+
+    for size in args.sizes:
+        data = SyntheticDataset(size, seed=args.seed, granularity=args.granularity,
+                                parent_step=args.parent_step, text_years=args.text_years)
+        folder = os.path.join(args.workdir, f"n{size}_g{args.granularity}_p{args.parent_step}_s{args.seed}"
+                                            f"{'_texte' if args.text_years else ''}")
+        print(f"Jeu de {size} lignes : {folder}")
+        result['datasets'][str(size)] = prepare_dataset(data, folder)
+        if args.generate_only:
+            continue
+        layers = load_layers(folder)
+        run_dir = os.path.join(folder, 'runs')
+        os.makedirs(run_dir, exist_ok=True)
+        # cache propre au jeu, vidé avant la première exécution de chaque programme
+        cache = os.path.join(folder, 'cache')
+        os.environ['VOCAL_CACHE_DIR'] = cache
+        for name in args.algorithms:
+            shutil.rmtree(cache, ignore_errors=True)
+            for k in range(max(1, args.repeat)):
+                label = 'froid' if k == 0 else f"chaud_{k}"
+                run = run_algorithm(name, layers, data, args, run_dir, label)
+                print(f"  {name} [{label}] : {run['wall_s']:.2f} s ({run['status']})")
+                result['runs'].append(run)
+                write_result(result, result_path)
+
+    write_result(result, result_path)
+    print_summary(result)
+    print(f"\nRésultats : {result_path}")
+    code = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            lines = compare(json.load(f), result)
+        print(f"\nComparaison avec {args.compare} (étapes au moins x{REGRESSION_RATIO} plus lentes) :")
+        print('\n'.join('  ' + line for line in lines) if lines else '  aucune')
+        code = 1 if lines else 0
+    app.exitQgis()
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Jeux de données synthétiques pour les benchmarks du VOCAL (Python pur, sans QGIS).
+
+Les données reprennent les particularités des exports Agence / DDTM que les scripts absorbent :
+- prélèvements : une ligne par ouvrage x année, assiettes au format français (espace, espace
+  insécable ou point pour les milliers, virgule décimale, unité), quelques assiettes vides ou au
+  format anglais, années manquantes (mise en service, arrêt, lacunes), valeurs aberrantes
+  (x10, /1000, 0), doublons ouvrage x année (plusieurs points de prélèvement), ouvrages déplacés
+  et lignes sans géométrie ;
+- autorisations DDTM : 0 à 3 arrêtés par ouvrage, lignes exportées deux fois, identifiants
+  entourés d'espaces, volumes vides ou nuls, arrêtés d'ouvrages absents des prélèvements ;
+- zonages : grille irrégulière (sommets déplacés, sans trou ni recouvrement) de granularité
+  choisie, zonage englobant fait de blocs de mailles (emboîtement exact) et zone d'étude centrale.
+
+Une ligne est un couple (attributs, géométrie) : géométrie None, (x, y) pour un point ou WKT pour
+un polygone. L'écriture en GeoPackage est faite par run_benchmarks.py (QGIS).
+"""
+
+import math
+import random
+
+# Hérault, Lambert 93
+CRS = 'EPSG:2154'
+EXTENT = (672000.0, 6235000.0, 776000.0, 6337000.0)
+YEARS = (2008, 2024)
+
+# (nom, type) : 'text', 'int' ; annee devient 'text' avec text_years=True
+PRELEV_FIELDS = [('code_ouvrage', 'text'), ('annee', 'int'), ('assiette', 'text'),
+                 ('libelle_ouvrage', 'text'), ('contribuable', 'text'), ('milieu', 'text')]
+AUTOR_FIELDS = [('code_ouvrage', 'text'), ('volume_autorise', 'text'), ('id_ddtm', 'text')]
+ZONE_FIELDS = [('code_zone', 'text')]
+PARENT_FIELDS = [('code_parent', 'text')]
+STUDY_FIELDS = [('nom', 'text')]
+
+_KINDS = ['Forage', 'Puits', "Prise d'eau", 'Source', 'Captage', 'Pompage', 'Station']
+_PLACES = ['des Prés', 'du Moulin', 'de la Combe', 'du Mas', 'des Garrigues', 'de la Plaine',
+           'du Pont', "de l'Étang", 'des Vignes', 'du Lez', "de l'Hérault", 'de la Source']
+_HOLDERS = ['Commune de', 'EARL', 'SCEA', 'ASA', 'Syndicat', 'GAEC', 'SAS', 'Régie']
+_TOWNS = ['Lunel', 'Mauguio', 'Pézenas', 'Lodève', 'Ganges', 'Agde', 'Clermont', 'Sète',
+          'Frontignan', 'Gignac', 'Aniane', 'Lattes', 'Castries', 'Bédarieux', 'Mèze']
+
+
+def french_volume(value, rnd):
+    """Volume -> texte tel qu'on le trouve dans les exports (formats mélangés, parfois vide)."""
+    u = rnd.random()
+    if u < 0.02:
+        return ''
+    if u < 0.05:
+        return f"{value:.2f}"  # format anglais
+    if u < 0.10:
+        return f"{value:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')  # 12.345,67
+    grouped = f"{value:,.2f}".replace(',', ' ').replace('.', ',')
+    if u < 0.55:
+        return grouped
+    if u < 0.70:
+        return grouped.replace(' ', '\xa0')
+    if u < 0.80:
+        return grouped.replace(' ', '\u202f')
+    if u < 0.85:
+        return f"{value:,.0f}".replace(',', ' ') + ' m3'
+    return f"{value:.2f}".replace('.', ',')
+
+
+class SyntheticDataset:
+    """
+    Jeu de données déterministe (graine `seed`) de `n_rows` lignes de prélèvements.
+    - granularity : mailles par côté du zonage (granularity² zones)
+    - parent_step : mailles par côté d'une zone du zonage englobant
+    - text_years : champ année en texte ('2019', ' 2019', '2019.0') plutôt qu'entier
+    Les ouvrages sont tirés jusqu'à couvrir n_rows ; chacun a son propre tirage, si bien que
+    les prélèvements, les autorisations et les zonages se génèrent dans n'importe quel ordre.
+    """
+
+    def __init__(self, n_rows, seed=1, granularity=16, parent_step=4, years=YEARS, extent=EXTENT, text_years=False):
+        self.n_rows = int(n_rows)
+        self.seed = int(seed)
+        self.granularity = max(1, int(granularity))
+        self.parent_step = max(1, int(parent_step))
+        self.years = (int(years[0]), int(years[1]))
+        self.extent = tuple(float(v) for v in extent)
+        self.text_years = bool(text_years)
+        self._ouvrages = None
+
+    def _rnd(self, *salt):
+        return random.Random('|'.join(str(s) for s in (self.seed,) + salt))
+
+    def prelev_fields(self):
+        return [(name, 'text' if (name == 'annee' and self.text_years) else kind) for name, kind in PRELEV_FIELDS]
+
+    # ---------- ouvrages ----------
+    def ouvrages(self):
+        """Liste des ouvrages (dicts) : code, position, volume de base, tendance, années déclarées."""
+        if self._ouvrages is not None:
+            return self._ouvrages
+        rnd = self._rnd('ouvrages')
+        xmin, ymin, xmax, ymax = self.extent
+        y0, y1 = self.years
+        # ouvrages regroupés autour de bourgs (une cinquantaine d'ouvrages par bourg)
+        n_centers = max(10, self.n_rows // 600)
+        centers = [(rnd.uniform(xmin, xmax), rnd.uniform(ymin, ymax)) for _ in range(n_centers)]
+        ouvrages = []
+        total = 0
+        while total < self.n_rows:
+            i = len(ouvrages)
+            cx, cy = centers[rnd.randrange(n_centers)]
+            x = min(max(rnd.gauss(cx, 1500.0), xmin), xmax)
+            y = min(max(rnd.gauss(cy, 1500.0), ymin), ymax)
+            # mise en service / arrêt, puis lacunes de déclaration
+            first = y0 if rnd.random() < 0.6 else rnd.randint(y0, y1)
+            last = y1 if rnd.random() < 0.8 else rnd.randint(first, y1)
+            years = [yr for yr in range(first, last + 1) if rnd.random() >= 0.12] or [first]
+            # doublons ouvrage x année : deux points de prélèvement déclarés séparément
+            dup_years = {yr for yr in years if rnd.random() < 0.03}
+            moved = rnd.randint(first, last) if rnd.random() < 0.03 else None
+            ouvrages.append({
+                'code': f"OPR{i + 1:08d}",
+                'x': x,
+                'y': y,
+                'moved': moved,
+                'base': min(rnd.lognormvariate(math.log(15000.0), 1.4), 5e7),
+                'trend': rnd.gauss(0.0, 0.04),
+                'years': years,
+                'dup_years': dup_years,
+                'name': f"{rnd.choice(_KINDS)} {rnd.choice(_PLACES)} {rnd.randint(1, 30)}",
+                'holder': f"{rnd.choice(_HOLDERS)} {rnd.choice(_TOWNS)}",
+                'milieu': rnd.choices(['ESO', 'ESU', None], weights=[60, 35, 5])[0],
+            })
+            total += len(years) + len(dup_years)
+        self._ouvrages = ouvrages
+        return ouvrages
+
+    def _year_value(self, year, rnd):
+        if not self.text_years:
+            return year
+        u = rnd.random()
+        if u < 0.8:
+            return str(year)
+        return f" {year}" if u < 0.9 else f"{year}.0"
+
+    # ---------- prélèvements ----------
+    def prelevements(self):
+        """Lignes de prélèvements (exactement n_rows) : code, année, assiette, libellé, contribuable, milieu."""
+        n = 0
+        for o in self.ouvrages():
+            rnd = self._rnd('prelev', o['code'])
+            first = o['years'][0]
+            for year in o['years']:
+                value = o['base'] * (1.0 + o['trend']) ** (year - first) * rnd.lognormvariate(0.0, 0.2)
+                u = rnd.random()
+                if u < 0.005:
+                    value *= 10.0     # unité mal saisie
+                elif u < 0.010:
+                    value /= 1000.0   # saisie en milliers de m3
+                elif u < 0.015:
+                    value = 0.0
+                shares = [1.0]
+                if year in o['dup_years']:
+                    s = rnd.uniform(0.2, 0.8)
+                    shares = [s, 1.0 - s]
+                name = o['name'].upper() if rnd.random() < 0.03 else o['name']
+                holder = o['holder'] if rnd.random() >= 0.05 else f"{rnd.choice(_HOLDERS)} {rnd.choice(_TOWNS)}"
+                if rnd.random() < 0.005:
+                    geom = None
+                elif o['moved'] is not None and year >= o['moved']:
+                    geom = (o['x'] + 50.0, o['y'] - 30.0)
+                else:
+                    geom = (o['x'], o['y'])
+                for share in shares:
+                    if n >= self.n_rows:
+                        return
+                    n += 1
+                    yield ([o['code'], self._year_value(year, rnd), french_volume(value * share, rnd),
+                            name, holder, o['milieu']], geom)
+
+    # ---------- autorisations DDTM ----------
+    def autorisations(self):
+        """Arrêtés DDTM : code ouvrage, volume autorisé, identifiant DDTM (doublons et orphelins compris)."""
+        rnd = self._rnd('autor')
+        y0, y1 = self.years
+        ouvrages = self.ouvrages()
+        n_arretes = 0
+        for o in ouvrages:
+            count = rnd.choices([0, 1, 2, 3], weights=[20, 64, 12, 4])[0]
+            for _ in range(count):
+                n_arretes += 1
+                if rnd.random() < 0.15:
+                    vol = o['base'] * rnd.uniform(0.4, 0.9)   # ouvrage en dépassement
+                else:
+                    vol = o['base'] * rnd.uniform(0.9, 2.5)
+                vol = round(vol, -2)
+                u = rnd.random()
+                raw = '' if u < 0.03 else ('0' if u < 0.04 else french_volume(vol, rnd))
+                code = o['code'] if rnd.random() >= 0.05 else f" {o['code']} "
+                row = ([code, raw, f"DDTM34-{rnd.randint(y0, y1)}-{n_arretes:06d}"], None)
+                yield row
+                if rnd.random() < 0.02:
+                    yield row   # ligne exportée deux fois
+        # arrêtés d'ouvrages sans prélèvement déclaré
+        for k in range(max(1, len(ouvrages) // 20)):
+            yield ([f"OPR9{k + 1:07d}", french_volume(round(rnd.uniform(1000, 200000), -2), rnd),
+                    f"DDTM34-{rnd.randint(y0, y1)}-9{k:05d}"], None)
+
+    # ---------- zonages ----------
+    def _grid(self, cells, salt, jitter=0.35):
+        """Sommets (cells + 1)² d'une grille irrégulière couvrant l'emprise (bords rectilignes)."""
+        rnd = self._rnd('grid', salt, cells)
+        xmin, ymin, xmax, ymax = self.extent
+        dx = (xmax - xmin) / cells
+        dy = (ymax - ymin) / cells
+        grid = []
+        for i in range(cells + 1):
+            column = []
+            for j in range(cells + 1):
+                x = xmin + i * dx
+                y = ymin + j * dy
+                if 0 < i < cells:
+                    x += rnd.uniform(-jitter, jitter) * dx
+                if 0 < j < cells:
+                    y += rnd.uniform(-jitter, jitter) * dy
+                column.append((x, y))
+            grid.append(column)
+        return grid
+
+    @staticmethod
+    def _block_wkt(grid, i0, j0, i1, j1):
+        """Polygone formé des mailles [i0, i1[ x [j0, j1[ : contour suivant les sommets de la grille."""
+        ring = [grid[i][j0] for i in range(i0, i1 + 1)]
+        ring += [grid[i1][j] for j in range(j0 + 1, j1 + 1)]
+        ring += [grid[i][j1] for i in range(i1 - 1, i0 - 1, -1)]
+        ring += [grid[i0][j] for j in range(j1 - 1, j0 - 1, -1)]
+        return 'POLYGON((' + ', '.join(f"{x:.1f} {y:.1f}" for x, y in ring) + '))'
+
+    def zoning(self):
+        """Zonage de granularity² zones : code_zone Z0001, Z0002, ..."""
+        g = self.granularity
+        grid = self._grid(g, 'zonage')
+        return [([f"Z{i * g + j + 1:04d}"], self._block_wkt(grid, i, j, i + 1, j + 1))
+                for i in range(g) for j in range(g)]
+
+    def parent_zoning(self):
+        """Zonage englobant : blocs de parent_step x parent_step zones (bords tronqués), code_parent P001, ..."""
+        g = self.granularity
+        step = self.parent_step
+        grid = self._grid(g, 'zonage')
+        rows = []
+        for i0 in range(0, g, step):
+            for j0 in range(0, g, step):
+                rows.append(([f"P{len(rows) + 1:03d}"], self._block_wkt(grid, i0, j0, min(i0 + step, g), min(j0 + step, g))))
+        return rows
+
+    def study_zone(self):
+        """Zone d'étude : bloc central d'une grille irrégulière 8 x 8 (un peu plus du tiers de l'emprise)."""
+        grid = self._grid(8, 'zone_etude')
+        return [(['Zone d\'étude'], self._block_wkt(grid, 1, 2, 6, 7))]
+
+    def summary(self):
+        """Caractéristiques du jeu (pour le rapport de benchmark)."""
+        ouvrages = self.ouvrages()
+        return {
+            'n_rows': self.n_rows,
+            'n_ouvrages': len(ouvrages),
+            'years': list(self.years),
+            'n_zones': self.granularity ** 2,
+            'n_parent_zones': len(range(0, self.granularity, self.parent_step)) ** 2,
+            'seed': self.seed,
+            'text_years': self.text_years,
+        }
@@ -16,12 +16,18 @@ Plus d'information dans le README ou sur le Repo Github https://github.com/Aurel
 """
 
 import os
+import sys
 import shutil
+import hashlib
+import importlib.util
 import traceback
+from collections import OrderedDict
 from qgis.PyQt import QtWidgets, QtCore, QtGui
 from qgis.core import (
     QgsApplication, QgsProject, QgsVectorLayer, QgsFeatureRequest,
-    QgsWkbTypes, QgsFeature, QgsFields, QgsGeometry
+    QgsWkbTypes, QgsFeature, QgsFields, QgsGeometry,
+    QgsTask, QgsProcessingFeedback, QgsMessageLog, Qgis, QgsRectangle,
+    QgsProcessingAlgorithm, QgsProcessingProvider, QgsVectorLayerFeatureSource
 )
 from qgis import processing
 from qgis.utils import iface
@@ -32,6 +38,19 @@ PLUGIN_DIR = os.path.abspath(os.path.dirname(__file__))
 BASE_FOLDER = os.path.join(PLUGIN_DIR, 'Couches')
 NETWORK_SCRIPTS_FOLDER = os.path.join(PLUGIN_DIR, 'scripts')
 QML_COUCHES_FOLDER = os.path.join(BASE_FOLDER, 'QML_Couches')
+# moteur de calcul partagé par les scripts (scripts/vocal_core), copié avec eux
+CORE_PACKAGE = 'vocal_core'
+
+# rend vocal_core importable depuis le plugin
+if NETWORK_SCRIPTS_FOLDER not in sys.path:
+    sys.path.insert(0, NETWORK_SCRIPTS_FOLDER)
+from vocal_core import (
+    PreparedZones,
+    precompute_assignments,
+    load_zone_catalog,
+    store_zone_catalog,
+    ZONAGE_SOURCE_PROPERTY,
+)
 
 
 # DEBUG (optionnel) : affiche dans la console où l'on lira les couches/scripts
@@ -51,24 +70,35 @@ GPKG_MAP = {
 
 DEPT_FIELD = 'nom_dept'
 BV_FIELD = 'lib_ssbv'
+# propriété des couches zone d'étude chargées par le plugin (GeoPackage, champ, valeur) : rechargement sans copie
+ZONE_KEY_PROPERTY = 'vocal/zone_key'
 
 # ---------------- Added/Updated Algorithms ----------------
+# fournisseur Processing du plugin : algorithmes 'vocal:<nom>' servis depuis NETWORK_SCRIPTS_FOLDER
+PROVIDER_ID = 'vocal'
+
+# 'class_name' : algorithme servi par le fournisseur du plugin (VocalProvider), sans copie du script ;
+# sinon script copié dans le dossier Processing/scripts de l'utilisateur (fournisseur 'script:')
 ALGO_INFOS = {
     'Evolution des volumes prélevés par ouvrage': {
-        'alg_id': 'script:compute_slopes_ouvrage_only',
-        'script_name': 'compute_slopes_qgis_ouvrages.py'
+        'alg_id': f'{PROVIDER_ID}:compute_slopes_ouvrage_only',
+        'script_name': 'compute_slopes_qgis_ouvrages.py',
+        'class_name': 'ComputeSlopesByOuvrage'
     },
     'Evolution des volumes prélevés agrégés par zone': {
-        'alg_id': 'script:compute_slopes_zones',
-        'script_name': 'compute_slopes_qgis_zonages.py'
+        'alg_id': f'{PROVIDER_ID}:compute_slopes_zones',
+        'script_name': 'compute_slopes_qgis_zonages.py',
+        'class_name': 'ZonesSlopesAlgorithm'
     },
     'Ratio VolPrelev/VolAutorise par ouvrage': {
-        'alg_id': 'script:compare_prelevements_autorises',
-        'script_name': 'compute_ratio_VPVA_ouvrages.py'
+        'alg_id': f'{PROVIDER_ID}:compare_prelevements_autorises',
+        'script_name': 'compute_ratio_VPVA_ouvrages.py',
+        'class_name': 'ComparePrelevementsAutorises'
     },
     'Ratio VolPrelev/VolAutorise par zonage': {
-        'alg_id': 'script:zones_compare_prelev_autorise',
-        'script_name': 'compute_ratio_VPVA_zonages.py'
+        'alg_id': f'{PROVIDER_ID}:zones_compare_prelev_autorise',
+        'script_name': 'compute_ratio_VPVA_zonages.py',
+        'class_name': 'ZonesComparePrelevAutorise'
     },
     
     "État connaissance - ouvrages Agence": {
@@ -103,18 +133,64 @@ def try_load_gpkg_layer(gpkg_path):
         return layer
     return None
 
-def list_zone_values(layer, fieldname):
-    vals = set()
-    if layer is None or fieldname is None:
-        return []
-    if layer.fields().indexFromName(fieldname) < 0:
-        return []
-    for f in layer.getFeatures():
-        v = f[fieldname]
-        if v is None:
-            continue
-        vals.add(str(v))
-    return sorted(vals)
+def scale_label_field(scale_label, layer):
+    """Champ libellé des zones d'une échelle de GPKG_MAP (champ connu, 'name', sinon premier champ texte)."""
+    if scale_label == 'Départements':
+        return DEPT_FIELD
+    if scale_label == 'Bassins versants':
+        return BV_FIELD
+    if layer.fields().indexFromName('name') >= 0:
+        return 'name'
+    for f in layer.fields():
+        if f.typeName().lower().startswith('string'):
+            return f.name()
+    return layer.fields()[0].name()
+
+def zone_catalog(scale_label):
+    """
+    Catalogue des zones d'une échelle de GPKG_MAP, ou None si la couche est introuvable :
+    {'uri', 'name' (couche du GeoPackage), 'field' (champ libellé), 'values': {valeur: {'bbox', 'fids'}}}.
+    Construit en un parcours de la couche puis repris du cache (vocal_core) tant que le GeoPackage
+    n'a pas changé : ni recherche du nom de couche ni parcours de table aux changements d'échelle.
+    """
+    gpkg = gpkg_path_for(scale_label)
+    if not gpkg or not os.path.exists(gpkg):
+        return None
+    catalog = load_zone_catalog(gpkg)
+    if catalog is not None:
+        return catalog
+    layer = try_load_gpkg_layer(gpkg)
+    if layer is None:
+        return None
+    field = scale_label_field(scale_label, layer)
+    values = {}
+    if layer.fields().indexFromName(field) >= 0:
+        for f in layer.getFeatures():
+            v = f[field]
+            if v is None:
+                continue
+            entry = values.setdefault(str(v), {'bbox': None, 'fids': []})
+            entry['fids'].append(f.id())
+            geom = f.geometry()
+            if geom is None or geom.isEmpty():
+                continue
+            bb = geom.boundingBox()
+            box = [bb.xMinimum(), bb.yMinimum(), bb.xMaximum(), bb.yMaximum()]
+            if entry['bbox'] is None:
+                entry['bbox'] = box
+            else:
+                entry['bbox'] = [min(entry['bbox'][0], box[0]), min(entry['bbox'][1], box[1]),
+                                 max(entry['bbox'][2], box[2]), max(entry['bbox'][3], box[3])]
+    catalog = {'uri': layer.source(), 'name': layer.name(), 'field': field, 'values': values}
+    store_zone_catalog(gpkg, catalog)
+    return catalog
+
+def open_catalog_layer(catalog):
+    """Couche (non ajoutée au projet) décrite par un catalogue de zones, ou None."""
+    if not catalog:
+        return None
+    layer = QgsVectorLayer(catalog['uri'], catalog['name'], 'ogr')
+    return layer if layer.isValid() else None
 
 def load_layer_to_project(layer, add_if_not=True):
     if layer is None:
@@ -164,8 +240,11 @@ def _geom_type_string_from_wkb(wkb):
         pass
     return 'Unknown'
 
-def create_memory_layer_from_features(source_layer, features, name_suffix="_mem"):
-    """Crée une couche mémoire à partir d'une liste de features (copie champs/crs/geom)."""
+def create_memory_layer_from_features(source_layer, features, name_suffix="_mem", add_to_project=True):
+    """
+    Crée une couche mémoire à partir d'une liste de features (copie champs/crs/geom).
+    add_to_project=False : couche non ajoutée au projet (création dans une tâche de fond).
+    """
     if source_layer is None or not features:
         return None
 
@@ -188,6 +267,9 @@ def create_memory_layer_from_features(source_layer, features, name_suffix="_mem"
     layer_name = f"{source_layer.name()}{name_suffix}"
     uri = f"{geom_type}?crs={crs_auth}"
     mem = QgsVectorLayer(uri, layer_name, "memory")
+    # extrait d'un zonage fichier : les affectations ouvrage -> zones du fichier complet restent valables
+    if source_layer.providerType() == 'ogr' and not source_layer.subsetString():
+        mem.setCustomProperty(ZONAGE_SOURCE_PROPERTY, source_layer.source())
     dp = mem.dataProvider()
 
     try:
@@ -222,27 +304,94 @@ def create_memory_layer_from_features(source_layer, features, name_suffix="_mem"
     try:
         dp.addFeatures(feats_to_add)
         mem.updateExtents()
-        QgsProject.instance().addMapLayer(mem)
+        dp.createSpatialIndex()
+        if add_to_project:
+            QgsProject.instance().addMapLayer(mem)
         return mem
     except Exception:
         return None
 
+def zone_key(catalog, value):
+    """Identifiant (couche GeoPackage, champ, valeur) d'une zone d'étude, porté par la couche chargée."""
+    return f"{catalog['uri']}|{catalog['field']}={value}"
+
+def find_zone_layer(key):
+    """Couche du projet déjà chargée pour la zone `key` (vue filtrée ou copie mémoire), ou None."""
+    for lyr in QgsProject.instance().mapLayers().values():
+        try:
+            if lyr.customProperty(ZONE_KEY_PROPERTY) == key:
+                return lyr
+        except AttributeError:
+            continue
+    return None
+
+def create_zone_view(catalog, value):
+    """
+    Zone d'étude sans copie : couche du GeoPackage filtrée (subset string) sur la valeur choisie.
+    Les entités restent lues par le fournisseur OGR, avec l'index spatial du GeoPackage.
+    Retourne None (couche non ajoutée au projet) si la couche ou le filtre est refusé.
+    """
+    layer = open_catalog_layer(catalog)
+    if layer is None:
+        return None
+    field = catalog['field']
+    idx = layer.fields().indexFromName(field)
+    if idx < 0:
+        return None
+    if layer.fields().field(idx).isNumeric():
+        literal = value
+    else:
+        literal = "'" + value.replace("'", "''") + "'"
+    if not layer.setSubsetString(f'"{field}" = {literal}'):
+        return None
+    layer.setName(f"{catalog['name']}_INTER_{value}")
+    # même fichier que le zonage complet : les affectations ouvrage -> zones en cache restent valables
+    layer.setCustomProperty(ZONAGE_SOURCE_PROPERTY, catalog['uri'])
+    layer.setCustomProperty(ZONE_KEY_PROPERTY, zone_key(catalog, value))
+    return layer
+
+def _copy_if_changed(src, dst):
+    """Copie src -> dst si absent ou de taille différente. Retourne True si copié."""
+    if not os.path.exists(dst) or os.path.getsize(dst) != os.path.getsize(src):
+        shutil.copy2(src, dst)
+        return True
+    return False
+
 def ensure_scripts_in_user_folder(feedback=None):
-    """Copy network scripts into the user's processing scripts folder (if missing)."""
+    """
+    Copy network scripts not served by the plugin provider (and the shared vocal_core package)
+    into the user's processing scripts folder (if missing).
+    """
     out = []
+    if all(info.get('class_name') for info in ALGO_INFOS.values()):
+        return out
     try:
         user_proc_scripts = os.path.join(QgsApplication.qgisSettingsDirPath(), 'processing', 'scripts')
         os.makedirs(user_proc_scripts, exist_ok=True)
+        # moteur partagé : les scripts l'importent depuis leur propre dossier
+        core_src = os.path.join(NETWORK_SCRIPTS_FOLDER, CORE_PACKAGE)
+        core_dst = os.path.join(user_proc_scripts, CORE_PACKAGE)
+        if os.path.isdir(core_src):
+            try:
+                os.makedirs(core_dst, exist_ok=True)
+                copied = 0
+                for fname in os.listdir(core_src):
+                    if fname.endswith('.py'):
+                        copied += int(_copy_if_changed(os.path.join(core_src, fname), os.path.join(core_dst, fname)))
+                if feedback:
+                    feedback(f"[Orch] Moteur {CORE_PACKAGE} -> {core_dst} ({copied} fichier(s) copié(s))")
+            except Exception as e:
+                if feedback:
+                    feedback(f"[Orch] Erreur copie du moteur {core_src} : {e}")
         for info in ALGO_INFOS.values():
             sn = info.get('script_name')
-            if not sn:
+            if not sn or info.get('class_name'):
                 continue
             src = os.path.join(NETWORK_SCRIPTS_FOLDER, sn)
             dst = os.path.join(user_proc_scripts, sn)
             if os.path.exists(src):
                 try:
-                    if not os.path.exists(dst) or os.path.getsize(dst) != os.path.getsize(src):
-                        shutil.copy2(src, dst)
+                    if _copy_if_changed(src, dst):
                         if feedback:
                             feedback(f"[Orch] Copié script -> {dst}")
                     else:
@@ -260,6 +409,235 @@ def ensure_scripts_in_user_folder(feedback=None):
             feedback(f"[Orch] Erreur lors de la mise en place des scripts utilisateurs : {e}")
     return out
 
+# extractions déjà faites : (source du zonage, valeur de zone) -> (état du fichier, empreinte de la zone, entités)
+_CLIP_CACHE = OrderedDict()
+CLIP_CACHE_SIZE = 16
+
+def _source_state(layer):
+    """Date / taille du fichier d'une couche (None si ce n'est pas un fichier)."""
+    path = layer.source().split('|')[0]
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, layer.featureCount())
+
+def features_intersecting(src_layer, ref_geoms, task=None, zone_value=None, source=None, total=None):
+    """
+    Entités de src_layer qui intersectent la zone de référence (union de ref_geoms) ; None si la tâche est annulée.
+    Seule l'emprise de la zone est lue (setFilterRect) et chaque entité est testée une fois contre
+    l'union préparée (GEOS). Résultat gardé en mémoire par (source du zonage, zone_value) tant que
+    le fichier et la géométrie de la zone n'ont pas changé.
+    source : instantané des entités (QgsVectorLayerFeatureSource) lu à la place de src_layer,
+    total son nombre d'entités (progression).
+    """
+    geoms = [g for g in ref_geoms if g is not None and not g.isEmpty()]
+    if not geoms:
+        return []
+    union = QgsGeometry.unaryUnion(geoms) if len(geoms) > 1 else geoms[0]
+    digest = hashlib.sha1(bytes(union.asWkb())).hexdigest()
+    key = (src_layer.source(), src_layer.subsetString(), zone_value)
+    state = _source_state(src_layer)
+    hit = _CLIP_CACHE.get(key)
+    if hit is not None and state is not None and hit[0] == state and hit[1] == digest:
+        _CLIP_CACHE.move_to_end(key)
+        return list(hit[2])
+
+    zone = PreparedZones([(zone_value, union)])
+    request = QgsFeatureRequest().setFilterRect(union.boundingBox())
+    if total is None:
+        total = src_layer.featureCount()
+    total = total or 1
+    intersects = []
+    for n, f in enumerate((source or src_layer).getFeatures(request)):
+        if task is not None:
+            if task.isCanceled():
+                return None
+            if n % 50 == 0:
+                task.setProgress(100.0 * n / total)
+        try:
+            if zone.intersects_any(f.geometry()):
+                intersects.append(f)
+        except Exception:
+            continue
+    if state is not None:
+        _CLIP_CACHE[key] = (state, digest, intersects)
+        while len(_CLIP_CACHE) > CLIP_CACHE_SIZE:
+            _CLIP_CACHE.popitem(last=False)
+    return list(intersects)
+
+def _to_main_thread(layer):
+    """Rattache au thread principal une couche créée dans une tâche (avant tout usage par l'interface / le projet)."""
+    if layer is not None:
+        layer.moveToThread(QgsApplication.instance().thread())
+    return layer
+
+# ---------------- Background tasks ----------------
+# tâches en cours : la référence Python doit survivre au dialogue qui les a lancées
+_BACKGROUND_TASKS = []
+
+class ZoneLoadTask(QgsTask):
+    """
+    Tâche de fond de 'Charger zone' : ouverture du GeoPackage de l'échelle, sélection des entités
+    de la valeur choisie et, si demandé, copie en couche mémoire (non ajoutée au projet).
+    Le résultat est remis au dialogue par le signal `loaded` (thread principal).
+    """
+    loaded = QtCore.pyqtSignal(object)
+
+    def __init__(self, scale, value, make_memory):
+        super().__init__(f"VOCAL : chargement de la zone {value}", QgsTask.CanCancel)
+        self.scale = scale
+        self.value = value
+        self.make_memory = make_memory
+        self.gpkg = gpkg_path_for(scale)
+        # catalogue lu sur le thread principal (cache) : couche, champ et fid / emprise de la valeur
+        self.catalog = zone_catalog(scale)
+        entry = self.catalog['values'].get(value) if self.catalog else None
+        self.fids = entry['fids'] if entry else []
+        self.bbox = entry['bbox'] if entry else None
+        self.layer = None
+        self.features = []
+        self.mem_layer = None
+
+    def run(self):
+        layer = open_catalog_layer(self.catalog)
+        if layer is None:
+            return True
+        total = len(self.fids) or 1
+        try:
+            if self.fids:
+                for n, f in enumerate(layer.getFeatures(QgsFeatureRequest().setFilterFids(self.fids))):
+                    if self.isCanceled():
+                        return False
+                    if n % 50 == 0:
+                        self.setProgress(100.0 * n / total)
+                    self.features.append(f)
+        except Exception:
+            self.features = []
+        if self.make_memory and self.features:
+            mem = create_memory_layer_from_features(
+                layer, self.features, name_suffix=f"_INTER_{self.value or ''}", add_to_project=False)
+            if mem is not None:
+                mem.setCustomProperty(ZONE_KEY_PROPERTY, zone_key(self.catalog, self.value))
+            self.mem_layer = _to_main_thread(mem)
+        self.layer = _to_main_thread(layer)
+        return True
+
+    def finished(self, result):
+        if self in _BACKGROUND_TASKS:
+            _BACKGROUND_TASKS.remove(self)
+        if result:
+            self.loaded.emit(self)
+
+class ZonageClipTask(QgsTask):
+    """
+    Tâche de fond de 'Suivant' : ouverture du zonage optionnel et extraction (couche mémoire non ajoutée
+    au projet) des entités qui intersectent la zone d'étude. ref_geoms None : zonage gardé entier.
+    La source est rouverte dans la tâche (uri / fournisseur), ou `layer` est une copie privée ;
+    avec `source` (instantané d'une couche mémoire du projet), `layer` n'en est que le schéma vide
+    et les entités sont lues dans la tâche.
+    Le résultat est remis au dialogue par le signal `clipped` (thread principal).
+    """
+    clipped = QtCore.pyqtSignal(object)
+
+    def __init__(self, ref_geoms, zone_value, uri=None, provider='ogr', name='', gpkg=False, layer=None,
+                 source=None, total=None):
+        super().__init__(f"VOCAL : extraction du zonage {name}", QgsTask.CanCancel)
+        self.ref_geoms = ref_geoms
+        self.zone_value = zone_value
+        self.uri = uri
+        self.provider = provider
+        self.name = name
+        self.gpkg = gpkg
+        self.layer = layer
+        self.source = source
+        self.total = total
+        self.features = None
+        self.mem_layer = None
+        self._opened = layer is None
+        # renseignés par le dialogue : 'file' / 'server' / 'project' et couche du projet d'origine
+        self.origin = None
+        self.project_layer = None
+
+    def run(self):
+        if self._opened:
+            if self.gpkg:
+                self.layer = try_load_gpkg_layer(self.uri)
+            else:
+                self.layer = QgsVectorLayer(self.uri, self.name, self.provider)
+            if self.layer is None or not self.layer.isValid():
+                self.layer = None
+                return True
+        if self.ref_geoms is not None:
+            self.features = features_intersecting(self.layer, self.ref_geoms, self, zone_value=self.zone_value,
+                                                  source=self.source, total=self.total)
+            if self.features is None:
+                return False
+            if self.features:
+                self.mem_layer = _to_main_thread(create_memory_layer_from_features(
+                    self.layer, self.features, name_suffix=f"_INTER_{self.zone_value or ''}", add_to_project=False))
+        if self._opened:
+            self.layer = _to_main_thread(self.layer)
+        return True
+
+    def finished(self, result):
+        if self in _BACKGROUND_TASKS:
+            _BACKGROUND_TASKS.remove(self)
+        if result:
+            self.clipped.emit(self)
+
+class ZoningPrecomputeTask(QgsTask):
+    """
+    Tâche de fond : affecte tous les ouvrages d'une couche de prélèvements aux zones de chaque échelle
+    de GPKG_MAP (une lecture des ouvrages) et remplit le cache d'affectation de vocal_core.
+    Les algorithmes par zonage (et les changements d'échelle) n'ont ensuite plus de jointure spatiale.
+    Les couches sont ouvertes dans la tâche (pas de couche du projet partagée entre threads).
+    """
+
+    def __init__(self, points_uri, points_provider, key_field, scales=None):
+        super().__init__('VOCAL : pré-calcul des affectations ouvrages -> zones', QgsTask.CanCancel)
+        self.points_uri = points_uri
+        self.points_provider = points_provider
+        self.key_field = key_field
+        self.scales = list(scales or GPKG_MAP.keys())
+        self.feedback = QgsProcessingFeedback()
+        self.summary = None
+        self.error = None
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
+
+    def run(self):
+        try:
+            points = QgsVectorLayer(self.points_uri, 'ouvrages', self.points_provider)
+            if not points.isValid():
+                self.error = f"Couche ouvrages illisible : {self.points_uri}"
+                return False
+            zonings = []
+            for scale in self.scales:
+                layer = try_load_gpkg_layer(gpkg_path_for(scale))
+                if layer is None:
+                    QgsMessageLog.logMessage(f"[Orch] Échelle {scale} ignorée (couche introuvable)", 'VOCAL', Qgis.Warning)
+                    continue
+                zonings.append((scale, layer, scale_label_field(scale, layer)))
+            self.feedback.progressChanged.connect(self.setProgress)
+            self.summary = precompute_assignments(points, self.key_field, zonings, self.feedback)
+            return self.summary is not None
+        except Exception as e:
+            self.error = f"{e}\n{traceback.format_exc()}"
+            return False
+
+    def finished(self, result):
+        if self in _BACKGROUND_TASKS:
+            _BACKGROUND_TASKS.remove(self)
+        if result:
+            text = ', '.join(f"{name} : {n} ouvrages ({n - cached} testés)" for name, n, cached in self.summary)
+            iface.messageBar().pushMessage('VOCAL', f"Affectations pré-calculées — {text}", level=Qgis.Info)
+        elif self.error:
+            QgsMessageLog.logMessage(f"[Orch] Pré-calcul des affectations : {self.error}", 'VOCAL', Qgis.Critical)
+            iface.messageBar().pushMessage('VOCAL', "Échec du pré-calcul des affectations (voir le journal).", level=Qgis.Warning)
+
 # ---------------- Main UI ----------------
 class PrelevOrchestratorDialog(QtWidgets.QDialog):
     def __init__(self, parent=None):
@@ -285,6 +663,15 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         self.open_algo_btn = QtWidgets.QPushButton("Ouvrir l'outil Processing")
         self.open_algo_btn.clicked.connect(self.on_open_algo)
         self.open_algo_btn.setEnabled(False)
+        # avancement des tâches de fond (chargement de zone, extraction du zonage)
+        self.task_progress = QtWidgets.QProgressBar()
+        self.task_progress.setRange(0, 100)
+        self.task_progress.setVisible(False)
+        self.cancel_task_btn = QtWidgets.QPushButton('Annuler')
+        self.cancel_task_btn.setVisible(False)
+        self.cancel_task_btn.clicked.connect(self.on_cancel_task)
+        btn_box.addWidget(self.task_progress)
+        btn_box.addWidget(self.cancel_task_btn)
         btn_box.addStretch()
         btn_box.addWidget(self.prev_btn)
         btn_box.addWidget(self.next_btn)
@@ -303,6 +690,40 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         self.zone_mem_layer = None       # couche mémoire limitée
         self.zone_value = None
         self.optional_zonage_layer = None
+        self.current_task = None
+
+    # ---------- tâches de fond ----------
+    def _start_task(self, task):
+        """Lance une tâche de fond ; l'interface reste utilisable, navigation bloquée jusqu'à la fin."""
+        self.current_task = task
+        _BACKGROUND_TASKS.append(task)
+        self.load_zone_btn.setEnabled(False)
+        self.next_btn.setEnabled(False)
+        self.task_progress.setValue(0)
+        self.task_progress.setFormat(task.description() + ' %p%')
+        self.task_progress.setVisible(True)
+        self.cancel_task_btn.setVisible(True)
+        task.progressChanged.connect(lambda v: self.task_progress.setValue(int(v)))
+        task.taskCompleted.connect(self._end_task)
+        task.taskTerminated.connect(self._end_task)
+        QgsApplication.taskManager().addTask(task)
+
+    def _end_task(self):
+        self.current_task = None
+        self.task_progress.setVisible(False)
+        self.cancel_task_btn.setVisible(False)
+        self.load_zone_btn.setEnabled(True)
+        if self.stack.currentIndex() == 0:
+            self.next_btn.setEnabled(True)
+
+    def on_cancel_task(self):
+        if self.current_task is not None:
+            self.current_task.cancel()
+
+    def reject(self):
+        # fermeture du dialogue : la tâche en cours n'a plus de destinataire
+        self.on_cancel_task()
+        super().reject()
 
     def _build_page1(self):
         layout = QtWidgets.QVBoxLayout()
@@ -333,6 +754,10 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         # checkbox memory layer
         self.create_memory_checkbox = QtWidgets.QCheckBox("Créer couche mémoire limitée à la zone d'étude (recommandé)")
         self.create_memory_checkbox.setChecked(True)
+        # zone limitée sans copie : vue filtrée de la couche GeoPackage
+        self.zone_view_checkbox = QtWidgets.QCheckBox("Zone d'étude en vue filtrée du GeoPackage (sans copie des géométries)")
+        self.zone_view_checkbox.setChecked(True)
+        self.create_memory_checkbox.toggled.connect(self.zone_view_checkbox.setEnabled)
 
         # checkbox to reveal zonage options (NEW)
         self.show_zonage_checkbox = QtWidgets.QCheckBox("Voulez-vous charger un sous-zonage ?")
@@ -361,6 +786,22 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         grp_optional.setVisible(False)
         self.show_zonage_checkbox.toggled.connect(lambda checked: grp_optional.setVisible(checked))
 
+        # pré-calcul des affectations ouvrages -> zones (toutes échelles, tâche de fond)
+        grp_pre = QtWidgets.QGroupBox('Optionnel : pré-calcul des affectations ouvrages -> zones (toutes échelles)')
+        gp = QtWidgets.QGridLayout()
+        gp.addWidget(QtWidgets.QLabel('Couche prélèvements (projet)'), 0, 0)
+        self.precompute_layer_combo = QtWidgets.QComboBox()
+        gp.addWidget(self.precompute_layer_combo, 0, 1)
+        gp.addWidget(QtWidgets.QLabel('Champ identifiant ouvrage'), 1, 0)
+        self.precompute_field_combo = QtWidgets.QComboBox()
+        gp.addWidget(self.precompute_field_combo, 1, 1)
+        self.precompute_btn = QtWidgets.QPushButton('Lancer en arrière-plan')
+        self.precompute_btn.clicked.connect(self.on_precompute)
+        gp.addWidget(self.precompute_btn, 2, 0, 1, 2)
+        grp_pre.setLayout(gp)
+        self.precompute_layer_combo.currentIndexChanged.connect(self._populate_precompute_fields)
+        self._populate_precompute_layers()
+
         # QML options
         qml_box = QtWidgets.QGroupBox('QML (appliquer aux couches chargées)')
         qh = QtWidgets.QFormLayout()
@@ -379,8 +820,10 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         layout.addWidget(grp_prog)
         layout.addWidget(grp_zone)
         layout.addWidget(self.create_memory_checkbox)
+        layout.addWidget(self.zone_view_checkbox)
         layout.addWidget(self.show_zonage_checkbox)
         layout.addWidget(grp_optional)
+        layout.addWidget(grp_pre)
         layout.addWidget(qml_box)
         layout.addWidget(info)
         self.page1.setLayout(layout)
@@ -404,29 +847,40 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
             if isinstance(lyr, QgsVectorLayer):
                 self.zonage_combo.addItem(f"[proj] {lyr.name()}", lyr.id())
 
+    def _populate_precompute_layers(self):
+        self.precompute_layer_combo.clear()
+        for lyr in QgsProject.instance().mapLayers().values():
+            # couche fichier / base uniquement : la tâche rouvre la source dans son thread
+            if isinstance(lyr, QgsVectorLayer) and lyr.geometryType() == QgsWkbTypes.PointGeometry and lyr.providerType() != 'memory':
+                self.precompute_layer_combo.addItem(lyr.name(), lyr.id())
+        self._populate_precompute_fields()
+
+    def _populate_precompute_fields(self, *args):
+        self.precompute_field_combo.clear()
+        lyr = QgsProject.instance().mapLayer(self.precompute_layer_combo.currentData() or '')
+        if lyr is not None:
+            self.precompute_field_combo.addItems([f.name() for f in lyr.fields()])
+
+    def on_precompute(self):
+        lyr = QgsProject.instance().mapLayer(self.precompute_layer_combo.currentData() or '')
+        field = self.precompute_field_combo.currentText()
+        if lyr is None or not field:
+            QtWidgets.QMessageBox.warning(self, 'Erreur', 'Choisis une couche de prélèvements (fichier) et son champ identifiant ouvrage.')
+            return
+        task = ZoningPrecomputeTask(lyr.source(), lyr.providerType(), field)
+        _BACKGROUND_TASKS.append(task)
+        QgsApplication.taskManager().addTask(task)
+        QtWidgets.QMessageBox.information(self, 'Pré-calcul lancé',
+            "Affectation des ouvrages aux zones de toutes les échelles en arrière-plan.\n"
+            "Suivi dans la barre des tâches de QGIS ; les algorithmes par zonage réutiliseront le résultat.")
+
     def on_scale_changed(self, text):
-        gpkg = gpkg_path_for(text)
-        layer = try_load_gpkg_layer(gpkg)
+        catalog = zone_catalog(text)
         self.zone_value_combo.clear()
-        if layer is None:
+        if catalog is None:
             self.zone_value_combo.addItem('-- couche introuvable --')
             return
-        if text == 'Départements':
-            field = DEPT_FIELD
-        elif text == 'Bassins versants':
-            field = BV_FIELD
-        else:
-            if layer.fields().indexFromName('name') >= 0:
-                field = 'name'
-            else:
-                field = None
-                for f in layer.fields():
-                    if f.typeName().lower().startswith('string'):
-                        field = f.name()
-                        break
-                if field is None:
-                    field = layer.fields()[0].name()
-        vals = list_zone_values(layer, field)
+        vals = sorted(catalog['values'])
         if vals:
             self.zone_value_combo.addItems(vals)
         else:
@@ -439,48 +893,70 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         self.zonage_path_edit.setText(fp)
 
     def on_load_zone(self):
+        if self.current_task is not None:
+            return
         scale = self.scale_combo.currentText()
         val = self.zone_value_combo.currentText()
-        gpkg = gpkg_path_for(scale)
-        layer = try_load_gpkg_layer(gpkg)
+        make_memory = self.create_memory_checkbox.isChecked()
+        catalog = zone_catalog(scale)
+        if make_memory and catalog is not None and val in catalog['values']:
+            # zone déjà chargée (vue ou copie) : réutilisée ; sinon vue filtrée si demandée
+            zlayer = find_zone_layer(zone_key(catalog, val))
+            if zlayer is None and self.zone_view_checkbox.isChecked():
+                zlayer = create_zone_view(catalog, val)
+                if zlayer is not None:
+                    QgsProject.instance().addMapLayer(zlayer)
+                    self._apply_zone_qml(zlayer, gpkg_path_for(scale))
+            if zlayer is not None:
+                self.zone_layer = None
+                self.zone_mem_layer = zlayer
+                self.zone_value = val
+                bbox = catalog['values'][val]['bbox']
+                if bbox:
+                    canvas = iface.mapCanvas()
+                    canvas.setExtent(QgsRectangle(*bbox))
+                    canvas.refresh()
+                else:
+                    zoom_to_layer(zlayer)
+                QtWidgets.QMessageBox.information(self, 'Zone chargée', f"Zone '{val}' chargée et affichée.")
+                return
+        task = ZoneLoadTask(scale, val, make_memory)
+        task.loaded.connect(self._on_zone_loaded)
+        self._start_task(task)
+
+    def _apply_zone_qml(self, layer, gpkg):
+        """Style QML_<GeoPackage>.qml appliqué à la couche zone d'étude, si demandé et disponible."""
+        if not self.qml_zone_checkbox.isChecked():
+            return
+        qmlname = f"QML_{os.path.splitext(os.path.basename(gpkg or ''))[0]}"
+        qmlpath = os.path.join(QML_COUCHES_FOLDER, qmlname + '.qml')
+        if os.path.exists(qmlpath):
+            try:
+                layer.loadNamedStyle(qmlpath)
+                layer.triggerRepaint()
+            except Exception:
+                pass
+
+    def _on_zone_loaded(self, task):
+        """Suite de on_load_zone sur le thread principal : projet, style, zoom."""
+        layer = task.layer
+        gpkg = task.gpkg
+        val = task.value
+        feats = task.features
         if layer is None:
             QtWidgets.QMessageBox.warning(self, 'Erreur', f'Impossible de charger {gpkg}.')
             return
 
-        if scale == 'Départements':
-            field = DEPT_FIELD
-        elif scale == 'Bassins versants':
-            field = BV_FIELD
-        else:
-            if layer.fields().indexFromName('name') >= 0:
-                field = 'name'
-            else:
-                field = layer.fields()[0].name()
-
-        expr = f'"{field}" = \'{val}\''
-        try:
-            it = layer.getFeatures(QgsFeatureRequest().setFilterExpression(expr))
-            feats = [f for f in it]
-        except Exception:
-            feats = []
-
         self.zone_layer = layer
         self.zone_value = val
 
-        if self.create_memory_checkbox.isChecked():
+        if task.make_memory:
             if feats:
-                mem = create_memory_layer_from_features(layer, feats, name_suffix=f"_INTER_{self.zone_value or ''}")
+                mem = task.mem_layer
                 if mem is not None:
+                    QgsProject.instance().addMapLayer(mem)
                     self.zone_mem_layer = mem
-                    if self.qml_zone_checkbox.isChecked():
-                        qmlname = f"QML_{os.path.splitext(os.path.basename(gpkg or ''))[0]}"
-                        qmlpath = os.path.join(QML_COUCHES_FOLDER, qmlname + '.qml')
-                        if os.path.exists(qmlpath):
-                            try:
-                                mem.loadNamedStyle(qmlpath)
-                                mem.triggerRepaint()
-                            except Exception:
-                                pass
+                    self._apply_zone_qml(mem, gpkg)
                     zoom_to_layer(mem)
                 else:
                     self.zone_mem_layer = None
@@ -507,7 +983,11 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
                     layer.removeSelection()
                     layer.selectByIds(ids)
                     canvas = iface.mapCanvas()
-                    canvas.setExtent(layer.boundingBoxOfSelected())
+                    # emprise connue par le catalogue : pas de recalcul sur la sélection
+                    if task.bbox:
+                        canvas.setExtent(QgsRectangle(*task.bbox))
+                    else:
+                        canvas.setExtent(layer.boundingBoxOfSelected())
                     canvas.refresh()
                 except Exception:
                     zoom_to_layer(layer)
@@ -529,6 +1009,8 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         self.open_algo_btn.setEnabled(False)
 
     def on_next(self):
+        if self.current_task is not None:
+            return
         prog = self.prog_combo.currentText()
         if not prog:
             QtWidgets.QMessageBox.warning(self, 'Erreur', 'Choisis un programme.')
@@ -540,136 +1022,82 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         # prepare optional zonage chosen in combo or via browse
         self.optional_zonage_layer = None
         chosen_data = self.zonage_combo.currentData()
-        chosen_text = self.zonage_combo.currentText()
         browse_fp = self.zonage_path_edit.text().strip()
 
         ref_layer = self.zone_mem_layer or self.zone_layer
 
         # If user didn't check the show zonage box, ignore zonage inputs as truly optional
         if not self.show_zonage_checkbox.isChecked():
+            self._finish_next(prog)
+            return
+
+        # géométries de la zone d'étude lues ici (couche du projet), extraction dans une tâche de fond
+        ref_geoms = [f.geometry() for f in ref_layer.getFeatures()] if ref_layer is not None else None
+        # Case 1: user provided a browse file -> use it
+        if browse_fp:
+            task = ZonageClipTask(ref_geoms, self.zone_value, uri=browse_fp, name=os.path.basename(browse_fp))
+            task.origin = 'file'
+        # Case 2: choose from combo (server gpkg path or project layer id)
+        elif chosen_data:
+            # if chosen_data is a path -> server gpkg
+            if isinstance(chosen_data, str) and os.path.exists(chosen_data):
+                task = ZonageClipTask(ref_geoms, self.zone_value, uri=chosen_data, name=os.path.basename(chosen_data), gpkg=True)
+                task.origin = 'server'
+            else:
+                # chosen_data is likely a project layer id
+                lyr = QgsProject.instance().mapLayer(chosen_data)
+                if not (lyr and isinstance(lyr, QgsVectorLayer)):
+                    self._finish_next(prog)
+                    return
+                if lyr.providerType() == 'memory':
+                    # instantané des entités lu dans la tâche (la couche du projet n'est pas lue hors du
+                    # thread principal) ; seul le schéma vide est copié ici
+                    task = ZonageClipTask(ref_geoms, self.zone_value, name=lyr.name(),
+                                          layer=lyr.materialize(QgsFeatureRequest().setFilterFids([])),
+                                          source=QgsVectorLayerFeatureSource(lyr), total=lyr.featureCount())
+                else:
+                    task = ZonageClipTask(ref_geoms, self.zone_value, uri=lyr.source(), provider=lyr.providerType(), name=lyr.name())
+                task.origin = 'project'
+                task.project_layer = lyr
+        else:
+            self._finish_next(prog)
+            return
+        task.clipped.connect(lambda t: self._on_zonage_clipped(t, prog))
+        self._start_task(task)
+
+    def _on_zonage_clipped(self, task, prog):
+        """Suite de on_next sur le thread principal : couche zonage retenue puis page suivante."""
+        origin = task.origin
+        if task.layer is None:
+            if origin == 'file':
+                QtWidgets.QMessageBox.warning(self, 'Erreur', f"Impossible de charger la couche zonage : {task.uri}")
+            elif origin == 'server':
+                QtWidgets.QMessageBox.information(self, 'Info', f"Aucune couche utilisable trouvée dans {task.uri}")
             self.optional_zonage_layer = None
         else:
-            # Case 1: user provided a browse file -> use it
-            if browse_fp:
-                zl_src = QgsVectorLayer(browse_fp, os.path.basename(browse_fp), 'ogr')
-                if not zl_src or not zl_src.isValid():
-                    QtWidgets.QMessageBox.warning(self, 'Erreur', f"Impossible de charger la couche zonage : {browse_fp}")
-                    self.optional_zonage_layer = None
+            # zonage entier (pas de zone de référence) : couche source, sinon extraction
+            whole = task.project_layer if origin == 'project' else task.layer
+            if task.features is None:
+                if origin != 'project':
+                    load_layer_to_project(whole, add_if_not=True)
+                self.optional_zonage_layer = whole
+            elif task.features:
+                if task.mem_layer is not None:
+                    QgsProject.instance().addMapLayer(task.mem_layer)
+                    self.optional_zonage_layer = task.mem_layer
                 else:
-                    # intersect with ref_layer if present
-                    if ref_layer is not None:
-                        ref_geoms = [f.geometry() for f in ref_layer.getFeatures()]
-                        intersects = []
-                        for f in zl_src.getFeatures():
-                            try:
-                                fg = f.geometry()
-                            except Exception:
-                                continue
-                            ok = False
-                            for rg in ref_geoms:
-                                try:
-                                    if rg is not None and not rg.isEmpty() and fg is not None and not fg.isEmpty():
-                                        if rg.intersects(fg):
-                                            ok = True
-                                            break
-                                except Exception:
-                                    continue
-                            if ok:
-                                intersects.append(f)
-                        if intersects:
-                            mem_zon = create_memory_layer_from_features(zl_src, intersects, name_suffix=f"_INTER_{self.zone_value or ''}")
-                            if mem_zon:
-                                self.optional_zonage_layer = mem_zon
-                            else:
-                                QgsProject.instance().addMapLayer(zl_src)
-                                self.optional_zonage_layer = zl_src
-                        else:
-                            QtWidgets.QMessageBox.information(self, 'Info', 'Aucune entité du zonage choisi n\'intersecte la zone d\'étude.')
-                            self.optional_zonage_layer = None
-                    else:
-                        QgsProject.instance().addMapLayer(zl_src)
-                        self.optional_zonage_layer = zl_src
-
-            # Case 2: choose from combo (server gpkg path or project layer id)
-            elif chosen_data:
-                # if chosen_data is a path -> server gpkg
-                if isinstance(chosen_data, str) and os.path.exists(chosen_data):
-                    # try load gpkg layer (first valid layer)
-                    zl_src = try_load_gpkg_layer(chosen_data)
-                    if zl_src is None:
-                        QtWidgets.QMessageBox.information(self, 'Info', f"Aucune couche utilisable trouvée dans {chosen_data}")
-                        self.optional_zonage_layer = None
-                    else:
-                        if ref_layer is not None:
-                            ref_geoms = [f.geometry() for f in ref_layer.getFeatures()]
-                            intersects = []
-                            for f in zl_src.getFeatures():
-                                try:
-                                    fg = f.geometry()
-                                except Exception:
-                                    continue
-                                ok = False
-                                for rg in ref_geoms:
-                                    try:
-                                        if rg is not None and not rg.isEmpty() and fg is not None and not fg.isEmpty():
-                                            if rg.intersects(fg):
-                                                ok = True
-                                                break
-                                    except Exception:
-                                        continue
-                                if ok:
-                                    intersects.append(f)
-                            if intersects:
-                                mem_zon = create_memory_layer_from_features(zl_src, intersects, name_suffix=f"_INTER_{self.zone_value or ''}")
-                                if mem_zon:
-                                    self.optional_zonage_layer = mem_zon
-                                else:
-                                    load_layer_to_project(zl_src, add_if_not=True)
-                                    self.optional_zonage_layer = zl_src
-                            else:
-                                QtWidgets.QMessageBox.information(self, 'Info', 'Aucune entité du zonage serveur n\'intersecte la zone d\'étude.')
-                                self.optional_zonage_layer = None
-                        else:
-                            load_layer_to_project(zl_src, add_if_not=True)
-                            self.optional_zonage_layer = zl_src
+                    if origin != 'project':
+                        load_layer_to_project(whole, add_if_not=True)
+                    self.optional_zonage_layer = whole
+            else:
+                if origin == 'server':
+                    QtWidgets.QMessageBox.information(self, 'Info', 'Aucune entité du zonage serveur n\'intersecte la zone d\'étude.')
                 else:
-                    # chosen_data is likely a project layer id
-                    lyr = QgsProject.instance().mapLayer(chosen_data)
-                    if lyr and isinstance(lyr, QgsVectorLayer):
-                        # intersect with ref_layer
-                        if ref_layer is not None:
-                            ref_geoms = [f.geometry() for f in ref_layer.getFeatures()]
-                            intersects = []
-                            for f in lyr.getFeatures():
-                                try:
-                                    fg = f.geometry()
-                                except Exception:
-                                    continue
-                                ok = False
-                                for rg in ref_geoms:
-                                    try:
-                                        if rg is not None and not rg.isEmpty() and fg is not None and not fg.isEmpty():
-                                            if rg.intersects(fg):
-                                                ok = True
-                                                break
-                                    except Exception:
-                                        continue
-                                if ok:
-                                    intersects.append(f)
-                            if intersects:
-                                mem_zon = create_memory_layer_from_features(lyr, intersects, name_suffix=f"_INTER_{self.zone_value or ''}")
-                                if mem_zon:
-                                    self.optional_zonage_layer = mem_zon
-                                else:
-                                    self.optional_zonage_layer = lyr
-                            else:
-                                QtWidgets.QMessageBox.information(self, 'Info', 'Aucune entité du zonage choisi n\'intersecte la zone d\'étude.')
-                                self.optional_zonage_layer = None
-                        else:
-                            self.optional_zonage_layer = lyr
-                    else:
-                        self.optional_zonage_layer = None
+                    QtWidgets.QMessageBox.information(self, 'Info', 'Aucune entité du zonage choisi n\'intersecte la zone d\'étude.')
+                self.optional_zonage_layer = None
+        self._finish_next(prog)
 
+    def _finish_next(self, prog):
         # apply qml if requested and available (for optional zonage)
         if self.optional_zonage_layer is not None and self.qml_zonage_checkbox.isChecked():
             try:
@@ -711,7 +1139,8 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         if alg is None:
             QtWidgets.QMessageBox.information(self, 'Algorithme manquant',
                 f"L'algorithme {alg_id} n'est pas trouvé dans le Toolbox.\n"
-                "Nous avons copié les scripts réseau vers ton dossier Processing/scripts utilisateur (si disponible).\n"
+                "Les algorithmes 'vocal:' sont servis par le plugin (vérifier que le script réseau existe) ; "
+                "les autres scripts sont copiés vers ton dossier Processing/scripts utilisateur (si disponible).\n"
                 "Si l'algorithme n'apparaît pas, redémarre QGIS ou va dans Processing > Toolbox > Refresh (icône).\n\n"
                 f"Script source (réseau) : {os.path.join(NETWORK_SCRIPTS_FOLDER, info.get('script_name','-'))}")
             return
@@ -745,13 +1174,170 @@ class PrelevOrchestratorDialog(QtWidgets.QDialog):
         except Exception as e:
             QtWidgets.QMessageBox.critical(self, 'Erreur', f"Erreur lors de l'ouverture de l'outil : {e}\n{traceback.format_exc()}")
 
+# ---------------- Processing provider ----------------
+# script -> (signature disque du script et de vocal_core, module importé)
+_SCRIPT_MODULES = {}
+_CORE_STAMP = None
+
+def _core_stamp():
+    """Date de modification la plus récente des modules de vocal_core (0 si absent)."""
+    folder = os.path.join(NETWORK_SCRIPTS_FOLDER, CORE_PACKAGE)
+    try:
+        return max((os.stat(os.path.join(folder, f)).st_mtime_ns for f in os.listdir(folder) if f.endswith('.py')), default=0)
+    except OSError:
+        return 0
+
+def load_algorithm_class(script_name, class_name):
+    """
+    Classe d'algorithme `class_name` du script `script_name` (NETWORK_SCRIPTS_FOLDER), importé à la
+    première demande puis ré-importé si le script ou vocal_core a changé sur disque : une mise à jour
+    des scripts réseau est prise en compte à la prochaine exécution, sans redémarrer QGIS.
+    """
+    global _CORE_STAMP
+    path = os.path.join(NETWORK_SCRIPTS_FOLDER, script_name)
+    core = _core_stamp()
+    if core != _CORE_STAMP:
+        if _CORE_STAMP is not None:
+            # moteur modifié : vocal_core sera relu depuis le disque par les scripts ré-importés
+            for mod in [m for m in sys.modules if m == CORE_PACKAGE or m.startswith(CORE_PACKAGE + '.')]:
+                del sys.modules[mod]
+        _CORE_STAMP = core
+    stamp = (os.stat(path).st_mtime_ns, core)
+    entry = _SCRIPT_MODULES.get(script_name)
+    if entry is None or entry[0] != stamp:
+        modname = f"{PROVIDER_ID}_{os.path.splitext(script_name)[0]}"
+        spec = importlib.util.spec_from_file_location(modname, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        entry = (stamp, module)
+        _SCRIPT_MODULES[script_name] = entry
+    return getattr(entry[1], class_name)
+
+def stale_script_copies():
+    """
+    Scripts servis par VocalProvider dont une ancienne copie reste dans le dossier Processing/scripts
+    utilisateur (versions antérieures du plugin) : QGIS les publie aussi en 'script:...'.
+    """
+    try:
+        folder = os.path.join(QgsApplication.qgisSettingsDirPath(), 'processing', 'scripts')
+    except Exception:
+        return []
+    return [os.path.join(folder, info['script_name']) for info in ALGO_INFOS.values()
+            if info.get('class_name') and os.path.exists(os.path.join(folder, info['script_name']))]
+
+class LazyScriptAlgorithm(QgsProcessingAlgorithm):
+    """
+    Algorithme du fournisseur VocalProvider, décrit par une entrée de ALGO_INFOS.
+    L'exemplaire enregistré dans la boîte à outils n'importe rien au démarrage (ni le script, ni
+    vocal_core / NumPy) : il charge l'algorithme du script à la première demande d'aide (shortHelpString,
+    helpUrl) et en recopie alors paramètres et sorties (aide Processing, processing.algorithmHelp).
+    Les exemplaires créés pour une exécution (createInstance) le chargent à l'initialisation
+    (load_algorithm_class), en recopient paramètres et sorties et lui délèguent le calcul.
+    """
+
+    def __init__(self, title, live=False):
+        super().__init__()
+        self._title = title
+        self._live = live
+        self._real = None
+
+    def _info(self):
+        return ALGO_INFOS[self._title]
+
+    def createInstance(self):
+        return LazyScriptAlgorithm(self._title, live=True)
+
+    def name(self):
+        return self._info()['alg_id'].split(':', 1)[1]
+
+    def displayName(self):
+        return self._title
+
+    def group(self):
+        return 'Analyses temporelles'
+
+    def groupId(self):
+        return 'temporal_analysis'
+
+    def _load(self, config=None):
+        info = self._info()
+        self._real = load_algorithm_class(info['script_name'], info['class_name'])()
+        self._real.initAlgorithm(config)
+        for param in self._real.parameterDefinitions():
+            if self.parameterDefinition(param.name()) is None:
+                self.addParameter(param.clone())
+        # sorties non créées par les paramètres de destination (ex : QgsProcessingOutputString)
+        for out in self._real.outputDefinitions():
+            if self.outputDefinition(out.name()) is None:
+                self.addOutput(type(out)(out.name(), out.description()))
+        return self._real
+
+    def _algorithm(self):
+        return self._real if self._real is not None else self._load()
+
+    def flags(self):
+        # avant tout chargement : drapeaux par défaut (QGIS les lit au démarrage, rien n'est importé)
+        if self._real is None:
+            return super().flags()
+        return self._real.flags()
+
+    def helpUrl(self):
+        return self._algorithm().helpUrl()
+
+    def shortHelpString(self):
+        return self._algorithm().shortHelpString()
+
+    def initAlgorithm(self, config=None):
+        if self._live:
+            self._load(config)
+
+    def processAlgorithm(self, parameters, context, feedback):
+        return self._real.processAlgorithm(parameters, context, feedback)
+
+class VocalProvider(QgsProcessingProvider):
+    """Fournisseur Processing 'vocal' : algorithmes des scripts réseau, sans copie ni import au démarrage."""
+
+    def id(self):
+        return PROVIDER_ID
+
+    def name(self):
+        return 'Le VOCAL'
+
+    def longName(self):
+        return self.name()
+
+    def icon(self):
+        icon_path = os.path.join(PLUGIN_DIR, 'icon.png')
+        if os.path.exists(icon_path):
+            return QtGui.QIcon(icon_path)
+        return QgsProcessingProvider.icon(self)
+
+    def loadAlgorithms(self):
+        for title, info in ALGO_INFOS.items():
+            if not info.get('class_name'):
+                continue
+            if os.path.exists(os.path.join(NETWORK_SCRIPTS_FOLDER, info['script_name'])):
+                self.addAlgorithm(LazyScriptAlgorithm(title))
+        stale = stale_script_copies()
+        if stale:
+            QgsMessageLog.logMessage(
+                "[Orch] Anciennes copies servies aussi par le fournisseur 'vocal:' (doublons 'script:' dans la boîte "
+                f"à outils, à supprimer après mise à jour des modèles) : {', '.join(stale)}", 'VOCAL', Qgis.Warning)
+
 # ---------------- Plugin entry-point convenience ----------------
 class PrelevOrchestratorPlugin:
     def __init__(self, iface):
         self.iface = iface
         self.action = None
+        self.provider = None
+
+    def initProcessing(self):
+        self.provider = VocalProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
 
     def initGui(self):
+        self.initProcessing()
+
         # Try to load icon.png from plugin folder
         icon_path = os.path.join(PLUGIN_DIR, 'icon.png')
         qicon = None
@@ -777,6 +1363,12 @@ class PrelevOrchestratorPlugin:
         self.iface.addToolBarIcon(self.action)
 
     def unload(self):
+        if self.provider is not None:
+            try:
+                QgsApplication.processingRegistry().removeProvider(self.provider)
+            except Exception:
+                pass
+            self.provider = None
         if self.action:
             try:
                 self.iface.removePluginMenu('&Prelev Orchestrator', self.action)
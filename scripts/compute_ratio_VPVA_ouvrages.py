@@ -11,6 +11,10 @@ Pour une année donnée, comparer le volume prélevé (VP, "assiettes" retenues
 ## Sortie
 Couche par ouvrage pour l'année choisie : `annee`, `ouvrage_id`, `ouvrage_name`, `interlocuteur`, `assiette`, `vol_autorise`, `ddtm_id`, `ratio`, `ratio_possible`, `percent_overrun`, `note`, `type_milieu`.
 
+Mode toutes années (`ALL_YEARS`, bornes optionnelles `START_YEAR` / `END_YEAR`) : table longue ouvrage × année
+en une seule lecture, avec en plus un résumé par ouvrage : `n_years`, `n_years_overrun` (années où VP > VA),
+`ratio_max`, `year_ratio_max`.
+
 ## Note sur les indicateurs
 - Le ratio représente réellement la division du VP/VA
 - Le %overrun présente le pourcentage que représente le VP/VA. 
@@ -26,93 +30,46 @@ from qgis.core import (
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
+    QgsProcessingParameterFileDestination,
     QgsFeature,
     QgsField,
     QgsFields,
     QgsProject,
-    QgsProcessingUtils,
-    QgsFeatureSink,
-    QgsSpatialIndex
+    QgsProcessingUtils
 )
-import re
 import os
-import math
-from collections import defaultdict
-
-# -------- utilitaires --------
-def parse_number(x):
-    """
-    Parse un nombre donné au format français/anglais :
-    - Accepte "12 000,56" ou "12000.56" ou "12000,56"
-    - Supprime unités (ex: ' m3') et caractères non numériques
-    - Retourne float ou NaN
-    """
-    if x is None:
-        return float('nan')
-    if isinstance(x, (int, float)):
-        try:
-            return float(x)
-        except:
-            return float('nan')
-    s = str(x).strip()
-    if s == '':
-        return float('nan')
-    s = s.replace('\xa0', ' ')
-    # remove spaces thousands separators, keep punctuation
-    s_nosp = s.replace(' ', '')
-    if '.' in s_nosp and ',' in s_nosp:
-        # if dot before comma -> dot = thousands, comma = decimal
-        if s_nosp.find('.') < s_nosp.find(','):
-            s_clean = s_nosp.replace('.', '').replace(',', '.')
-        else:
-            # uncommon: comma thousands, dot decimal
-            s_clean = s_nosp.replace(',', '')
-    elif ',' in s_nosp:
-        s_clean = s_nosp.replace(',', '.')
-    else:
-        s_clean = s_nosp
-    # keep digits, dot and minus
-    s_clean = re.sub(r'[^0-9\.\-]', '', s_clean)
-    if s_clean in ['', '.', '-', '-.']:
-        return float('nan')
-    try:
-        return float(s_clean)
-    except:
-        return float('nan')
-
-def parse_year_to_int(y_raw):
-    """
-    Try to convert the year value to an int.
-    Accepts ints, numeric strings, strings containing a 4-digit year.
-    Returns int or None.
-    """
-    if y_raw is None:
-        return None
-    # if already int
-    if isinstance(y_raw, int):
-        return y_raw
-    # if float but integer value
-    if isinstance(y_raw, float):
-        try:
-            return int(y_raw)
-        except:
-            pass
-    s = str(y_raw).strip()
-    if s == '':
-        return None
-    # try direct int
-    try:
-        return int(float(s))
-    except:
-        pass
-    # search for 4-digit year
-    m = re.search(r'(\d{4})', s)
-    if m:
-        try:
-            return int(m.group(1))
-        except:
-            return None
-    return None
+import sys
+
+# moteur de calcul partagé (dossier vocal_core à côté de ce script)
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPT_DIR)
+from vocal_core import (
+    backend_summary,
+    run_stages,
+    SinkWriter,
+    Progress,
+    clean_text,
+    clean_keys,
+    group_sum,
+    pick_by_key,
+    build_autor_index,
+    join_autor,
+    autor_volumes,
+    ratio_history,
+    build_year_cube,
+    optional_float,
+    PreparedZones,
+    feature_request,
+    request_fraction,
+    read_columns,
+    scan_latest_year,
+    rows_in_zones,
+    row_geometries,
+    layer_cache_key,
+    load_autor_index,
+    store_autor_index,
+)
 
 # -------- Algorithm --------
 class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
@@ -139,10 +96,14 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
     AUTOR_DDTM_FIELD = 'AUTOR_DDTM_FIELD'  # optional
 
     YEAR = 'YEAR'
+    ALL_YEARS = 'ALL_YEARS'
+    START_YEAR = 'START_YEAR'
+    END_YEAR = 'END_YEAR'
     INCLUDE_UNMATCHED = 'INCLUDE_UNMATCHED'
     APPLY_QML = 'APPLY_QML'
     QML_PATH = 'QML_PATH'
     OUTPUT = 'OUTPUT'
+    OUTPUT_REPORT = 'OUTPUT_REPORT'  # rapport JSON des étapes (optionnel)
 
     def tr(self, s):
         return s
@@ -167,7 +128,9 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
             "Agrège les volumes prélevés pour une année donnée par ID ouvrage, joint avec la table des volumes autorisés, "
             "calcule ratio et % dépassement. Conserve le champ 'type de milieu' (concaténation si plusieurs valeurs). "
             "Demande une couche de zone d'étude et ne conserve que les prélèvements situés dans cette zone. "
-            "Si l'année renseignée est 0 (valeur par défaut), le script utilisera la dernière année disponible parmi les prélèvements retenus."
+            "Si l'année renseignée est 0 (valeur par défaut), le script utilisera la dernière année disponible parmi les prélèvements retenus. "
+            "En mode toutes années, une ligne par ouvrage et par année (bornes optionnelles, 0 = sans borne) est produite en une seule lecture, "
+            "avec le nombre d'années en dépassement et le ratio maximal de chaque ouvrage."
         )
 
     def initAlgorithm(self, config=None):
@@ -279,6 +242,30 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
                 defaultValue=0
             )
         )
+        # mode toutes années : table longue ouvrage x année (YEAR ignoré)
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.ALL_YEARS,
+                self.tr("Toutes les années (une ligne par ouvrage et par année) ?"),
+                defaultValue=False
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.START_YEAR,
+                self.tr("Mode toutes années : année de début (0 = sans borne)"),
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=0
+            )
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.END_YEAR,
+                self.tr("Mode toutes années : année de fin (0 = sans borne)"),
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=0
+            )
+        )
         self.addParameter(
             QgsProcessingParameterBoolean(
                 self.INCLUDE_UNMATCHED,
@@ -309,7 +296,22 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.OUTPUT_REPORT,
+                self.tr("Rapport des étapes (durées, lignes, mémoire) en JSON"),
+                'JSON (*.json)',
+                optional=True,
+                createByDefault=False
+            )
+        )
+
     def processAlgorithm(self, parameters, context, feedback):
+        # étapes chronométrées (journal + rapport JSON optionnel)
+        return run_stages(self, parameters, context, feedback, self._process)
+
+    def _process(self, parameters, context, feedback, timer):
+        timer.stage('Paramètres')
         # read parameters
         zone_lyr = self.parameterAsVectorLayer(parameters, self.ZONE, context)
         prelev_lyr = self.parameterAsVectorLayer(parameters, self.PRELEV, context)
@@ -340,11 +342,17 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
         autor_ddtm_field = self.parameterAsString(parameters, self.AUTOR_DDTM_FIELD, context) if self.AUTOR_DDTM_FIELD in parameters else None
 
         year_param_input = int(self.parameterAsInt(parameters, self.YEAR, context))
+        all_years = bool(self.parameterAsBool(parameters, self.ALL_YEARS, context))
+        start_year = int(self.parameterAsInt(parameters, self.START_YEAR, context)) or None
+        end_year = int(self.parameterAsInt(parameters, self.END_YEAR, context)) or None
         include_unmatched = bool(self.parameterAsBool(parameters, self.INCLUDE_UNMATCHED, context))
         apply_qml = bool(self.parameterAsBool(parameters, self.APPLY_QML, context))
         qml_path_param = self.parameterAsString(parameters, self.QML_PATH, context)
 
         feedback.pushInfo(self.tr(f"Paramètres : année={year_param_input} (0 => dernière dispo), inclure_unmatched={include_unmatched}, apply_qml={apply_qml}"))
+        feedback.pushInfo(backend_summary())
+        if all_years:
+            feedback.pushInfo(self.tr(f"Mode toutes années : {start_year or 'début'} -> {end_year or 'fin'} (paramètre année ignoré)"))
 
         # Validate zone layer
         if zone_lyr is None:
@@ -355,291 +363,237 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
         if zone_lyr.featureCount() == 0:
             feedback.pushInfo(self.tr("La couche zone d'étude est vide (0 entité). Aucun prélèvement ne sera retenu."))
 
-        # Build spatial index for zone layer (if polygon geometry available)
-        zone_index = None
-        zone_geoms = {}
+        # Prepare zone geometries once (GEOS prepared engines + bbox quick-reject), if polygon geometry available
+        timer.stage('Zone d\'étude')
+        zones = None
         try:
-            # create index only if zone has geometries
             if zone_lyr.geometryType() != -1 and zone_lyr.featureCount() > 0:
-                zone_index = QgsSpatialIndex()
-                for zf in zone_lyr.getFeatures():
-                    try:
-                        zg = zf.geometry()
-                        if zg is None or zg.isEmpty():
-                            continue
-                        zone_geoms[zf.id()] = zg
-                        zone_index.addFeature(zf)
-                    except Exception:
-                        continue
-                feedback.pushInfo(self.tr(f"Index spatial zone construit ({len(zone_geoms)} géométries)."))
+                zones = PreparedZones((zf.id(), zf.geometry()) for zf in zone_lyr.getFeatures())
+                feedback.pushInfo(self.tr(f"Géométries de zone préparées ({len(zones)} géométries)."))
             else:
                 feedback.pushInfo(self.tr("La couche zone d'étude n'a pas de géométrie exploitable. Filtrage spatial désactivé."))
-                zone_index = None
         except Exception as e:
-            feedback.pushInfo(self.tr(f"Erreur création index spatial zone : {e}"))
-            zone_index = None
+            feedback.pushInfo(self.tr(f"Erreur préparation des géométries zone : {e}"))
+            zones = None
+        timer.rows(len(zones) if zones is not None else 0)
 
         # 1) lire la table des volumes autorisés et construire un index par ID ouvrage
         #    -> prendre MAX(volume autorisé) si plusieurs enregistrements, concatener DDTM distincts
-        autor_index = {}  # key (str id) -> dict { 'vol_max': float, 'ddtm': set(...) }
-        autor_count = 0
-        for f in autor_lyr.getFeatures():
-            autor_count += 1
-            key_raw = f[autor_ouv_field]
-            if key_raw is None:
-                continue
-            key = str(key_raw).strip()
-            vol_raw = f[autor_vol_field]
-            vol = parse_number(vol_raw)
-            ddtm_val = None
-            if autor_ddtm_field:
-                try:
-                    ddtm_val = f[autor_ddtm_field]
-                    if ddtm_val is not None:
-                        ddtm_val = str(ddtm_val).strip()
-                except Exception:
-                    ddtm_val = None
-            entry = autor_index.get(key)
-            if entry is None:
-                dd = set()
-                if ddtm_val:
-                    dd.add(ddtm_val)
-                autor_index[key] = {'vol_max': vol if not math.isnan(vol) else float('nan'), 'ddtm': dd}
-            else:
-                # update vol_max if numeric and larger
-                try:
-                    if not math.isnan(vol):
-                        if math.isnan(entry['vol_max']) or vol > entry['vol_max']:
-                            entry['vol_max'] = vol
-                except Exception:
-                    pass
-                # add ddtm
-                if ddtm_val:
-                    entry['ddtm'].add(ddtm_val)
-        feedback.pushInfo(self.tr(f"Chargé {autor_count} enregistrements volumes autorisés -> index de {len(autor_index)} clés."))
-
-        # 2) parcourir les prélèvements : 1ère passe = filtrage spatial + collecte des années disponibles (si YEAR=0)
-        prelev_count = 0
-        kept_spatial = 0
+        timer.stage('Index des volumes autorisés')
+        autor_fields = [autor_ouv_field, autor_vol_field, autor_ddtm_field]
+        autor_sig, autor_source = layer_cache_key(autor_lyr, autor_fields)
+        autor_index = load_autor_index(autor_sig)
+        if autor_index is not None:
+            feedback.pushInfo(self.tr(f"Index volumes autorisés repris du cache : {len(autor_index)} clés (source inchangée)."))
+        else:
+            autor_keys = []
+            autor_vols = []
+            autor_ddtm = [] if autor_ddtm_field else None
+            autor_request = feature_request(autor_lyr, autor_fields, geometry=False)
+            for f in autor_lyr.getFeatures(autor_request):
+                autor_keys.append(f[autor_ouv_field])
+                autor_vols.append(f[autor_vol_field])
+                if autor_ddtm_field:
+                    try:
+                        autor_ddtm.append(f[autor_ddtm_field])
+                    except Exception:
+                        autor_ddtm.append(None)
+            autor_count = len(autor_keys)
+            autor_index = build_autor_index(autor_keys, autor_vols, autor_ddtm)  # key (str id) -> { 'vol_max': float, 'ddtm': set(...) }
+            feedback.pushInfo(self.tr(f"Chargé {autor_count} enregistrements volumes autorisés -> index de {len(autor_index)} clés."))
+            store_autor_index(autor_sig, autor_source, autor_index)
+        timer.rows(len(autor_index))
+
+        # 2) lire les prélèvements en colonnes nettoyées (année, ID, assiette, milieu, nom, interlocuteur, x / y) :
+        #    depuis le cache local si la couche est un fichier inchangé. Sans cache utilisable : lecture
+        #    complète mise en cache si la requête (emprise de la zone, année demandée, champs utiles) couvre
+        #    une bonne part de la couche, sinon lecture limitée à la requête ; année 0 : lecture en flux qui
+        #    ne garde que la dernière année. Les filtres année puis zone s'appliquent ensuite sur les colonnes.
+        #    Année 0 : l'année cible est la plus récente ayant au moins un prélèvement dans la zone.
+        #    Mode toutes années : toutes les années de la fenêtre sont conservées (colonne année).
+        timer.stage('Lecture des prélèvements')
         prelev_has_geom = (prelev_lyr.geometryType() != -1)
-        records = []  # store tuples for second pass: (key, year_int, ass_raw, geom, milieu_raw, name_raw, interloc_raw)
-        available_years = set()
-
-        for f in prelev_lyr.getFeatures():
-            prelev_count += 1
-            if feedback.isCanceled():
-                break
-
-            # spatial filter if applicable
-            if prelev_has_geom and zone_index is not None:
-                try:
-                    fg = f.geometry()
-                    if fg is None or fg.isEmpty():
-                        continue
-                    cands = zone_index.intersects(fg.boundingBox())
-                    if not cands:
-                        continue
-                    inside = False
-                    for fid in cands:
-                        zg = zone_geoms.get(fid)
-                        if zg is None:
-                            try:
-                                zf_tmp = zone_lyr.getFeature(fid)
-                                zg = zf_tmp.geometry() if zf_tmp is not None else None
-                            except Exception:
-                                zg = None
-                        if zg is None:
-                            continue
-                        try:
-                            if zg.contains(fg) or zg.intersects(fg):
-                                inside = True
-                                break
-                        except Exception:
-                            try:
-                                if zg.intersects(fg):
-                                    inside = True
-                                    break
-                            except Exception:
-                                continue
-                    if not inside:
-                        continue
-                except Exception:
-                    # on erreur, exclure la géométrie
-                    continue
-            # passed spatial filter (or no spatial filtering applied)
-            kept_spatial += 1
-
-            # read year (may be string)
-            try:
-                y_raw = f[prelev_year_field]
-            except Exception:
-                continue
-            y_int = parse_year_to_int(y_raw)
-            if y_int is None:
-                # keep record? no - it's unusable for year selection/aggregation
-                continue
-
-            # store available year
-            available_years.add(y_int)
-
-            # read key and other raw fields (we will filter by year later)
-            try:
-                key_raw = f[prelev_ouv_field]
-                if key_raw is None:
-                    continue
-                key = str(key_raw).strip()
-            except Exception:
-                continue
-
-            # assiette raw
-            try:
-                ass_raw = f[prelev_assiette_field]
-            except Exception:
-                ass_raw = None
-
-            # milieu raw (optional)
-            milieu_raw = None
-            if prelev_milieu_field:
-                try:
-                    milieu_raw = f[prelev_milieu_field]
-                except Exception:
-                    milieu_raw = None
-
-            # name & interloc raw (optional)
-            name_raw = None
-            if prelev_ouv_name_field:
-                try:
-                    name_raw = f[prelev_ouv_name_field]
-                except Exception:
-                    name_raw = None
-            interloc_raw = None
-            if prelev_interloc_field:
-                try:
-                    interloc_raw = f[prelev_interloc_field]
-                except Exception:
-                    interloc_raw = None
-
-            # geometry
-            geom = None
-            if prelev_has_geom:
-                try:
-                    geom = f.geometry()
-                except Exception:
-                    geom = None
-
-            records.append((key, y_int, ass_raw, geom, milieu_raw, name_raw, interloc_raw))
-            feedback.setProgress(int(100 * prelev_count / max(1, prelev_lyr.featureCount())))
-
-        feedback.pushInfo(self.tr(f"Prélèvements parcourus: {prelev_count}, conservés après filtrage spatial: {kept_spatial}, années disponibles: {sorted(available_years)}"))
-
-        # determine year to use
-        if year_param_input == 0:
-            if not available_years:
-                raise Exception(self.tr("Aucune année disponible parmi les prélèvements retenus — impossible de déterminer la dernière année."))
-            year_param = max(available_years)
-            feedback.pushInfo(self.tr(f"Aucune année fournie (0) -> usage de la dernière année disponible : {year_param}"))
+        spatial = prelev_has_geom and zones is not None
+        if all_years:
+            window = (start_year, end_year)
         else:
-            year_param = int(year_param_input)
-            feedback.pushInfo(self.tr(f"Année fournie par l'utilisateur : {year_param}"))
-
-        # 3) deuxième passe : agréger assiette par ouvrage pour l'année choisie, collecter géom, milieu, name, interloc
-        assiette_by_ouv = defaultdict(float)
+            year_bound = year_param_input if year_param_input != 0 else None
+            window = (year_bound, year_bound)
+        prelev_request = feature_request(
+            prelev_lyr,
+            [prelev_year_field, prelev_ouv_field, prelev_assiette_field, prelev_milieu_field, prelev_ouv_name_field, prelev_interloc_field],
+            rect=zones.extent if spatial else None,
+            year_field=prelev_year_field, start_year=window[0], end_year=window[1],
+        )
+        specs = [(prelev_year_field, 'year'), (prelev_ouv_field, 'value'), (prelev_assiette_field, 'number'),
+                 (prelev_milieu_field, 'value'), (prelev_ouv_name_field, 'value'), (prelev_interloc_field, 'value')]
+        fraction = request_fraction(prelev_lyr, rect=zones.extent if spatial else None,
+                                    year_field=prelev_year_field, start_year=window[0], end_year=window[1])
+        cold = None
+        if not all_years and year_param_input == 0:
+            # dernière année sans cache : seules les entités de l'année maximale (dans la zone) sont gardées
+            def cold():
+                return scan_latest_year(prelev_lyr, specs, prelev_year_field, request=prelev_request,
+                                        zones=zones if spatial else None, geometry=prelev_has_geom, feedback=feedback)
+        try:
+            cols, origin = read_columns(prelev_lyr, specs, request=prelev_request, geometry=prelev_has_geom,
+                                        feedback=feedback, fraction=fraction, cold=cold)
+        except KeyError as e:
+            raise Exception(self.tr(f"Champ(s) introuvable(s) dans la couche prélèvements : {e}"))
+        if cols is None:
+            raise Exception(self.tr("Lecture des prélèvements annulée."))
+        feedback.pushInfo(self.tr(f"Colonnes des prélèvements : {len(cols)} entités ({origin})."))
+        timer.rows(len(cols))
+
+        timer.stage('Filtre année / zone', rows=len(cols))
+        years, year_ok = cols.year(prelev_year_field)
+        available_years = sorted(set(years[year_ok].tolist()))
+        in_window = year_ok
+        if all_years:
+            if start_year:
+                in_window = in_window & (years >= start_year)
+            if end_year:
+                in_window = in_window & (years <= end_year)
+        elif year_param_input != 0:
+            in_window = in_window & (years == year_param_input)
+        rows = in_window.nonzero()[0]
+        target_year = year_param_input if year_param_input != 0 else None
+        if not spatial:
+            if not all_years and target_year is None and len(rows):
+                target_year = int(years[rows].max())
+                rows = rows[years[rows] == target_year]
+        elif all_years or target_year is not None:
+            rows = rows[rows_in_zones(prelev_lyr, cols, zones, rows)]
+        else:
+            # dernière année : années testées de la plus récente à la plus ancienne, arrêt à la première
+            # qui a au moins un prélèvement dans la zone
+            kept = rows[:0]
+            for y in available_years[::-1]:
+                cand = rows[years[rows] == y]
+                kept = cand[rows_in_zones(prelev_lyr, cols, zones, cand)]
+                if len(kept):
+                    target_year = y
+                    break
+            rows = kept
+
+        col_year = years[rows].tolist()
+        keys = clean_keys(cols.value(prelev_ouv_field, rows))
+        col_ass = cols.number(prelev_assiette_field)[rows]  # assiettes déjà converties (float, NaN)
+        col_milieu = cols.value(prelev_milieu_field, rows).tolist() if prelev_milieu_field else []
+        col_name = cols.value(prelev_ouv_name_field, rows).tolist() if prelev_ouv_name_field else []
+        col_interloc = cols.value(prelev_interloc_field, rows).tolist() if prelev_interloc_field else []
+        # géométrie : première géométrie non vide par ouvrage (relue par fid : géométrie exacte de la couche)
         geom_by_ouv = {}
-        milieu_by_ouv = defaultdict(set)
-        name_by_ouv = {}
-        interloc_by_ouv = {}
-
-        for rec in records:
-            key, y_int, ass_raw, geom, milieu_raw, name_raw, interloc_raw = rec
-            if y_int != year_param:
-                continue
-            # assiette
-            ass = parse_number(ass_raw)
-            if math.isnan(ass):
-                ass_val = 0.0
-            else:
-                ass_val = ass
-            assiette_by_ouv[key] += ass_val
-            # geometry -> keep first geometry found
-            if prelev_has_geom and key not in geom_by_ouv and geom is not None and not geom.isEmpty():
-                geom_by_ouv[key] = geom
-            # milieu
-            if prelev_milieu_field and milieu_raw is not None:
-                mm = str(milieu_raw).strip()
-                if mm != '':
-                    milieu_by_ouv[key].add(mm)
-            # name (first non-empty)
-            if prelev_ouv_name_field and name_raw is not None:
-                try:
-                    nm = str(name_raw).strip()
-                    if nm != '' and key not in name_by_ouv:
-                        name_by_ouv[key] = nm
-                except Exception:
-                    pass
-            # interloc (first non-empty)
-            if prelev_interloc_field and interloc_raw is not None:
-                try:
-                    it = str(interloc_raw).strip()
-                    if it != '' and key not in interloc_by_ouv:
-                        interloc_by_ouv[key] = it
-                except Exception:
-                    pass
-
-        feedback.pushInfo(self.tr(f"Ouvrages agrégés pour l'année {year_param} : {len(assiette_by_ouv)}"))
-
-        # 4) pour chaque ouvrage agrégé, joindre avec autor_index
-        rows_out = []  # tuples of (key, annee, assiette_sum, vol_autorise, ddtm_concat, ratio, ratio_possible, percent_overrun, note, geom, milieu_concat, name, interloc)
-        cnt_included = 0
-        cnt_unmatched = 0
-        cnt_vol_zero = 0
-        for key, ass_sum in sorted(assiette_by_ouv.items()):
-            autor_entry = autor_index.get(key)
-            if autor_entry is None:
-                # unmatched
-                if not include_unmatched:
-                    cnt_unmatched += 1
+        if prelev_has_geom:
+            with_geom = cols.has_geometry()[rows].tolist()
+            first_row = pick_by_key(keys, [r if (k is not None and g) else None for k, r, g in zip(keys, rows.tolist(), with_geom)], last=False)
+            geoms = row_geometries(prelev_lyr, cols, first_row.values())
+            geom_by_ouv = {k: geoms[r] for k, r in first_row.items() if r in geoms}
+        feedback.pushInfo(self.tr(f"Prélèvements parcourus: {len(cols)}, retenus (année / zone): {len(rows)}, années disponibles: {available_years}"))
+
+        # tuples of (key, annee, assiette_sum, vol_autorise, ddtm_concat, ratio, ratio_possible, percent_overrun, note, geom, milieu_concat, name, interloc, summary)
+        # summary (mode toutes années) : (n_years, n_years_overrun, ratio_max, year_ratio_max)
+        timer.stage('Agrégation et jointure', rows=len(rows))
+        rows_out = []
+        if all_years:
+            # 3) cube ouvrage x année sur la fenêtre, milieu / nom / interlocuteur par (ouvrage, année)
+            sel = [i for i, k in enumerate(keys) if k is not None]
+            if not sel:
+                raise Exception(self.tr("Aucun prélèvement retenu sur la période demandée."))
+            sel_keys = [keys[i] for i in sel]
+            sel_years = [col_year[i] for i in sel]
+            cells = list(zip(sel_keys, sel_years))
+            cube = build_year_cube(sel_keys, sel_years, col_ass[sel])
+            milieu_by_cell = {}
+            if prelev_milieu_field:
+                for c, mm in zip(cells, clean_text([col_milieu[i] for i in sel])):
+                    if mm is not None:
+                        milieu_by_cell.setdefault(c, set()).add(mm)
+            name_by_cell = pick_by_key(cells, clean_text([col_name[i] for i in sel]), last=False) if prelev_ouv_name_field else {}
+            interloc_by_cell = pick_by_key(cells, clean_text([col_interloc[i] for i in sel]), last=False) if prelev_interloc_field else {}
+            feedback.pushInfo(self.tr(f"Cube ouvrage x année : {len(cube.keys)} ouvrages, années {cube.years.tolist()}"))
+
+            # 4) jointure avec autor_index puis ratios de toutes les années en une passe
+            matched, vol_auth = autor_volumes(cube.keys, autor_index)
+            hist = ratio_history(cube.values, vol_auth[:, None], cube.mask, cube.years)
+            cnt_unmatched = 0 if include_unmatched else int((~matched).sum())
+            cnt_vol_zero = int((vol_auth == 0).sum())
+            for i, key in enumerate(cube.keys):
+                if not matched[i] and not include_unmatched:
                     continue
-                vol_auth = None
-                ddtm_concat = None
-                note = 'unmatched'
-            else:
-                vol_auth = autor_entry.get('vol_max')
-                if vol_auth is None or (isinstance(vol_auth, float) and math.isnan(vol_auth)):
-                    vol_auth = None
-                ddset = autor_entry.get('ddtm', set())
-                ddtm_concat = ';'.join(sorted(ddset)) if ddset else None
-                note = 'matched'
-            # ratio logic
-            ratio_possible = False
-            ratio = None
-            percent_overrun = None
-            if vol_auth is None:
-                ratio_possible = False
+                if matched[i]:
+                    ddset = autor_index[key].get('ddtm', set())
+                    ddtm_concat = ';'.join(sorted(ddset)) if ddset else None
+                    note = 'matched'
+                else:
+                    ddtm_concat = None
+                    note = 'unmatched'
+                summary = (int(hist['n_years'][i]), int(hist['n_years_overrun'][i]),
+                           optional_float(hist['ratio_max'][i]), int(hist['year_ratio_max'][i]) or None)
+                for j in cube.mask[i].nonzero()[0].tolist():
+                    year = int(cube.years[j])
+                    milset = milieu_by_cell.get((key, year), set())
+                    milieu_concat = ';'.join(sorted(milset)) if milset else None
+                    rows_out.append((key, year, float(cube.values[i, j]), optional_float(vol_auth[i]), ddtm_concat,
+                                     optional_float(hist['ratio'][i, j]), int(hist['ratio_possible'][i, j]),
+                                     optional_float(hist['percent_overrun'][i, j]), note, geom_by_ouv.get(key),
+                                     milieu_concat, name_by_cell.get((key, year)), interloc_by_cell.get((key, year)), summary))
+        else:
+            # determine year to use
+            if year_param_input == 0:
+                if target_year is None:
+                    raise Exception(self.tr("Aucune année disponible parmi les prélèvements retenus — impossible de déterminer la dernière année."))
+                year_param = target_year
+                feedback.pushInfo(self.tr(f"Aucune année fournie (0) -> usage de la dernière année disponible : {year_param}"))
             else:
-                # vol_auth numeric
-                try:
-                    if vol_auth == 0:
-                        ratio_possible = False
-                        cnt_vol_zero += 1
-                    else:
-                        ratio = ass_sum / vol_auth
-                        ratio_possible = True
-                        percent_overrun = ((ass_sum - vol_auth) / vol_auth) * 100.0
-                except Exception:
-                    ratio_possible = False
-            geom = geom_by_ouv.get(key) if key in geom_by_ouv else None
-            # milieu concat
-            milset = milieu_by_ouv.get(key, set())
-            milieu_concat = ';'.join(sorted(milset)) if milset else None
-            # name/interloc
-            nm = name_by_ouv.get(key) if name_by_ouv.get(key) is not None else None
-            itc = interloc_by_ouv.get(key) if interloc_by_ouv.get(key) is not None else None
-            rows_out.append((key, year_param, ass_sum, vol_auth, ddtm_concat, ratio, 1 if ratio_possible else 0, percent_overrun, note, geom, milieu_concat, nm, itc))
-            cnt_included += 1
+                year_param = int(year_param_input)
+                feedback.pushInfo(self.tr(f"Année fournie par l'utilisateur : {year_param}"))
+
+            # 3) agréger assiette par ouvrage pour l'année choisie, collecter géom, milieu, name, interloc
+            sel = [i for i, k in enumerate(keys) if k is not None]
+            sel_keys = [keys[i] for i in sel]
+            ouv_keys, ass_sums = group_sum(sel_keys, col_ass[sel])
+            # milieu : ensemble des valeurs distinctes
+            milieu_by_ouv = {}
+            if prelev_milieu_field:
+                for k, mm in zip(sel_keys, clean_text([col_milieu[i] for i in sel])):
+                    if mm is not None:
+                        milieu_by_ouv.setdefault(k, set()).add(mm)
+            # name / interloc (first non-empty)
+            name_by_ouv = pick_by_key(sel_keys, clean_text([col_name[i] for i in sel]), last=False) if prelev_ouv_name_field else {}
+            interloc_by_ouv = pick_by_key(sel_keys, clean_text([col_interloc[i] for i in sel]), last=False) if prelev_interloc_field else {}
+
+            feedback.pushInfo(self.tr(f"Ouvrages agrégés pour l'année {year_param} : {len(ouv_keys)}"))
+
+            # 4) pour chaque ouvrage agrégé, joindre avec autor_index (ouv_keys est trié)
+            join = join_autor(ouv_keys, ass_sums, autor_index)
+            matched = join['matched'].tolist()
+            vol_auth = join['vol_autorise']
+            cnt_unmatched = 0 if include_unmatched else matched.count(False)
+            cnt_vol_zero = int((vol_auth == 0).sum())
+
+            for i, key in enumerate(ouv_keys):
+                if not matched[i] and not include_unmatched:
+                    continue
+                if matched[i]:
+                    ddset = autor_index[key].get('ddtm', set())
+                    ddtm_concat = ';'.join(sorted(ddset)) if ddset else None
+                    note = 'matched'
+                else:
+                    ddtm_concat = None
+                    note = 'unmatched'
+                milset = milieu_by_ouv.get(key, set())
+                milieu_concat = ';'.join(sorted(milset)) if milset else None
+                rows_out.append((key, year_param, float(ass_sums[i]), optional_float(vol_auth[i]), ddtm_concat,
+                                 optional_float(join['ratio'][i]), int(join['ratio_possible'][i]),
+                                 optional_float(join['percent_overrun'][i]), note, geom_by_ouv.get(key),
+                                 milieu_concat, name_by_ouv.get(key), interloc_by_ouv.get(key), None))
+        cnt_included = len(rows_out)
 
         feedback.pushInfo(self.tr(f"Ouvrages inclus dans la sortie : {cnt_included} (non appariés exclus: {cnt_unmatched}) ; vols autorisés nuls: {cnt_vol_zero}"))
 
         # 5) préparer sink et écrire la couche de sortie (géométrie = de la couche prélèvements si disponible)
+        timer.stage('Écriture des ouvrages')
         out_fields = QgsFields()
         out_fields.append(QgsField('annee', QVariant.Int))
         out_fields.append(QgsField('ouvrage_id', QVariant.String))
@@ -653,6 +607,12 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
         out_fields.append(QgsField('percent_overrun', QVariant.Double))
         out_fields.append(QgsField('note', QVariant.String))
         out_fields.append(QgsField('type_milieu', QVariant.String))  # nouveau champ de sortie
+        if all_years:
+            # résumé par ouvrage, répété sur chaque ligne de la table longue
+            out_fields.append(QgsField('n_years', QVariant.Int))
+            out_fields.append(QgsField('n_years_overrun', QVariant.Int))
+            out_fields.append(QgsField('ratio_max', QVariant.Double))
+            out_fields.append(QgsField('year_ratio_max', QVariant.Int))
 
         # geometry type from prelev layer (points or None -> use wkbType)
         wkbtype = prelev_lyr.wkbType()
@@ -661,41 +621,42 @@ class ComparePrelevementsAutorises(QgsProcessingAlgorithm):
         (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
                                                out_fields, wkbtype, crs)
 
-        total_rows = len(rows_out)
-        written = 0
-        for i, rec in enumerate(rows_out):
-            if feedback.isCanceled():
-                break
-            key, annee, ass_sum, vol_auth, ddtm_concat, ratio, ratio_possible_int, percent_overrun, note, geom, milieu_concat, nm, itc = rec
-            feat = QgsFeature()
-            feat.setFields(out_fields)
-            feat['annee'] = int(annee)
-            feat['ouvrage_id'] = str(key)
-            feat['ouvrage_name'] = str(nm) if nm is not None else None
-            feat['interlocuteur'] = str(itc) if itc is not None else None
-            feat['assiette'] = float(ass_sum) if ass_sum is not None else None
-            feat['vol_autorise'] = float(vol_auth) if vol_auth is not None else None
-            feat['ddtm_id'] = str(ddtm_concat) if ddtm_concat is not None else None
-            feat['ratio'] = float(ratio) if ratio is not None else None
-            feat['ratio_possible'] = int(ratio_possible_int)
-            feat['percent_overrun'] = float(percent_overrun) if percent_overrun is not None else None
-            feat['note'] = str(note)
-            feat['type_milieu'] = str(milieu_concat) if milieu_concat is not None else None
-            if geom is not None:
-                try:
-                    feat.setGeometry(geom)
-                except Exception:
-                    pass
-            try:
-                sink.addFeature(feat, QgsFeatureSink.FastInsert)
-            except TypeError:
-                sink.addFeature(feat)
-            written += 1
-            feedback.setProgress(int(100 * written / max(1, total_rows)))
-
-        feedback.pushInfo(self.tr(f"Ecriture terminée : {written} entités écrites."))
+        progress = Progress(feedback, len(rows_out))
+        with SinkWriter(sink) as out:
+            for i, rec in enumerate(rows_out):
+                if progress.stopped():
+                    break
+                key, annee, ass_sum, vol_auth, ddtm_concat, ratio, ratio_possible_int, percent_overrun, note, geom, milieu_concat, nm, itc, summary = rec
+                feat = QgsFeature()
+                feat.setFields(out_fields)
+                feat['annee'] = int(annee)
+                feat['ouvrage_id'] = str(key)
+                feat['ouvrage_name'] = str(nm) if nm is not None else None
+                feat['interlocuteur'] = str(itc) if itc is not None else None
+                feat['assiette'] = float(ass_sum) if ass_sum is not None else None
+                feat['vol_autorise'] = float(vol_auth) if vol_auth is not None else None
+                feat['ddtm_id'] = str(ddtm_concat) if ddtm_concat is not None else None
+                feat['ratio'] = float(ratio) if ratio is not None else None
+                feat['ratio_possible'] = int(ratio_possible_int)
+                feat['percent_overrun'] = float(percent_overrun) if percent_overrun is not None else None
+                feat['note'] = str(note)
+                feat['type_milieu'] = str(milieu_concat) if milieu_concat is not None else None
+                if summary is not None:
+                    feat['n_years'], feat['n_years_overrun'], feat['ratio_max'], feat['year_ratio_max'] = summary
+                if geom is not None:
+                    try:
+                        feat.setGeometry(geom)
+                    except Exception:
+                        pass
+                out.add(feat)
+        progress.finish()
+
+        feedback.pushInfo(self.tr(f"Ecriture terminée : {out.written} entités écrites."))
+        timer.rows(out.written)
 
         # 6) appliquer QML si demandé
+        if apply_qml:
+            timer.stage('Style QML')
         try:
             if apply_qml:
                 result_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
@@ -6,6 +6,8 @@ Processing script QGIS : agrégation zonale — comparer volumes prélevés vs v
 - Pour une année donnée : agrège prélèvements par ouvrage, joint avec autorisés (MAX si multiples),
   garde uniquement ouvrages appariés, affecte aux zones (multi-affectation possible),
   somme prélevé et autorisé par zone et calcule ratio / pourcentages.
+- Mode toutes années (bornes optionnelles) : table longue zone x année en une seule lecture,
+  avec le nombre d'années en dépassement et le ratio maximal de chaque zone.
 - Option d'appliquer un QML sur la couche de sortie.
 """
 from qgis.PyQt.QtCore import QVariant
@@ -18,80 +20,48 @@ from qgis.core import (
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
+    QgsProcessingParameterFileDestination,
     QgsFeature,
     QgsField,
     QgsFields,
     QgsProject,
     QgsProcessingUtils,
-    QgsSpatialIndex,
     QgsFeatureSink   # <-- import ajouté pour éviter NameError
 )
-import re
 import os
-import math
+import sys
 from collections import defaultdict
 
+# moteur de calcul partagé (dossier vocal_core à côté de ce script)
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPT_DIR)
+from vocal_core import (
+    backend_summary,
+    run_stages,
+    SinkWriter,
+    Progress,
+    clean_keys,
+    group_sum,
+    build_autor_index,
+    ratio_indicators,
+    optional_float,
+    build_year_cube,
+    autor_volumes,
+    group_ratio_history,
+    feature_request,
+    request_fraction,
+    read_columns,
+    assign_to_zones,
+    pick_by_key,
+    layer_cache_key,
+    load_autor_index,
+    store_autor_index,
+)
+
 # label utilisé pour agréger les ouvrages non assignés à une zone
 UNASSIGNED_LABEL = 'Non assigné'
 
-# ---------- utilitaires ----------
-def parse_number(x):
-    """Parse un nombre au format français/anglais -> float ou NaN"""
-    if x is None:
-        return float('nan')
-    if isinstance(x, (int, float)):
-        try:
-            return float(x)
-        except:
-            return float('nan')
-    s = str(x).strip()
-    if s == '':
-        return float('nan')
-    s = s.replace('\xa0', ' ')
-    s_nosp = s.replace(' ', '')
-    if '.' in s_nosp and ',' in s_nosp:
-        if s_nosp.find('.') < s_nosp.find(','):
-            s_clean = s_nosp.replace('.', '').replace(',', '.')
-        else:
-            s_clean = s_nosp.replace(',', '')
-    elif ',' in s_nosp:
-        s_clean = s_nosp.replace(',', '.')
-    else:
-        s_clean = s_nosp
-    s_clean = re.sub(r'[^0-9\.\-]', '', s_clean)
-    if s_clean in ['', '.', '-', '-.']:
-        return float('nan')
-    try:
-        return float(s_clean)
-    except:
-        return float('nan')
-
-def parse_year_to_int(y_raw):
-    """Convertit une valeur d'année en int si possible (gère string contenant '2023', etc.)"""
-    if y_raw is None:
-        return None
-    if isinstance(y_raw, int):
-        return y_raw
-    if isinstance(y_raw, float):
-        try:
-            return int(y_raw)
-        except:
-            pass
-    s = str(y_raw).strip()
-    if s == '':
-        return None
-    try:
-        return int(float(s))
-    except:
-        pass
-    m = re.search(r'(\d{4})', s)
-    if m:
-        try:
-            return int(m.group(1))
-        except:
-            return None
-    return None
-
 # ---------- Algorithm ----------
 class ZonesComparePrelevAutorise(QgsProcessingAlgorithm):
     """
@@ -110,9 +80,13 @@ class ZonesComparePrelevAutorise(QgsProcessingAlgorithm):
     AUTOR_VOL = 'AUTOR_VOL'
     AUTOR_DDTM = 'AUTOR_DDTM'
     YEAR = 'YEAR'
+    ALL_YEARS = 'ALL_YEARS'
+    START_YEAR = 'START_YEAR'
+    END_YEAR = 'END_YEAR'
     APPLY_QML = 'APPLY_QML'
     QML_PATH = 'QML_PATH'
     OUTPUT = 'OUTPUT'
+    OUTPUT_REPORT = 'OUTPUT_REPORT'  # rapport JSON des étapes (optionnel)
 
     def tr(self, s):
         return s
@@ -137,7 +111,9 @@ class ZonesComparePrelevAutorise(QgsProcessingAlgorithm):
             "Pour une année donnée, agrège les prélèvements par ouvrage, joint avec les volumes autorisés (MAX si multiples), "
             "garde uniquement les ouvrages appariés, affecte aux zones (multi-affectation possible), "
             "somme prélevé et autorisé par zone et calcule ratio / pourcentages. Les ouvrages non-intersectés sont "
-            "agrégés sous '{}' sans géométrie.".format(UNASSIGNED_LABEL)
+            "agrégés sous '{}' sans géométrie. "
+            "En mode toutes années, une ligne par zone et par année (bornes optionnelles, 0 = sans borne) est produite "
+            "en une seule lecture, avec le nombre d'années en dépassement et le ratio maximal de chaque zone.".format(UNASSIGNED_LABEL)
         )
 
     def initAlgorithm(self, config=None):
@@ -178,6 +154,15 @@ class ZonesComparePrelevAutorise(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterNumber(self.YEAR, self.tr("Année (ex : 2023)"), type=QgsProcessingParameterNumber.Integer, defaultValue=2023)
         )
+        self.addParameter(
+            QgsProcessingParameterBoolean(self.ALL_YEARS, self.tr("Toutes les années (une ligne par zone et par année) ?"), defaultValue=False)
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(self.START_YEAR, self.tr("Mode toutes années : année de début (0 = sans borne)"), type=QgsProcessingParameterNumber.Integer, defaultValue=0)
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(self.END_YEAR, self.tr("Mode toutes années : année de fin (0 = sans borne)"), type=QgsProcessingParameterNumber.Integer, defaultValue=0)
+        )
         self.addParameter(
             QgsProcessingParameterBoolean(self.APPLY_QML, self.tr("Appliquer un style QML sur la couche de sortie ?"), defaultValue=True)
         )
@@ -188,8 +173,25 @@ class ZonesComparePrelevAutorise(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Couche de sortie (zones enrichies)"))
         )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(self.OUTPUT_REPORT, self.tr("Rapport des étapes (durées, lignes, mémoire) en JSON"),
+                                                  'JSON (*.json)', optional=True, createByDefault=False)
+        )
+
+    def _assign(self, zones_lyr, zone_label_field, prelev_lyr, cols, rows_by_key, feedback):
+        """Ouvrage -> libellés des zones intersectées (cache d'affectation partagé avec compute_slopes_zones)."""
+        feedback.pushInfo(self.tr("Affectation des ouvrages aux zones..."))
+        zones_by_ouv, n_cached = assign_to_zones(zones_lyr, zone_label_field, prelev_lyr, cols, rows_by_key, feedback)
+        if n_cached:
+            feedback.pushInfo(self.tr(f"Affectation reprise du cache pour {n_cached} ouvrages ; {len(zones_by_ouv) - n_cached} testés."))
+        return zones_by_ouv
 
     def processAlgorithm(self, parameters, context, feedback):
+        # étapes chronométrées (journal + rapport JSON optionnel)
+        return run_stages(self, parameters, context, feedback, self._process)
+
+    def _process(self, parameters, context, feedback, timer):
+        timer.stage('Paramètres')
         # lire paramètres
         zones_lyr = self.parameterAsVectorLayer(parameters, self.ZONES, context)
         zone_label_field = self.parameterAsString(parameters, self.ZONE_LABEL, context)
@@ -205,270 +207,313 @@ class ZonesComparePrelevAutorise(QgsProcessingAlgorithm):
         autor_ddtm_field = self.parameterAsString(parameters, self.AUTOR_DDTM, context) if self.AUTOR_DDTM in parameters else None
 
         year_param = int(self.parameterAsInt(parameters, self.YEAR, context))
+        all_years = bool(self.parameterAsBool(parameters, self.ALL_YEARS, context))
+        start_year = int(self.parameterAsInt(parameters, self.START_YEAR, context)) or None
+        end_year = int(self.parameterAsInt(parameters, self.END_YEAR, context)) or None
         apply_qml = bool(self.parameterAsBool(parameters, self.APPLY_QML, context))
         qml_path_param = self.parameterAsString(parameters, self.QML_PATH, context)
 
-        feedback.pushInfo(self.tr(f"Paramètres : année={year_param}"))
+        if all_years:
+            feedback.pushInfo(self.tr(f"Paramètres : toutes années {start_year or 'début'} -> {end_year or 'fin'} (année ignorée)"))
+        else:
+            feedback.pushInfo(self.tr(f"Paramètres : année={year_param}"))
+        # agrégation par zone : matrice d'affectation creuse (SciPy) si disponible
+        feedback.pushInfo(backend_summary(scipy=True))
 
         # ---------- 1) Index des volumes autorisés (par ouvrage) ----------
         # Prendre MAX(volume autorisé) si plusieurs enregistrements, concaténer DDTM distincts
-        autor_index = {}  # key -> {'vol_max': float or NaN, 'ddtm': set()}
-        n_autor = 0
-        for f in autor_lyr.getFeatures():
-            n_autor += 1
-            k_raw = f[autor_ouv_field]
-            if k_raw is None:
-                continue
-            k = str(k_raw).strip()
-            vol_raw = f[autor_vol_field]
-            vol = parse_number(vol_raw)
-            ddtm_val = None
-            if autor_ddtm_field:
-                try:
-                    ddtm_val = f[autor_ddtm_field]
-                    if ddtm_val is not None:
-                        ddtm_val = str(ddtm_val).strip()
-                except Exception:
-                    ddtm_val = None
-            ent = autor_index.get(k)
-            if ent is None:
-                s = set()
-                if ddtm_val:
-                    s.add(ddtm_val)
-                autor_index[k] = {'vol_max': vol if not math.isnan(vol) else float('nan'), 'ddtm': s}
-            else:
-                try:
-                    if not math.isnan(vol):
-                        if math.isnan(ent['vol_max']) or vol > ent['vol_max']:
-                            ent['vol_max'] = vol
-                except Exception:
-                    pass
-                if ddtm_val:
-                    ent['ddtm'].add(ddtm_val)
-        feedback.pushInfo(self.tr(f"Index volumes autorisés : {len(autor_index)} clés construites (parcours {n_autor} enregistrements)."))
-
-        # ---------- 2) Parcourir prélèvements pour l'année, agréger par ouvrage ----------
-        assiette_by_ouv = defaultdict(float)
-        geom_by_ouv = {}
-        prelev_count = 0
-        skipped_year = 0
-        for f in prelev_lyr.getFeatures():
-            prelev_count += 1
-            if feedback.isCanceled():
-                break
-            y_raw = f[prelev_year_field]
-            y_int = parse_year_to_int(y_raw)
-            if y_int is None:
-                skipped_year += 1
-                continue
-            if y_int != year_param:
-                continue
-            id_raw = f[prelev_ouv_field]
-            if id_raw is None:
-                continue
-            key = str(id_raw).strip()
-            ass_raw = f[prelev_assiette_field]
-            ass = parse_number(ass_raw)
-            ass_val = 0.0 if math.isnan(ass) else ass
-            assiette_by_ouv[key] += ass_val
-            # conserver premier point rencontré comme géométrie (pour affectation spatiale)
-            if prelev_lyr.geometryType() != -1 and key not in geom_by_ouv:
-                geom = f.geometry()
-                if geom and not geom.isEmpty():
-                    geom_by_ouv[key] = geom
-            if prelev_count % 500 == 0:
-                feedback.setProgress(int(100 * prelev_count / max(1, prelev_lyr.featureCount())))
-        feedback.pushInfo(self.tr(f"Prélèvements parcourus: {prelev_count}, ignorés (année non parsable): {skipped_year}, ouvrages agrégés: {len(assiette_by_ouv)}"))
-
-        # ---------- 3) Conserver uniquement ouvrages qui ont une entrée autorisée (jointure possible) ----------
-        matched_ouvrages = {}
-        for k, ass_sum in assiette_by_ouv.items():
-            autor_ent = autor_index.get(k)
-            if autor_ent is None:
-                # on exclut les non appariés (consigne)
-                continue
-            vol_auth = autor_ent.get('vol_max')
-            if vol_auth is None or (isinstance(vol_auth, float) and math.isnan(vol_auth)):
-                vol_auth = None
-            ddtm_concat = ';'.join(sorted(autor_ent['ddtm'])) if autor_ent['ddtm'] else None
-            matched_ouvrages[k] = {'assiette': ass_sum, 'vol_autorise': vol_auth, 'ddtm': ddtm_concat, 'geom': geom_by_ouv.get(k)}
-
-        if not matched_ouvrages:
-            raise Exception(self.tr("Aucun ouvrage apparié aux volumes autorisés pour l'année et les données fournies."))
-
-        feedback.pushInfo(self.tr(f"Ouvrages appariés retenus : {len(matched_ouvrages)} (les non-appariés ont été exclus)."))
-
-        # ---------- 4) Affectation spatiale : ouvrages -> zones (multi-affectation : toutes les zones intersectées)
-        feedback.pushInfo(self.tr("Création d'un index spatial des zones..."))
-        zone_index = QgsSpatialIndex(zones_lyr.getFeatures())
-        # map fid -> label (et geometry feature)
-        fid2label = {}
-        fid2feat = {}
-        for zf in zones_lyr.getFeatures():
-            fid2label[zf.id()] = zf[zone_label_field]
-            fid2feat[zf.id()] = zf
-
-        zone_prelev_sum = defaultdict(float)   # key zone_label -> sum prelev
-        zone_autor_sum = defaultdict(float)    # key zone_label -> sum autor
-        zone_count_ouvrages = defaultdict(int)
-        # ensure unassigned key exists
-        zone_prelev_sum[UNASSIGNED_LABEL] = 0.0
-        zone_autor_sum[UNASSIGNED_LABEL] = 0.0
-        zone_count_ouvrages[UNASSIGNED_LABEL] = 0
-
-        # for diagnostics
-        iter_n = 0
-        for k, info in matched_ouvrages.items():
-            iter_n += 1
-            if feedback.isCanceled():
-                break
-            geom = info.get('geom')
-            assigned_any = False
-            if geom is None or geom.isEmpty():
-                # no geometry -> directly count as non-assigned
-                zone_prelev_sum[UNASSIGNED_LABEL] += info['assiette'] if info['assiette'] is not None else 0.0
-                if info['vol_autorise'] is not None and not (isinstance(info['vol_autorise'], float) and math.isnan(info['vol_autorise'])):
-                    zone_autor_sum[UNASSIGNED_LABEL] += info['vol_autorise']
-                zone_count_ouvrages[UNASSIGNED_LABEL] += 1
-                assigned_any = False
-            else:
-                # find candidate zone fids by bbox
-                candidates = zone_index.intersects(geom.boundingBox())
-                for fid in candidates:
-                    zfeat = fid2feat.get(fid)
-                    if zfeat is None:
-                        continue
+        timer.stage('Index des volumes autorisés')
+        autor_fields = [autor_ouv_field, autor_vol_field, autor_ddtm_field]
+        autor_sig, autor_source = layer_cache_key(autor_lyr, autor_fields)
+        autor_index = load_autor_index(autor_sig)
+        if autor_index is not None:
+            feedback.pushInfo(self.tr(f"Index volumes autorisés repris du cache : {len(autor_index)} clés (source inchangée)."))
+        else:
+            autor_keys = []
+            autor_vols = []
+            autor_ddtm = [] if autor_ddtm_field else None
+            autor_request = feature_request(autor_lyr, autor_fields, geometry=False)
+            for f in autor_lyr.getFeatures(autor_request):
+                autor_keys.append(f[autor_ouv_field])
+                autor_vols.append(f[autor_vol_field])
+                if autor_ddtm_field:
                     try:
-                        if zfeat.geometry().intersects(geom):
-                            label = fid2label.get(fid)
-                            # accumulate sums per label (string)
-                            zone_prelev_sum[label] += info['assiette'] if info['assiette'] is not None else 0.0
-                            if info['vol_autorise'] is not None and not (isinstance(info['vol_autorise'], float) and math.isnan(info['vol_autorise'])):
-                                zone_autor_sum[label] += info['vol_autorise']
-                            zone_count_ouvrages[label] += 1
-                            assigned_any = True
+                        autor_ddtm.append(f[autor_ddtm_field])
                     except Exception:
+                        autor_ddtm.append(None)
+            n_autor = len(autor_keys)
+            autor_index = build_autor_index(autor_keys, autor_vols, autor_ddtm)  # key -> {'vol_max': float or NaN, 'ddtm': set()}
+            feedback.pushInfo(self.tr(f"Index volumes autorisés : {len(autor_index)} clés construites (parcours {n_autor} enregistrements)."))
+            store_autor_index(autor_sig, autor_source, autor_index)
+        timer.rows(len(autor_index))
+
+        # ---------- 2) Prélèvements de l'année (ou de la fenêtre d'années) en colonnes nettoyées ----------
+        # depuis le cache local si la couche est un fichier inchangé ; sinon lecture complète mise en cache
+        # si les années demandées couvrent une bonne part de la couche, lecture limitée aux années demandées
+        # et aux champs utiles dans le cas contraire ou pour une source non fichier
+        timer.stage('Lecture des prélèvements')
+        prelev_has_geom = prelev_lyr.geometryType() != -1
+        window = (start_year, end_year) if all_years else (year_param, year_param)
+        prelev_request = feature_request(prelev_lyr, [prelev_year_field, prelev_ouv_field, prelev_assiette_field],
+                                         year_field=prelev_year_field, start_year=window[0], end_year=window[1],
+                                         geometry=prelev_has_geom)
+        specs = [(prelev_year_field, 'year'), (prelev_ouv_field, 'value'), (prelev_assiette_field, 'number')]
+        try:
+            fraction = request_fraction(prelev_lyr, year_field=prelev_year_field, start_year=window[0], end_year=window[1])
+            cols, origin = read_columns(prelev_lyr, specs, request=prelev_request, geometry=prelev_has_geom,
+                                        feedback=feedback, fraction=fraction)
+        except KeyError as e:
+            raise Exception(self.tr(f"Champ(s) introuvable(s) dans la couche prélèvements : {e}"))
+        if cols is None:
+            raise Exception(self.tr("Lecture des prélèvements annulée."))
+        feedback.pushInfo(self.tr(f"Colonnes des prélèvements : {len(cols)} entités ({origin})."))
+        prelev_count = len(cols)
+        timer.rows(prelev_count)
+        timer.stage('Agrégation par ouvrage et jointure', rows=prelev_count)
+        years, year_ok = cols.year(prelev_year_field)
+        skipped_year = int((~year_ok).sum())
+        in_window = year_ok
+        if all_years:
+            if start_year:
+                in_window = in_window & (years >= start_year)
+            if end_year:
+                in_window = in_window & (years <= end_year)
+        else:
+            in_window = in_window & (years == year_param)
+        rows = in_window.nonzero()[0]
+        col_year = years[rows].tolist()
+        col_ass = cols.number(prelev_assiette_field)[rows]  # assiettes déjà converties (float, NaN)
+        keys = clean_keys(cols.value(prelev_ouv_field, rows))
+        # ouvrage -> premier point rencontré (pour affectation spatiale)
+        first_row = {}
+        if prelev_has_geom:
+            with_geom = cols.has_geometry()[rows].tolist()
+            first_row = pick_by_key(keys, [r if (k is not None and g) else None for k, r, g in zip(keys, rows.tolist(), with_geom)], last=False)
+        sel = [i for i, k in enumerate(keys) if k is not None]
+        sel_keys = [keys[i] for i in sel]
+        if all_years:
+            # ---------- 3) Cube ouvrage x année, ouvrages appariés uniquement ----------
+            cube = build_year_cube(sel_keys, [col_year[i] for i in sel], col_ass[sel])
+            matched, vol_auth = autor_volumes(cube.keys, autor_index)
+            matched_rows = matched.nonzero()[0].tolist()
+            feedback.pushInfo(self.tr(f"Prélèvements parcourus: {prelev_count}, ignorés (année non parsable): {skipped_year}, "
+                                      f"ouvrages agrégés: {len(cube.keys)}, années: {cube.years.tolist()}"))
+            if not matched_rows:
+                raise Exception(self.tr("Aucun ouvrage apparié aux volumes autorisés pour la période et les données fournies."))
+            feedback.pushInfo(self.tr(f"Ouvrages appariés retenus : {len(matched_rows)} (les non-appariés ont été exclus)."))
+
+            # ---------- 4) Affectation spatiale : ouvrage -> zones intersectées, sinon UNASSIGNED_LABEL ----------
+            timer.stage('Affectation aux zones', rows=len(matched_rows))
+            zones_by_ouv = self._assign(zones_lyr, zone_label_field, prelev_lyr, cols,
+                                        {cube.keys[i]: first_row[cube.keys[i]] for i in matched_rows if cube.keys[i] in first_row},
+                                        feedback)
+            assign_rows = []
+            assign_labels = []
+            for i in matched_rows:
+                labels = zones_by_ouv.get(cube.keys[i])
+                for label in (labels or [UNASSIGNED_LABEL]):
+                    assign_rows.append(i)
+                    assign_labels.append(label)
+
+            # ---------- 5) Sommes zone x année et ratios de toutes les années en une passe ----------
+            timer.stage('Agrégation zone x année', rows=len(assign_rows))
+            zone_cube, hist = group_ratio_history(cube, vol_auth, assign_rows, assign_labels)
+            zone_row = zone_cube.row_index()
+
+            # ---------- 6) Sink : table longue zone x année (géométrie des zones, 'Non assigné' sans géométrie) ----------
+            timer.stage('Écriture des zones')
+            out_fields = QgsFields()
+            out_fields.append(QgsField(zone_label_field, QVariant.String))
+            out_fields.append(QgsField('annee', QVariant.Int))
+            out_fields.append(QgsField('prelev_sum', QVariant.Double))
+            out_fields.append(QgsField('autor_sum', QVariant.Double))
+            out_fields.append(QgsField('ratio', QVariant.Double))
+            out_fields.append(QgsField('ratio_possible', QVariant.Int))
+            out_fields.append(QgsField('percent_prelev_auth', QVariant.Double))
+            out_fields.append(QgsField('percent_overrun', QVariant.Double))
+            out_fields.append(QgsField('n_ouvrages', QVariant.Int))
+            # résumé par zone, répété sur chaque ligne
+            out_fields.append(QgsField('n_years', QVariant.Int))
+            out_fields.append(QgsField('n_years_overrun', QVariant.Int))
+            out_fields.append(QgsField('ratio_max', QVariant.Double))
+            out_fields.append(QgsField('year_ratio_max', QVariant.Int))
+
+            (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
+                                                   out_fields,
+                                                   zones_lyr.wkbType(), zones_lyr.sourceCrs())
+
+            outputs = [(zf[zone_label_field], zf.geometry()) for zf in zones_lyr.getFeatures()]
+            outputs.append((UNASSIGNED_LABEL, None))
+            progress = Progress(feedback, len(outputs))
+            with SinkWriter(sink) as out:
+                for label, geom in outputs:
+                    if progress.stopped():
+                        break
+                    i = zone_row.get(label)
+                    if i is None:
                         continue
-                if not assigned_any:
-                    # intersects no zone -> aggregate under UNASSIGNED_LABEL
-                    zone_prelev_sum[UNASSIGNED_LABEL] += info['assiette'] if info['assiette'] is not None else 0.0
-                    if info['vol_autorise'] is not None and not (isinstance(info['vol_autorise'], float) and math.isnan(info['vol_autorise'])):
-                        zone_autor_sum[UNASSIGNED_LABEL] += info['vol_autorise']
-                    zone_count_ouvrages[UNASSIGNED_LABEL] += 1
-            if iter_n % 200 == 0:
-                feedback.setProgress(int(100 * iter_n / max(1, len(matched_ouvrages))))
-        feedback.pushInfo(self.tr("Affectation spatiale terminée. Les ouvrages sans intersection ont été agrégés sous '{}'.".format(UNASSIGNED_LABEL)))
-
-        # ---------- 5) Calculs par zone : ratio, pourcentage, etc. ----------
-        zone_list = sorted(set(list(zone_prelev_sum.keys()) + list(zone_autor_sum.keys())))
-        if not zone_list:
-            raise Exception(self.tr("Aucune zone n'a reçu d'agrégats — vérifie intersections et géométries."))
-
-        zone_ratio = {}
-        zone_ratio_possible = {}
-        zone_percent_prelev_auth = {}
-        zone_percent_overrun = {}
-        for z in zone_list:
-            prelev = zone_prelev_sum.get(z, 0.0)
-            autor = zone_autor_sum.get(z)
-            if autor is None or (isinstance(autor, float) and math.isnan(autor)) or autor == 0:
-                zone_ratio_possible[z] = 0
-                zone_ratio[z] = None
-                zone_percent_prelev_auth[z] = None
-                zone_percent_overrun[z] = None
-            else:
-                try:
-                    r = prelev / autor
-                    zone_ratio[z] = r
-                    zone_ratio_possible[z] = 1
-                    zone_percent_prelev_auth[z] = r * 100.0
-                    zone_percent_overrun[z] = ((prelev - autor) / autor) * 100.0
-                except Exception:
-                    zone_ratio_possible[z] = 0
-                    zone_ratio[z] = None
-                    zone_percent_prelev_auth[z] = None
-                    zone_percent_overrun[z] = None
-
-        # ---------- 6) Préparer sink (couche de sortie = géométrie des polygones d'entrée + feature Non assigné sans géométrie) ----------
-        out_fields = QgsFields()
-        out_fields.append(QgsField(zone_label_field, QVariant.String))
-        out_fields.append(QgsField('prelev_sum', QVariant.Double))
-        out_fields.append(QgsField('autor_sum', QVariant.Double))
-        out_fields.append(QgsField('ratio', QVariant.Double))
-        out_fields.append(QgsField('ratio_possible', QVariant.Int))
-        out_fields.append(QgsField('percent_prelev_auth', QVariant.Double))
-        out_fields.append(QgsField('percent_overrun', QVariant.Double))
-        out_fields.append(QgsField('n_ouvrages', QVariant.Int))
-
-        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
-                                               out_fields,
-                                               zones_lyr.wkbType(), zones_lyr.sourceCrs())
-
-        # écrire : parcourir les features de zones et ajouter champs correspondants (pour conserver géométrie)
-        total_z = zones_lyr.featureCount()
-        cnt = 0
-        for zf in zones_lyr.getFeatures():
-            if feedback.isCanceled():
-                break
-            label = zf[zone_label_field]
-            prelev = zone_prelev_sum.get(label, 0.0)
-            autor = zone_autor_sum.get(label)
-            r = zone_ratio.get(label)
-            rpos = int(zone_ratio_possible.get(label, 0))
-            ppre = zone_percent_prelev_auth.get(label)
-            pover = zone_percent_overrun.get(label)
-            n_ouv = zone_count_ouvrages.get(label, 0)
-            feat = QgsFeature()
-            feat.setFields(out_fields)
-            try:
-                feat.setGeometry(zf.geometry())
-            except Exception:
-                pass
-            feat[zone_label_field] = str(label) if label is not None else None
-            feat['prelev_sum'] = float(prelev) if prelev is not None else None
-            feat['autor_sum'] = float(autor) if autor is not None else None
-            feat['ratio'] = float(r) if r is not None else None
-            feat['ratio_possible'] = int(rpos)
-            feat['percent_prelev_auth'] = float(ppre) if ppre is not None else None
-            feat['percent_overrun'] = float(pover) if pover is not None else None
-            feat['n_ouvrages'] = int(n_ouv)
-            try:
-                sink.addFeature(feat, QgsFeatureSink.FastInsert)
-            except TypeError:
-                sink.addFeature(feat)
-            cnt += 1
-            feedback.setProgress(int(100 * cnt / max(1, total_z)))
-
-        # écrire la feature "Non assigné" (sans géométrie) si elle contient quelque chose
-        un_prelev = zone_prelev_sum.get(UNASSIGNED_LABEL, 0.0)
-        un_n = zone_count_ouvrages.get(UNASSIGNED_LABEL, 0)
-        un_autor = zone_autor_sum.get(UNASSIGNED_LABEL)
-        if un_n > 0 or (un_prelev != 0.0) or (un_autor is not None):
-            feat_un = QgsFeature()
-            feat_un.setFields(out_fields)
-            # pas de géométrie (on laisse la géométrie None)
-            feat_un[zone_label_field] = UNASSIGNED_LABEL
-            feat_un['prelev_sum'] = float(un_prelev) if un_prelev is not None else None
-            feat_un['autor_sum'] = float(un_autor) if un_autor is not None else None
-            r_un = zone_ratio.get(UNASSIGNED_LABEL)
-            feat_un['ratio'] = float(r_un) if r_un is not None else None
-            feat_un['ratio_possible'] = int(zone_ratio_possible.get(UNASSIGNED_LABEL, 0))
-            feat_un['percent_prelev_auth'] = float(zone_percent_prelev_auth.get(UNASSIGNED_LABEL)) if zone_percent_prelev_auth.get(UNASSIGNED_LABEL) is not None else None
-            feat_un['percent_overrun'] = float(zone_percent_overrun.get(UNASSIGNED_LABEL)) if zone_percent_overrun.get(UNASSIGNED_LABEL) is not None else None
-            feat_un['n_ouvrages'] = int(un_n)
-            try:
-                # certains drivers acceptent la géométrie nulle ; on tente de l'ajouter sans géométrie
-                sink.addFeature(feat_un, QgsFeatureSink.FastInsert)
-            except TypeError:
+                    for j in zone_cube.mask[i].nonzero()[0].tolist():
+                        feat = QgsFeature()
+                        feat.setFields(out_fields)
+                        if geom is not None:
+                            try:
+                                feat.setGeometry(geom)
+                            except Exception:
+                                pass
+                        feat[zone_label_field] = str(label) if label is not None else None
+                        feat['annee'] = int(zone_cube.years[j])
+                        feat['prelev_sum'] = float(zone_cube.values[i, j])
+                        feat['autor_sum'] = optional_float(hist['autor_sum'][i, j])
+                        feat['ratio'] = optional_float(hist['ratio'][i, j])
+                        feat['ratio_possible'] = int(hist['ratio_possible'][i, j])
+                        feat['percent_prelev_auth'] = optional_float(hist['percent_prelev_auth'][i, j])
+                        feat['percent_overrun'] = optional_float(hist['percent_overrun'][i, j])
+                        feat['n_ouvrages'] = int(hist['n_ouvrages'][i, j])
+                        feat['n_years'] = int(hist['n_years'][i])
+                        feat['n_years_overrun'] = int(hist['n_years_overrun'][i])
+                        feat['ratio_max'] = optional_float(hist['ratio_max'][i])
+                        feat['year_ratio_max'] = int(hist['year_ratio_max'][i]) or None
+                        out.add(feat)
+            progress.finish()
+
+            feedback.pushInfo(self.tr(f"Ecriture terminée : {out.written} lignes zone x année écrites (dont '{UNASSIGNED_LABEL}')."))
+            timer.rows(out.written)
+        else:
+            ouv_keys, ass_sums = group_sum(sel_keys, col_ass[sel])
+            feedback.pushInfo(self.tr(f"Prélèvements parcourus: {prelev_count}, ignorés (année non parsable): {skipped_year}, ouvrages agrégés: {len(ouv_keys)}"))
+
+            # ---------- 3) Conserver uniquement ouvrages qui ont une entrée autorisée (jointure possible) ----------
+            matched_ouvrages = {}
+            for k, ass_sum in zip(ouv_keys.tolist(), ass_sums.tolist()):
+                autor_ent = autor_index.get(k)
+                if autor_ent is None:
+                    # on exclut les non appariés (consigne)
+                    continue
+                ddtm_concat = ';'.join(sorted(autor_ent['ddtm'])) if autor_ent['ddtm'] else None
+                matched_ouvrages[k] = {'assiette': ass_sum, 'vol_autorise': optional_float(autor_ent.get('vol_max')), 'ddtm': ddtm_concat}
+
+            if not matched_ouvrages:
+                raise Exception(self.tr("Aucun ouvrage apparié aux volumes autorisés pour l'année et les données fournies."))
+
+            feedback.pushInfo(self.tr(f"Ouvrages appariés retenus : {len(matched_ouvrages)} (les non-appariés ont été exclus)."))
+
+            # ---------- 4) Affectation spatiale : ouvrages -> zones (multi-affectation : toutes les zones intersectées)
+            timer.stage('Affectation aux zones', rows=len(matched_ouvrages))
+            zones_by_ouv = self._assign(zones_lyr, zone_label_field, prelev_lyr, cols,
+                                        {k: first_row[k] for k in matched_ouvrages if k in first_row}, feedback)
+
+            zone_prelev_sum = defaultdict(float)   # key zone_label -> sum prelev
+            zone_autor_sum = defaultdict(float)    # key zone_label -> sum autor
+            zone_count_ouvrages = defaultdict(int)
+            # ensure unassigned key exists
+            zone_prelev_sum[UNASSIGNED_LABEL] = 0.0
+            zone_autor_sum[UNASSIGNED_LABEL] = 0.0
+            zone_count_ouvrages[UNASSIGNED_LABEL] = 0
+
+            for k, info in matched_ouvrages.items():
+                # sans géométrie ou sans intersection -> agrégé sous UNASSIGNED_LABEL
+                for label in (zones_by_ouv.get(k) or [UNASSIGNED_LABEL]):
+                    # accumulate sums per label (string)
+                    zone_prelev_sum[label] += info['assiette'] if info['assiette'] is not None else 0.0
+                    if info['vol_autorise'] is not None:
+                        zone_autor_sum[label] += info['vol_autorise']
+                    zone_count_ouvrages[label] += 1
+            feedback.pushInfo(self.tr("Affectation spatiale terminée. Les ouvrages sans intersection ont été agrégés sous '{}'.".format(UNASSIGNED_LABEL)))
+
+            # ---------- 5) Calculs par zone : ratio, pourcentage, etc. ----------
+            timer.stage('Ratios par zone')
+            zone_list = sorted(set(list(zone_prelev_sum.keys()) + list(zone_autor_sum.keys())))
+            timer.rows(len(zone_list))
+            if not zone_list:
+                raise Exception(self.tr("Aucune zone n'a reçu d'agrégats — vérifie intersections et géométries."))
+
+            zr = ratio_indicators([zone_prelev_sum.get(z, 0.0) for z in zone_list],
+                                  [zone_autor_sum.get(z, float('nan')) for z in zone_list])
+            zone_ratio = dict(zip(zone_list, map(optional_float, zr['ratio'])))
+            zone_ratio_possible = dict(zip(zone_list, zr['ratio_possible'].tolist()))
+            zone_percent_prelev_auth = dict(zip(zone_list, map(optional_float, zr['percent_prelev_auth'])))
+            zone_percent_overrun = dict(zip(zone_list, map(optional_float, zr['percent_overrun'])))
+
+            # ---------- 6) Préparer sink (couche de sortie = géométrie des polygones d'entrée + feature Non assigné sans géométrie) ----------
+            timer.stage('Écriture des zones')
+            out_fields = QgsFields()
+            out_fields.append(QgsField(zone_label_field, QVariant.String))
+            out_fields.append(QgsField('prelev_sum', QVariant.Double))
+            out_fields.append(QgsField('autor_sum', QVariant.Double))
+            out_fields.append(QgsField('ratio', QVariant.Double))
+            out_fields.append(QgsField('ratio_possible', QVariant.Int))
+            out_fields.append(QgsField('percent_prelev_auth', QVariant.Double))
+            out_fields.append(QgsField('percent_overrun', QVariant.Double))
+            out_fields.append(QgsField('n_ouvrages', QVariant.Int))
+
+            (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
+                                                   out_fields,
+                                                   zones_lyr.wkbType(), zones_lyr.sourceCrs())
+
+            # écrire : parcourir les features de zones et ajouter champs correspondants (pour conserver géométrie)
+            progress = Progress(feedback, zones_lyr.featureCount())
+            with SinkWriter(sink) as out:
+                for zf in zones_lyr.getFeatures():
+                    if progress.stopped():
+                        break
+                    label = zf[zone_label_field]
+                    prelev = zone_prelev_sum.get(label, 0.0)
+                    autor = zone_autor_sum.get(label)
+                    r = zone_ratio.get(label)
+                    rpos = int(zone_ratio_possible.get(label, 0))
+                    ppre = zone_percent_prelev_auth.get(label)
+                    pover = zone_percent_overrun.get(label)
+                    n_ouv = zone_count_ouvrages.get(label, 0)
+                    feat = QgsFeature()
+                    feat.setFields(out_fields)
+                    try:
+                        feat.setGeometry(zf.geometry())
+                    except Exception:
+                        pass
+                    feat[zone_label_field] = str(label) if label is not None else None
+                    feat['prelev_sum'] = float(prelev) if prelev is not None else None
+                    feat['autor_sum'] = float(autor) if autor is not None else None
+                    feat['ratio'] = float(r) if r is not None else None
+                    feat['ratio_possible'] = int(rpos)
+                    feat['percent_prelev_auth'] = float(ppre) if ppre is not None else None
+                    feat['percent_overrun'] = float(pover) if pover is not None else None
+                    feat['n_ouvrages'] = int(n_ouv)
+                    out.add(feat)
+            progress.finish()
+            timer.rows(out.written)
+
+            # écrire la feature "Non assigné" (sans géométrie) si elle contient quelque chose
+            un_prelev = zone_prelev_sum.get(UNASSIGNED_LABEL, 0.0)
+            un_n = zone_count_ouvrages.get(UNASSIGNED_LABEL, 0)
+            un_autor = zone_autor_sum.get(UNASSIGNED_LABEL)
+            if un_n > 0 or (un_prelev != 0.0) or (un_autor is not None):
+                feat_un = QgsFeature()
+                feat_un.setFields(out_fields)
+                # pas de géométrie (on laisse la géométrie None)
+                feat_un[zone_label_field] = UNASSIGNED_LABEL
+                feat_un['prelev_sum'] = float(un_prelev) if un_prelev is not None else None
+                feat_un['autor_sum'] = float(un_autor) if un_autor is not None else None
+                r_un = zone_ratio.get(UNASSIGNED_LABEL)
+                feat_un['ratio'] = float(r_un) if r_un is not None else None
+                feat_un['ratio_possible'] = int(zone_ratio_possible.get(UNASSIGNED_LABEL, 0))
+                feat_un['percent_prelev_auth'] = float(zone_percent_prelev_auth.get(UNASSIGNED_LABEL)) if zone_percent_prelev_auth.get(UNASSIGNED_LABEL) is not None else None
+                feat_un['percent_overrun'] = float(zone_percent_overrun.get(UNASSIGNED_LABEL)) if zone_percent_overrun.get(UNASSIGNED_LABEL) is not None else None
+                feat_un['n_ouvrages'] = int(un_n)
                 try:
-                    sink.addFeature(feat_un)
-                except Exception:
-                    # si l'écriture sans géométrie échoue (rare), on lève une info mais pas d'erreur critique
-                    feedback.pushInfo(self.tr("Impossible d'écrire la feature 'Non assigné' sans géométrie avec ce fournisseur de sortie."))
+                    # certains drivers acceptent la géométrie nulle ; on tente de l'ajouter sans géométrie
+                    sink.addFeature(feat_un, QgsFeatureSink.FastInsert)
+                except TypeError:
+                    try:
+                        sink.addFeature(feat_un)
+                    except Exception:
+                        # si l'écriture sans géométrie échoue (rare), on lève une info mais pas d'erreur critique
+                        feedback.pushInfo(self.tr("Impossible d'écrire la feature 'Non assigné' sans géométrie avec ce fournisseur de sortie."))
 
-        feedback.pushInfo(self.tr(f"Ecriture terminée : {cnt} entités (zones) écrites + éventuelle entrée '{UNASSIGNED_LABEL}'."))
+            feedback.pushInfo(self.tr(f"Ecriture terminée : {out.written} entités (zones) écrites + éventuelle entrée '{UNASSIGNED_LABEL}'."))
 
         # ---------- 7) Appliquer QML si demandé ----------
+        if apply_qml:
+            timer.stage('Style QML')
         try:
             if apply_qml:
                 result_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
@@ -5,6 +5,9 @@ Calculer, pour chaque ouvrage identifié, l'évolution temporelle des volumes pr
 ## Sortie
 Couche (points ou mémoire) contenant par ouvrage : `ouvrage_id`, `slope_ouvrage`, `n_years_ouvrage`, `name_ouv`, `name_petitionaire`, `mean_vol_ouv`, `slope_pct_mean`, `slope_pct_first`, `cagr_pct`, `slope_pct_z`.
 
+Optionnel (fenêtres glissantes, longueur k > 0) : table ouvrage × fenêtre de k années entre l'année de début et l'année de fin :
+`ouvrage_id`, `window_start`, `window_end`, `n_years`, `slope`, `mean_vol`, `slope_pct_mean`, `cagr_pct` (accélération / ralentissement d'une tendance).
+
 ## Notes & recommandations
 - Theil-Sen est recommandé s'il existe des valeurs aberrantes.
 - Calculer les pentes sur des séries avec un nombre minimal d'années (paramétrable).
@@ -26,128 +29,42 @@ from qgis.core import (
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
+    QgsProcessingParameterFileDestination,
     QgsFeature,
     QgsField,
     QgsProject,
     QgsFields,
-    QgsFeatureSink,
     QgsProcessingUtils,
-    QgsSpatialIndex,
-    QgsProcessingException
+    QgsProcessingException,
+    QgsWkbTypes
 )
-import math
-from collections import defaultdict
-import re
 import os
-
-# Optional libs
-use_pandas = False
-use_numpy = False
-use_scipy = False
-try:
-    import pandas as pd
-    use_pandas = True
-except Exception:
-    pass
-try:
-    import numpy as np
-    use_numpy = True
-except Exception:
-    pass
-try:
-    from scipy.stats import theilslopes
-    use_scipy = True
-except Exception:
-    pass
-
-
-def parse_number(x):
-    """
-    Parse un nombre donné au format français ou anglais :
-    - Accepte 12000,56 ou 12 000,56 ou 12.000,56 ou 12000.56
-    - Supprime unités (ex: ' m3') et caractères non numériques
-    - Retourne float ou NaN
-    """
-    if x is None:
-        return float('nan')
-    if isinstance(x, (int, float)):
-        try:
-            return float(x)
-        except:
-            return float('nan')
-    s = str(x).strip()
-    if s == '':
-        return float('nan')
-    s = s.replace('\xa0', ' ')
-    s_nosp = s.replace(' ', '')
-    if '.' in s_nosp and ',' in s_nosp:
-        if s_nosp.find('.') < s_nosp.find(','):
-            s_clean = s_nosp.replace('.', '').replace(',', '.')
-        else:
-            s_clean = s_nosp.replace(',', '')
-    elif ',' in s_nosp:
-        s_clean = s_nosp.replace(',', '.')
-    else:
-        s_clean = s_nosp
-    s_clean = re.sub(r'[^0-9\.\-]', '', s_clean)
-    if s_clean in ['', '.', '-', '-.']:
-        return float('nan')
-    try:
-        return float(s_clean)
-    except:
-        return float('nan')
-
-
-def median_of_pairwise_slopes(xs, ys):
-    """Fallback Theil-Sen: médiane des pentes pairwise (O(n^2))."""
-    n = len(xs)
-    slopes = []
-    for i in range(n - 1):
-        for j in range(i + 1, n):
-            dx = xs[j] - xs[i]
-            if dx != 0:
-                slopes.append((ys[j] - ys[i]) / dx)
-    if not slopes:
-        return None
-    slopes.sort()
-    m = len(slopes)
-    if m % 2 == 1:
-        return float(slopes[m // 2])
-    else:
-        return float((slopes[m // 2 - 1] + slopes[m // 2]) / 2.0)
-
-
-def compute_slope_years(years, values, method='OLS'):
-    """Retourne la pente (units = vol / an). method: 'OLS' ou 'Theil-Sen'"""
-    pairs = [(y, v) for y, v in zip(years, values) if v is not None and not (isinstance(v, float) and math.isnan(v))]
-    if len(pairs) < 2:
-        return None
-    ys, vs = zip(*pairs)
-    if method == 'Theil-Sen':
-        try:
-            if use_scipy and use_numpy:
-                res = theilslopes(np.array(vs, dtype=float), np.array(ys, dtype=float))
-                return float(res[0])
-            else:
-                return median_of_pairwise_slopes(list(ys), list(vs))
-        except Exception:
-            return median_of_pairwise_slopes(list(ys), list(vs))
-    else:
-        try:
-            if use_numpy:
-                m, b = np.polyfit(np.array(ys, dtype=float), np.array(vs, dtype=float), 1)
-                return float(m)
-            else:
-                n = len(ys)
-                x_mean = sum(ys) / n
-                y_mean = sum(vs) / n
-                num = sum((xi - x_mean) * (yi - y_mean) for xi, yi in zip(ys, vs))
-                den = sum((xi - x_mean) ** 2 for xi in ys)
-                if den == 0:
-                    return None
-                return float(num / den)
-        except Exception:
-            return None
+import sys
+
+# moteur de calcul partagé (dossier vocal_core à côté de ce script)
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPT_DIR)
+from vocal_core import (
+    METHODS,
+    backend_summary,
+    run_stages,
+    SinkWriter,
+    Progress,
+    clean_text,
+    build_year_cube,
+    cube_slopes,
+    series_indicators,
+    pick_by_key,
+    optional_float,
+    PreparedZones,
+    rolling_indicators,
+    feature_request,
+    request_fraction,
+    read_columns,
+    rows_in_zones,
+    row_geometries,
+)
 
 
 class ComputeSlopesByOuvrage(QgsProcessingAlgorithm):
@@ -168,6 +85,9 @@ class ComputeSlopesByOuvrage(QgsProcessingAlgorithm):
     APPLY_QML = 'APPLY_QML'
     QML_PATH = 'QML_PATH'
     OUTPUT = 'OUTPUT'
+    WINDOW_LENGTH = 'WINDOW_LENGTH'    # fenêtres glissantes (0 = désactivé)
+    OUTPUT_WINDOWS = 'OUTPUT_WINDOWS'  # table ouvrage x fenêtre (optionnelle)
+    OUTPUT_REPORT = 'OUTPUT_REPORT'    # rapport JSON des étapes (optionnel)
 
     def tr(self, string):
         return string
@@ -190,7 +110,8 @@ class ComputeSlopesByOuvrage(QgsProcessingAlgorithm):
     def shortHelpString(self):
         return self.tr(
             "Calcule la pente (coef directeur) pour chaque ouvrage (somme par ouvrage×année). "
-            "Méthodes: OLS ou Theil-Sen. Produit aussi pentes en %/an et CAGR (moyenne 3 premières / 3 dernières années)."
+            "Méthodes: OLS ou Theil-Sen. Produit aussi pentes en %/an et CAGR (moyenne 3 premières / 3 dernières années). "
+            "Optionnel : pentes, %/an et CAGR de chaque fenêtre glissante de k années (table ouvrage x fenêtre)."
         )
 
     def initAlgorithm(self, config=None):
@@ -253,8 +174,25 @@ class ComputeSlopesByOuvrage(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Couche de sortie (pentes par ouvrage)"))
         )
+        self.addParameter(
+            QgsProcessingParameterNumber(self.WINDOW_LENGTH, self.tr("Fenêtres glissantes : longueur en années (0 = désactivé)"),
+                                         type=QgsProcessingParameterNumber.Integer, defaultValue=0, minValue=0)
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT_WINDOWS, self.tr("Table des pentes par fenêtre glissante (ouvrage x fenêtre)"),
+                                              QgsProcessing.TypeVector, optional=True, createByDefault=False)
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(self.OUTPUT_REPORT, self.tr("Rapport des étapes (durées, lignes, mémoire) en JSON"),
+                                                  'JSON (*.json)', optional=True, createByDefault=False)
+        )
 
     def processAlgorithm(self, parameters, context, feedback):
+        # étapes chronométrées (journal + rapport JSON optionnel)
+        return run_stages(self, parameters, context, feedback, self._process)
+
+    def _process(self, parameters, context, feedback, timer):
+        timer.stage('Paramètres')
         zone_layer = self.parameterAsVectorLayer(parameters, self.ZONE, context)
         if zone_layer is None:
             raise QgsProcessingException(self.tr("La couche zone d'étude n'a pas pu être chargée."))
@@ -276,277 +214,96 @@ class ComputeSlopesByOuvrage(QgsProcessingAlgorithm):
 
         vol_field = self.parameterAsString(parameters, self.VOL, context)
         method_idx = self.parameterAsInt(parameters, self.METHOD, context)
-        method = ['OLS', 'Theil-Sen'][method_idx]
+        method = METHODS[method_idx]
         min_years = int(self.parameterAsInt(parameters, self.MIN_YEARS, context))
         start_year = int(self.parameterAsInt(parameters, self.START_YEAR, context))
         end_year = int(self.parameterAsInt(parameters, self.END_YEAR, context))
         apply_qml = bool(self.parameterAsBool(parameters, self.APPLY_QML, context))
         qml_path_param = self.parameterAsString(parameters, self.QML_PATH, context)
+        window_length = int(self.parameterAsInt(parameters, self.WINDOW_LENGTH, context)) if self.WINDOW_LENGTH in parameters else 0
+
+        feedback.pushInfo(backend_summary())
 
-        # --- Préparer l'index spatial pour la couche zone ---
-        zone_feats = []
+        # --- Préparer les géométries de la zone (une seule fois, moteur GEOS préparé) ---
+        timer.stage('Zone d\'étude')
         try:
-            for zf in zone_layer.getFeatures():
-                zone_feats.append(zf)
-        except Exception:
-            zone_feats = []
+            zones = PreparedZones((zf.id(), zf.geometry()) for zf in zone_layer.getFeatures())
+        except Exception as e:
+            feedback.pushInfo(self.tr(f"Impossible de préparer les géométries de la zone : {e}"))
+            zones = PreparedZones([])
 
-        if not zone_feats:
+        if not len(zones):
             feedback.pushInfo(self.tr("Attention : la couche zone est vide -> aucun filtrage effectué (aucune entité)."))
-            zone_index = None
-            zone_feat_by_id = {}
         else:
-            # crée un index spatial pour accélérer les recherches d'intersection
-            try:
-                zone_index = QgsSpatialIndex()
-                zone_feat_by_id = {}
-                for zf in zone_feats:
-                    zone_index.insertFeature(zf)
-                    zone_feat_by_id[zf.id()] = zf
-                feedback.pushInfo(self.tr(f"Index spatial construit pour la couche zone ({len(zone_feats)} entités)."))
-            except Exception as e:
-                feedback.pushInfo(self.tr(f"Impossible de construire l'index spatial (fallback) : {e}"))
-                zone_index = None
-                zone_feat_by_id = {zf.id(): zf for zf in zone_feats}
-
-        # lecture et filtrage initial : on ne garde que les prélèvements qui intersectent la zone
-        rows = []
+            feedback.pushInfo(self.tr(f"Géométries de zone préparées ({len(zones)} entités)."))
+        timer.rows(len(zones))
+
+        # lecture en colonnes nettoyées (ouvrage, année, volume, nom, interlocuteur, x / y) :
+        # depuis le cache local si la couche est un fichier inchangé ; sinon lecture complète mise en cache
+        # si la requête (emprise de la zone, période, champs) couvre une bonne part de la couche, lecture
+        # limitée à la requête dans le cas contraire ou pour une source non fichier
+        timer.stage('Lecture des prélèvements')
         has_geometry = (layer.geometryType() != -1)
-        geom_by_ouvrage = {}
-        # mappings pour nom & interlocuteur (on garde la valeur associée à la DERNIERE année connue)
-        name_by_ouvrage = {}
-        name_year_by_ouvrage = {}        # stocke l'année associée à name_by_ouvrage
-        interloc_by_ouvrage = {}
-        interloc_year_by_ouvrage = {}
-
-        total = layer.featureCount()
-        processed = 0
-        kept_by_zone = 0
-        for f in layer.getFeatures():
-            processed += 1
-            if feedback.isCanceled():
-                break
-
-            # si la couche d'entrée a une géométrie, tester l'intersection avec la zone
-            if has_geometry:
-                try:
-                    fg = f.geometry()
-                except Exception:
-                    fg = None
-                if fg is None or fg.isEmpty():
-                    # pas de géométrie -> exclu
-                    feedback.setProgress(int(100 * processed / max(1, total)))
-                    continue
-
-                intersects_zone = False
-                if zone_index is not None:
-                    try:
-                        # recherche de candidats par bbox
-                        cand_ids = zone_index.intersects(fg.boundingBox())
-                        for cid in cand_ids:
-                            zf = zone_feat_by_id.get(cid)
-                            if zf is None:
-                                continue
-                            try:
-                                zg = zf.geometry()
-                                if zg is not None and not zg.isEmpty() and zg.intersects(fg):
-                                    intersects_zone = True
-                                    break
-                            except Exception:
-                                continue
-                    except Exception:
-                        # fallback : test direct sur toutes les géométries
-                        for zf in zone_feats:
-                            try:
-                                zg = zf.geometry()
-                                if zg is not None and not zg.isEmpty() and zg.intersects(fg):
-                                    intersects_zone = True
-                                    break
-                            except Exception:
-                                continue
-                else:
-                    # pas d'index : brute force
-                    for zf in zone_feats:
-                        try:
-                            zg = zf.geometry()
-                            if zg is not None and not zg.isEmpty() and zg.intersects(fg):
-                                intersects_zone = True
-                                break
-                        except Exception:
-                            continue
-
-                if not intersects_zone:
-                    # non dans la zone -> ignorer
-                    feedback.setProgress(int(100 * processed / max(1, total)))
-                    continue
-                else:
-                    kept_by_zone += 1
-
-            # récupérer champs
-            try:
-                y = f[year_field]
-                o = f[ouvrage_field]
-                v_raw = f[vol_field]
-            except Exception:
-                raise Exception(self.tr("Impossible de lire au moins un des champs fournis. Vérifie les paramètres."))
-
-            try:
-                yv = int(y)
-            except:
-                # année non convertible -> ignorer
-                feedback.setProgress(int(100 * processed / max(1, total)))
-                continue
-            if yv < start_year or yv > end_year:
-                feedback.setProgress(int(100 * processed / max(1, total)))
-                continue
-
-            # récupérer nom & interlocuteur (si champs fournis) -> on garde la valeur de la DERNIERE année
-            try:
-                if ouvrage_name_field:
-                    raw_name = f[ouvrage_name_field]
-                    if raw_name is not None and str(raw_name).strip() != '':
-                        prev_year = name_year_by_ouvrage.get(o, -9999)
-                        # on prend la valeur si l'année courante >= année stockée (garde la plus récente)
-                        if yv >= prev_year:
-                            name_by_ouvrage[o] = str(raw_name).strip()
-                            name_year_by_ouvrage[o] = yv
-            except Exception:
-                pass
-            try:
-                if interloc_field:
-                    raw_int = f[interloc_field]
-                    if raw_int is not None and str(raw_int).strip() != '':
-                        prev_year_i = interloc_year_by_ouvrage.get(o, -9999)
-                        if yv >= prev_year_i:
-                            interloc_by_ouvrage[o] = str(raw_int).strip()
-                            interloc_year_by_ouvrage[o] = yv
-            except Exception:
-                pass
-
-            vv = parse_number(v_raw)
-            rows.append((o, yv, vv))
-            if has_geometry and o not in geom_by_ouvrage:
-                try:
-                    geom_by_ouvrage[o] = f.geometry()
-                except Exception:
-                    pass
-            feedback.setProgress(int(100 * processed / max(1, total)))
-
-        feedback.pushInfo(self.tr(f"Prélèvements parcourus: {processed}, conservés après filtrage spatial: {kept_by_zone}, enregistrements retenus pour la période: {len(rows)}."))
-
-        if not rows:
-            raise Exception(self.tr("Aucune donnée lue après application du filtre zone / période."))
+        request = feature_request(
+            layer,
+            [ouvrage_field, year_field, vol_field, ouvrage_name_field, interloc_field],
+            rect=zones.extent if has_geometry else None,
+            year_field=year_field, start_year=start_year, end_year=end_year,
+            geometry=has_geometry,
+        )
+        specs = [(ouvrage_field, 'value'), (year_field, 'year'), (vol_field, 'number'),
+                 (ouvrage_name_field, 'value'), (interloc_field, 'value')]
+        try:
+            fraction = request_fraction(layer, rect=zones.extent if has_geometry else None,
+                                        year_field=year_field, start_year=start_year, end_year=end_year)
+            cols, origin = read_columns(layer, specs, request=request, geometry=has_geometry, feedback=feedback,
+                                        fraction=fraction)
+        except KeyError:
+            raise Exception(self.tr("Impossible de lire au moins un des champs fournis. Vérifie les paramètres."))
+        if cols is None:
+            raise Exception(self.tr("Lecture des prélèvements annulée."))
+        feedback.pushInfo(self.tr(f"Colonnes des prélèvements : {len(cols)} entités ({origin})."))
+        timer.rows(len(cols))
+
+        # filtres : période (année lisible), puis zone d'étude sur les lignes restantes
+        # (points testés par coordonnées distinctes sur les géométries préparées ; sans géométrie -> exclu)
+        timer.stage('Filtre période / zone', rows=len(cols))
+        years, year_ok = cols.year(year_field)
+        in_period = (year_ok & (years >= start_year) & (years <= end_year)).nonzero()[0]
+        if has_geometry:
+            sel = in_period[rows_in_zones(layer, cols, zones, in_period)]
+        else:
+            sel = in_period
+        col_ouv = cols.value(ouvrage_field, sel)
+        col_year = years[sel]
 
-        # --- AGREGATION DES VOLUMES PAR (ouvrage, year) ---
-        ouvrage_year_sum = defaultdict(float)   # key (ouvrage, year) -> sum
-        ouvrage_year_count_valid = defaultdict(int)
+        feedback.pushInfo(self.tr(f"Prélèvements parcourus: {len(cols)}, retenus pour la période: {len(in_period)}, conservés après filtrage spatial: {len(sel)}."))
 
-        for o, y, v in rows:
-            if v is None or (isinstance(v, float) and math.isnan(v)):
-                val = 0.0
-            else:
-                val = v
-            ouvrage_year_sum[(o, y)] += val
-            if not (v is None or (isinstance(v, float) and math.isnan(v))):
-                ouvrage_year_count_valid[(o, y)] += 1
-
-        # construire structure par ouvrage à partir des sommes
-        ouvrage_map = defaultdict(list)   # ouvrage -> list of (year, total)
-        for (o, y), tot in ouvrage_year_sum.items():
-            ouvrage_map[o].append((y, tot))
-
-        # calcul des pentes pour les ouvrages (sur les séries agrégées ouvrage x année)
-        ouvrage_to_slope = {}
-        ouvrage_to_nyears = {}
-        for o, lst in ouvrage_map.items():
-            lst_sorted = sorted(lst, key=lambda x: x[0])
-            yrs = [x[0] for x in lst_sorted]
-            vols = [x[1] for x in lst_sorted]
-            nyrs = len([val for val in vols if not (isinstance(val, float) and math.isnan(val))])
-            ouvrage_to_nyears[o] = nyrs
-            if nyrs >= min_years:
-                s = compute_slope_years(yrs, vols, method=method)
-            else:
-                s = None
-            ouvrage_to_slope[o] = s
-
-        # ---------- Normalisation en % / an et CAGR (moyennes 3 premières / 3 dernières années) ----------
-        ouvrage_mean_vol = {}
-        ouvrage_first3_mean = {}
-        ouvrage_last3_mean = {}
-        ouvrage_slope_pct_mean = {}
-        ouvrage_slope_pct_first = {}
-        ouvrage_cagr_pct = {}
-        ouvrage_first_last_years = {}
-
-        for o, lst in ouvrage_map.items():
-            lst_sorted = sorted(lst, key=lambda x: x[0])
-            vals = [v for (_, v) in lst_sorted if not (isinstance(v, float) and math.isnan(v))]
-            if vals:
-                ouvrage_mean_vol[o] = sum(vals) / len(vals)
-            else:
-                ouvrage_mean_vol[o] = float('nan')
-            non_nan_pairs = [(y, v) for (y, v) in lst_sorted if not (isinstance(v, float) and math.isnan(v))]
-            if non_nan_pairs:
-                first3 = [v for (_, v) in non_nan_pairs[:3]]
-                last3 = [v for (_, v) in non_nan_pairs[-3:]]
-                first3_mean = sum(first3) / len(first3) if first3 else float('nan')
-                last3_mean = sum(last3) / len(last3) if last3 else float('nan')
-                year_first = non_nan_pairs[0][0]
-                year_last = non_nan_pairs[-1][0]
-            else:
-                first3_mean = float('nan')
-                last3_mean = float('nan')
-                year_first = None
-                year_last = None
-            ouvrage_first3_mean[o] = first3_mean
-            ouvrage_last3_mean[o] = last3_mean
-            ouvrage_first_last_years[o] = (year_first, year_last)
-
-        for o in ouvrage_to_slope.keys():
-            slope = ouvrage_to_slope.get(o)
-            meanv = ouvrage_mean_vol.get(o)
-            first3 = ouvrage_first3_mean.get(o)
-            last3 = ouvrage_last3_mean.get(o)
-            # pct relatif par rapport à la moyenne
-            if slope is None or meanv is None or (isinstance(meanv, float) and math.isnan(meanv)) or meanv == 0:
-                ouvrage_slope_pct_mean[o] = None
-            else:
-                ouvrage_slope_pct_mean[o] = 100.0 * (slope / meanv)
-            # pct relatif par rapport à first3_mean
-            if slope is None or first3 is None or (isinstance(first3, float) and math.isnan(first3)) or first3 == 0:
-                ouvrage_slope_pct_first[o] = None
-            else:
-                ouvrage_slope_pct_first[o] = 100.0 * (slope / first3)
-            # CAGR using mean first3 / mean last3
-            year_first, year_last = ouvrage_first_last_years.get(o, (None, None))
-            if year_first is not None and year_last is not None and year_last > year_first and first3 is not None and last3 is not None and first3 > 0:
-                n_periods = year_last - year_first
-                try:
-                    cagr = (last3 / first3) ** (1.0 / n_periods) - 1.0
-                    ouvrage_cagr_pct[o] = 100.0 * cagr
-                except Exception:
-                    ouvrage_cagr_pct[o] = None
-            else:
-                ouvrage_cagr_pct[o] = None
-
-        # z-score on slope_pct_mean across ouvrages
-        all_pct = [v for v in list(ouvrage_slope_pct_mean.values()) if v is not None]
-        if len(all_pct) >= 2:
-            mean_pct = sum(all_pct) / len(all_pct)
-            sd_pct = (sum((x - mean_pct) ** 2 for x in all_pct) / (len(all_pct) - 1)) ** 0.5
-        else:
-            mean_pct = None
-            sd_pct = None
+        if not len(sel):
+            raise Exception(self.tr("Aucune donnée lue après application du filtre zone / période."))
 
-        ouvrage_slope_pct_z = {}
-        for o, pct in ouvrage_slope_pct_mean.items():
-            if pct is None or mean_pct is None or sd_pct is None or sd_pct == 0:
-                ouvrage_slope_pct_z[o] = None
-            else:
-                ouvrage_slope_pct_z[o] = (pct - mean_pct) / sd_pct
+        # --- AGREGATION DES VOLUMES PAR (ouvrage, year) : cube ouvrage x année ---
+        timer.stage('Agrégation ouvrage x année', rows=len(sel))
+        cube = build_year_cube(col_ouv, col_year, cols.number(vol_field)[sel])
+        name_by_ouvrage = pick_by_key(col_ouv, clean_text(cols.value(ouvrage_name_field, sel)), order=col_year) if ouvrage_name_field else {}
+        interloc_by_ouvrage = pick_by_key(col_ouv, clean_text(cols.value(interloc_field, sel)), order=col_year) if interloc_field else {}
+        # géométrie du premier enregistrement retenu par ouvrage, relue par fid (géométrie exacte de la couche)
+        geom_by_ouvrage = {}
+        if has_geometry:
+            first_row = pick_by_key(col_ouv, sel.tolist(), last=False)
+            geoms = row_geometries(layer, cols, first_row.values())
+            geom_by_ouvrage = {o: geoms[r] for o, r in first_row.items() if r in geoms}
+
+        # calcul des pentes (sur les séries agrégées ouvrage x année) puis normalisation en % / an,
+        # CAGR (moyennes 3 premières / 3 dernières années) et z-score de slope_pct_mean
+        # OLS : toutes les pentes en une opération matricielle sur la matrice ouvrage x année + masque
+        timer.stage(f'Pentes ({method})', rows=len(cube))
+        slopes = cube_slopes(cube, method=method, min_years=min_years)
+        ind = series_indicators(cube, slopes)
+        feedback.pushInfo(self.tr(f"Pentes ({method}) calculées pour {len(cube)} ouvrages x {len(cube.years)} années."))
 
         # --- PREPARER LE SINK DE SORTIE (QgsFields) ---
+        timer.stage('Écriture des ouvrages')
         out_fields = QgsFields()
         out_fields.append(QgsField('ouvrage_id', QVariant.String))
         out_fields.append(QgsField('ouvrage_name', QVariant.String))     # nouveau champ
@@ -564,52 +321,83 @@ class ComputeSlopesByOuvrage(QgsProcessingAlgorithm):
                                                out_fields,
                                                layer.wkbType(), layer.sourceCrs())
 
-        # remplir le sink (une ligne par ouvrage)
-        total2 = len(ouvrage_to_slope)
-        cnt = 0
-        for o in sorted(ouvrage_to_slope.keys()):
-            if feedback.isCanceled():
-                break
-            feat = QgsFeature()
-            feat.setFields(out_fields)
-            feat['ouvrage_id'] = str(o)
-            # new fields: name & interlocuteur (use stored mappings if present; these are values from the latest year seen)
-            try:
-                feat['ouvrage_name'] = name_by_ouvrage.get(o, None)
-            except Exception:
-                feat['ouvrage_name'] = None
-            try:
-                feat['interlocuteur'] = interloc_by_ouvrage.get(o, None)
-            except Exception:
-                feat['interlocuteur'] = None
-
-            val_ouv = ouvrage_to_slope.get(o)
-            feat['slope_ouvrage'] = float(val_ouv) if val_ouv is not None else None
-            feat['n_years_ouvrage'] = int(ouvrage_to_nyears.get(o, 0))
-            # mean volumes
-            feat['mean_vol_ouv'] = float(ouvrage_mean_vol.get(o)) if ouvrage_mean_vol.get(o) is not None else None
-            # normalized metrics
-            feat['slope_pct_mean'] = float(ouvrage_slope_pct_mean.get(o)) if ouvrage_slope_pct_mean.get(o) is not None else None
-            feat['slope_pct_first'] = float(ouvrage_slope_pct_first.get(o)) if ouvrage_slope_pct_first.get(o) is not None else None
-            feat['cagr_pct'] = float(ouvrage_cagr_pct.get(o)) if ouvrage_cagr_pct.get(o) is not None else None
-            feat['slope_pct_z'] = float(ouvrage_slope_pct_z.get(o)) if ouvrage_slope_pct_z.get(o) is not None else None
-            # geometry
-            if has_geometry and o in geom_by_ouvrage:
-                try:
-                    feat.setGeometry(geom_by_ouvrage[o])
-                except Exception:
-                    pass
-            # insertion dans le sink
-            try:
-                sink.addFeature(feat, QgsFeatureSink.FastInsert)
-            except TypeError:
-                sink.addFeature(feat)
-            cnt += 1
-            feedback.setProgress(int(100 * cnt / total2) if total2 > 0 else 100)
+        # remplir le sink (une ligne par ouvrage, cube.keys est déjà trié)
+        progress = Progress(feedback, len(cube))
+        with SinkWriter(sink) as out:
+            for i, o in enumerate(cube.keys):
+                if progress.stopped():
+                    break
+                feat = QgsFeature()
+                feat.setFields(out_fields)
+                feat['ouvrage_id'] = str(o)
+                # name & interlocuteur : valeurs de la dernière année connue
+                feat['ouvrage_name'] = name_by_ouvrage.get(o)
+                feat['interlocuteur'] = interloc_by_ouvrage.get(o)
+                feat['slope_ouvrage'] = optional_float(slopes[i])
+                feat['n_years_ouvrage'] = int(ind['n_years'][i])
+                # mean volumes
+                feat['mean_vol_ouv'] = optional_float(ind['mean'][i])
+                # normalized metrics
+                feat['slope_pct_mean'] = optional_float(ind['slope_pct_mean'][i])
+                feat['slope_pct_first'] = optional_float(ind['slope_pct_first'][i])
+                feat['cagr_pct'] = optional_float(ind['cagr_pct'][i])
+                feat['slope_pct_z'] = optional_float(ind['slope_pct_z'][i])
+                # geometry
+                if has_geometry and o in geom_by_ouvrage:
+                    try:
+                        feat.setGeometry(geom_by_ouvrage[o])
+                    except Exception:
+                        pass
+                # insertion dans le sink (par lots)
+                out.add(feat)
+        progress.finish()
+        timer.rows(out.written)
+
+        # --- FENETRES GLISSANTES (optionnel) : une ligne par ouvrage x fenêtre de k années ---
+        # OLS : différences de sommes cumulées par année (aucun réajustement par fenêtre) ;
+        # Theil-Sen : tenseur des pentes limité aux k colonnes de chaque fenêtre
+        dest_windows = None
+        if window_length > 0:
+            w_fields = QgsFields()
+            w_fields.append(QgsField('ouvrage_id', QVariant.String))
+            w_fields.append(QgsField('window_start', QVariant.Int))
+            w_fields.append(QgsField('window_end', QVariant.Int))
+            w_fields.append(QgsField('n_years', QVariant.Int))
+            w_fields.append(QgsField('slope', QVariant.Double))
+            w_fields.append(QgsField('mean_vol', QVariant.Double))
+            w_fields.append(QgsField('slope_pct_mean', QVariant.Double))
+            w_fields.append(QgsField('cagr_pct', QVariant.Double))
+            (w_sink, dest_windows) = self.parameterAsSink(parameters, self.OUTPUT_WINDOWS, context,
+                                                          w_fields, QgsWkbTypes.NoGeometry, layer.sourceCrs())
+            if w_sink is None:
+                feedback.pushInfo(self.tr("Fenêtres glissantes ignorées : aucune table de sortie n'est définie (OUTPUT_WINDOWS)."))
+            else:
+                timer.stage(f'Fenêtres glissantes ({window_length} ans)')
+                windows = rolling_indicators(cube, window_length, start=start_year, end=end_year, method=method, min_years=min_years)
+                with SinkWriter(w_sink) as w_out:
+                    for w in windows:
+                        if feedback.isCanceled():
+                            break
+                        for i in w['n_years'].nonzero()[0].tolist():
+                            feat = QgsFeature()
+                            feat.setFields(w_fields)
+                            feat['ouvrage_id'] = str(cube.keys[i])
+                            feat['window_start'] = w['start']
+                            feat['window_end'] = w['end']
+                            feat['n_years'] = int(w['n_years'][i])
+                            feat['slope'] = optional_float(w['slope'][i])
+                            feat['mean_vol'] = optional_float(w['mean'][i])
+                            feat['slope_pct_mean'] = optional_float(w['slope_pct_mean'][i])
+                            feat['cagr_pct'] = optional_float(w['cagr_pct'][i])
+                            w_out.add(feat)
+                feedback.pushInfo(self.tr(f"Fenêtres glissantes de {window_length} ans : {len(windows)} fenêtres, {w_out.written} lignes ouvrage x fenêtre."))
+                timer.rows(w_out.written)
 
         # ---------------------------
         # --- APPLIQUER LE QML (optionnel) ---
         # ---------------------------
+        if apply_qml:
+            timer.stage('Style QML')
         try:
             if apply_qml:
                 result_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
@@ -643,6 +431,6 @@ class ComputeSlopesByOuvrage(QgsProcessingAlgorithm):
         except Exception as e:
             feedback.pushInfo("Erreur lors de l'application du style QML : {}".format(e))
 
-        return {self.OUTPUT: dest_id}
+        return {self.OUTPUT: dest_id, self.OUTPUT_WINDOWS: dest_windows}
 
 # Sauvegarde le script dans Scripts > Tools et lance-le depuis la Toolbox.
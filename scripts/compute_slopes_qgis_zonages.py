@@ -10,125 +10,41 @@ from qgis.core import (
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterFileDestination,
     QgsFeature,
     QgsField,
     QgsProject,
     QgsFields,
-    QgsFeatureSink,
     QgsProcessingUtils,
-    QgsSpatialIndex,
 )
-import math
-from collections import defaultdict
-import re
 import os
-
-# Optional libs
-use_numpy = False
-use_scipy = False
-try:
-    import numpy as np
-    use_numpy = True
-except Exception:
-    pass
-try:
-    from scipy.stats import theilslopes
-    use_scipy = True
-except Exception:
-    pass
-
-
-def parse_number(x):
-    """
-    Parse un nombre donné au format français/anglais :
-    - Accepte "12 000,56" ou "12000.56" etc.
-    - Supprime unités et caractères non numériques
-    - Retourne float ou NaN
-    """
-    if x is None:
-        return float('nan')
-    if isinstance(x, (int, float)):
-        try:
-            return float(x)
-        except:
-            return float('nan')
-    s = str(x).strip()
-    if s == '':
-        return float('nan')
-    s = s.replace('\xa0', ' ')
-    s_nosp = s.replace(' ', '')
-    if '.' in s_nosp and ',' in s_nosp:
-        if s_nosp.find('.') < s_nosp.find(','):
-            s_clean = s_nosp.replace('.', '').replace(',', '.')
-        else:
-            s_clean = s_nosp.replace(',', '')
-    elif ',' in s_nosp:
-        s_clean = s_nosp.replace(',', '.')
-    else:
-        s_clean = s_nosp
-    s_clean = re.sub(r'[^0-9\.\-]', '', s_clean)
-    if s_clean in ['', '.', '-', '-.']:
-        return float('nan')
-    try:
-        return float(s_clean)
-    except:
-        return float('nan')
-
-
-def median_of_pairwise_slopes(xs, ys):
-    """Fallback Theil-Sen: médiane des pentes pairwise (O(n^2))."""
-    n = len(xs)
-    slopes = []
-    for i in range(n - 1):
-        for j in range(i + 1, n):
-            dx = xs[j] - xs[i]
-            if dx != 0:
-                slopes.append((ys[j] - ys[i]) / dx)
-    if not slopes:
-        return None
-    slopes.sort()
-    m = len(slopes)
-    if m % 2 == 1:
-        return float(slopes[m // 2])
-    else:
-        return float((slopes[m // 2 - 1] + slopes[m // 2]) / 2.0)
-
-
-def compute_slope_years(years, values, method='OLS'):
-    """
-    Retourne la pente (units = vol / an).
-    method: 'OLS' ou 'Theil-Sen'
-    """
-    pairs = [(y, v) for y, v in zip(years, values) if v is not None and not (isinstance(v, float) and math.isnan(v))]
-    if len(pairs) < 2:
-        return None
-    ys, vs = zip(*pairs)
-    if method == 'Theil-Sen':
-        try:
-            if use_scipy and use_numpy:
-                # theilslopes returns (slope, intercept, lower, upper)
-                res = theilslopes(np.array(vs, dtype=float), np.array(ys, dtype=float))
-                return float(res[0])
-            else:
-                return median_of_pairwise_slopes(list(ys), list(vs))
-        except Exception:
-            return median_of_pairwise_slopes(list(ys), list(vs))
-    else:
-        try:
-            if use_numpy:
-                m, b = np.polyfit(np.array(ys, dtype=float), np.array(vs, dtype=float), 1)
-                return float(m)
-            else:
-                n = len(ys)
-                x_mean = sum(ys) / n
-                y_mean = sum(vs) / n
-                num = sum((xi - x_mean) * (yi - y_mean) for xi, yi in zip(ys, vs))
-                den = sum((xi - x_mean) ** 2 for xi in ys)
-                if den == 0:
-                    return None
-                return float(num / den)
-        except Exception:
-            return None
+import sys
+
+# moteur de calcul partagé (dossier vocal_core à côté de ce script)
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+if _SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, _SCRIPT_DIR)
+from vocal_core import (
+    METHODS,
+    backend_summary,
+    run_stages,
+    SinkWriter,
+    Progress,
+    build_year_cube,
+    regroup_cube,
+    AssignmentMatrix,
+    cube_slopes,
+    series_indicators,
+    optional_float,
+    pick_by_key,
+    feature_request,
+    request_fraction,
+    read_columns,
+    assign_to_zones,
+    zone_parents,
+    plain_value,
+)
 
 
 class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
@@ -154,6 +70,10 @@ class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
     QML_PATH = 'QML_PATH'
     OUTPUT = 'OUTPUT'
     OUTPUT_ZONE_YEAR = 'OUTPUT_ZONE_YEAR'
+    ROLLUP_LAYERS = 'ROLLUP_LAYERS'    # zonages englobants, du plus fin au plus grossier (optionnel)
+    ROLLUP_FIELDS = 'ROLLUP_FIELDS'    # champs libellés de ces zonages, séparés par ';'
+    OUTPUT_ROLLUP = 'OUTPUT_ROLLUP'    # tous les niveaux dans une même couche (optionnel)
+    OUTPUT_REPORT = 'OUTPUT_REPORT'    # rapport JSON des étapes (optionnel)
 
     def tr(self, string):
         return string
@@ -178,7 +98,10 @@ class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
             "Agrège les volumes des ouvrages (points) par zone (multi-affectation si intersecte plusieurs zones), "
             "puis calcule la pente (OLS/Theil-Sen) par zone sur la période choisie. "
             "La géométrie utilisée pour assigner chaque ouvrage est celle de l'enregistrement "
-            "contenant l'année la plus récente disponible (dans la période)."
+            "contenant l'année la plus récente disponible (dans la période). "
+            "Option agrégation par niveaux : zonages englobants (ex : départements puis délégation) et leurs champs "
+            "libellés séparés par ';' ; chaque zone est rattachée à sa zone englobante et tous les niveaux sont "
+            "écrits dans une couche supplémentaire, sans nouvelle lecture ni jointure spatiale des ouvrages."
         )
 
     def initAlgorithm(self, config=None):
@@ -227,8 +150,30 @@ class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(
             QgsProcessingParameterFeatureSink(self.OUTPUT_ZONE_YEAR, self.tr("Table (zone x année) - optionnel (laisser vide si pas besoin)"))
         )
+        # optionnel : agrégation par niveaux (communes -> départements -> délégation)
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(self.ROLLUP_LAYERS, self.tr("Zonages englobants pour l'agrégation par niveaux (du plus fin au plus grossier)"),
+                                                 QgsProcessing.TypeVectorPolygon, optional=True)
+        )
+        self.addParameter(
+            QgsProcessingParameterString(self.ROLLUP_FIELDS, self.tr("Champs libellés des zonages englobants (séparés par ';', même ordre)"),
+                                         defaultValue='', optional=True)
+        )
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(self.OUTPUT_ROLLUP, self.tr("Couche tous niveaux (agrégation par niveaux)"),
+                                              QgsProcessing.TypeVectorPolygon, optional=True, createByDefault=False)
+        )
+        self.addParameter(
+            QgsProcessingParameterFileDestination(self.OUTPUT_REPORT, self.tr("Rapport des étapes (durées, lignes, mémoire) en JSON"),
+                                                  'JSON (*.json)', optional=True, createByDefault=False)
+        )
 
     def processAlgorithm(self, parameters, context, feedback):
+        # étapes chronométrées (journal + rapport JSON optionnel)
+        return run_stages(self, parameters, context, feedback, self._process)
+
+    def _process(self, parameters, context, feedback, timer):
+        timer.stage('Paramètres')
         zones_lyr = self.parameterAsVectorLayer(parameters, self.ZONES, context)
         zone_id_field = self.parameterAsString(parameters, self.ZONE_ID, context)
         ouvrages_lyr = self.parameterAsVectorLayer(parameters, self.OUVRAGES, context)
@@ -236,203 +181,93 @@ class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
         ouv_id_field = self.parameterAsString(parameters, self.OUV_ID, context)
         vol_field = self.parameterAsString(parameters, self.VOL, context)
         method_idx = self.parameterAsInt(parameters, self.METHOD, context)
-        method = ['OLS', 'Theil-Sen'][method_idx]
+        method = METHODS[method_idx]
         min_years = int(self.parameterAsInt(parameters, self.MIN_YEARS, context))
         start_year = int(self.parameterAsInt(parameters, self.START_YEAR, context))
         end_year = int(self.parameterAsInt(parameters, self.END_YEAR, context))
         apply_qml = bool(self.parameterAsBool(parameters, self.APPLY_QML, context))
         qml_path_param = self.parameterAsString(parameters, self.QML_PATH, context)
-
-        # 1) Lire les ouvrages : garder tous les enregistrements entre start_year et end_year
-        #    On enregistre pour chaque ouvrage :
-        #      - tous les tuples (year, volume)
-        #      - la géométrie associée à l'année la plus récente disponible (pour l'affectation spatiale)
-        rows = []  # tuples (ouv_id, year, vol)
-        geom_by_ouv_latest = {}  # ouv_id -> (year, geometry)
-        total = ouvrages_lyr.featureCount()
-        processed = 0
-        for f in ouvrages_lyr.getFeatures():
-            processed += 1
-            if feedback.isCanceled():
-                break
-            try:
-                y_raw = f[year_field]
-                o = f[ouv_id_field]
-                v_raw = f[vol_field]
-            except Exception:
-                raise Exception(self.tr("Impossible de lire au moins un des champs fournis dans la couche ouvrages. Vérifie les paramètres."))
-            # parse year
-            try:
-                yv = int(y_raw)
-            except:
-                # ignore non-numeric years
-                continue
-            if yv < start_year or yv > end_year:
-                continue
-            vv = parse_number(v_raw)
-            rows.append((o, yv, vv))
-            # geometry handling : keep geometry of most recent year per ouvrage
-            if ouvrages_lyr.geometryType() != -1:
-                geom = f.geometry()
-                prev = geom_by_ouv_latest.get(o)
-                if prev is None or (isinstance(prev[0], int) and yv > prev[0]):
-                    geom_by_ouv_latest[o] = (yv, geom)
-            feedback.setProgress(int(100 * processed / total) if total else 0)
-
-        if not rows:
+        # agrégation par zone : matrice d'affectation creuse (SciPy) si disponible
+        feedback.pushInfo(backend_summary(scipy=True))
+
+        # 1) Lire les ouvrages en colonnes nettoyées (ouvrage, année, volume, x / y) : depuis le cache local
+        #    si la couche est un fichier inchangé ; sinon lecture complète mise en cache si la période couvre
+        #    une bonne part de la couche, lecture limitée à la période et aux champs utiles dans le cas
+        #    contraire ou pour une source non fichier.
+        #    On garde tous les enregistrements entre start_year et end_year et, pour chaque ouvrage,
+        #    la géométrie associée à l'année la plus récente disponible (pour l'affectation spatiale)
+        timer.stage('Lecture des ouvrages')
+        has_geometry = ouvrages_lyr.geometryType() != -1
+        request = feature_request(ouvrages_lyr, [ouv_id_field, year_field, vol_field],
+                                  year_field=year_field, start_year=start_year, end_year=end_year,
+                                  geometry=has_geometry)
+        try:
+            fraction = request_fraction(ouvrages_lyr, year_field=year_field, start_year=start_year, end_year=end_year)
+            cols, origin = read_columns(ouvrages_lyr, [(ouv_id_field, 'value'), (year_field, 'year'), (vol_field, 'number')],
+                                        request=request, geometry=has_geometry, feedback=feedback, fraction=fraction)
+        except KeyError:
+            raise Exception(self.tr("Impossible de lire au moins un des champs fournis dans la couche ouvrages. Vérifie les paramètres."))
+        if cols is None:
+            raise Exception(self.tr("Lecture des ouvrages annulée."))
+        feedback.pushInfo(self.tr(f"Colonnes des ouvrages : {len(cols)} entités ({origin})."))
+        timer.rows(len(cols))
+        years, year_ok = cols.year(year_field)
+        sel = (year_ok & (years >= start_year) & (years <= end_year)).nonzero()[0]
+        if not len(sel):
             raise Exception(self.tr("Aucune donnée ouvrages valide pour la période sélectionnée."))
-
-        # 2) Construire dictionnaire ouvrage -> liste des (year, vol)
-        ouv_map = defaultdict(list)
-        for o, y, v in rows:
-            val = 0.0 if (v is None or (isinstance(v, float) and math.isnan(v))) else v
-            ouv_map[o].append((y, val))
-
-        # 3) Construire mapping ouvrage_id -> zones (multi-affectation)
-        #    On utilise la géométrie 'latest' pour l'ouvrage (si disponible)
-        feedback.pushInfo("Construction index spatial des zones...")
-        zone_index = QgsSpatialIndex(zones_lyr.getFeatures())
-        ouv_to_zones = defaultdict(list)  # ouv_id -> list of zone_ids
+        col_ouv = cols.value(ouv_id_field, sel)
+        col_year = years[sel]
+
+        # 2) Cube ouvrage x année (volumes NaN comptés 0)
+        timer.stage('Cube ouvrage x année', rows=len(sel))
+        ouv_cube = build_year_cube(col_ouv, col_year, cols.number(vol_field)[sel])
+
+        # géométrie 'latest' : premier enregistrement lu de l'année la plus récente de chaque ouvrage
+        latest_row = {}  # ouv_id -> ligne des colonnes
+        if has_geometry:
+            # plus grande année, à égalité le premier enregistrement lu (sel est croissant)
+            latest_row = pick_by_key(col_ouv, sel.tolist(), order=col_year * (len(cols) + 1) - sel)
+
+        # 3) Construire mapping ouvrage -> zones (multi-affectation)
+        #    On utilise la géométrie 'latest' pour l'ouvrage (si disponible) ; l'affectation est reprise
+        #    du cache pour les ouvrages déjà vus à la même position avec ce zonage
+        timer.stage('Affectation aux zones', rows=len(ouv_cube))
+        feedback.pushInfo("Affectation des ouvrages aux zones...")
+        zones_by_ouv, n_cached = assign_to_zones(zones_lyr, zone_id_field, ouvrages_lyr, cols, latest_row, feedback)
+        if n_cached:
+            feedback.pushInfo(f"Affectation reprise du cache pour {n_cached} ouvrages ; {len(zones_by_ouv) - n_cached} testés.")
+        assign_rows = []   # ligne du cube ouvrage
+        assign_zones = []  # zone_id correspondant (une entrée par couple ouvrage/zone)
         missing_geom_count = 0
-        for idx, (ouv, pairs) in enumerate(ouv_map.items()):
-            if feedback.isCanceled():
-                break
-            # get latest geometry
-            latest = geom_by_ouv_latest.get(ouv)
-            if latest is None:
-                missing_geom_count += 1
-                continue
-            geom = latest[1]
-            if geom is None or geom.isEmpty():
+        n_ouv = len(ouv_cube)
+        for idx, ouv in enumerate(ouv_cube.keys):
+            labels = zones_by_ouv.get(ouv)
+            if labels is None:
                 missing_geom_count += 1
                 continue
-            # find candidate zone feature ids by bbox
-            candidates = zone_index.intersects(geom.boundingBox())
-            # for each candidate, check real intersection
-            found = False
-            for fid in candidates:
-                z_feat = zones_lyr.getFeature(fid)
-                if z_feat is None:
-                    continue
-                z_geom = z_feat.geometry()
-                try:
-                    if z_geom.intersects(geom):
-                        zone_id = z_feat[zone_id_field]
-                        ouv_to_zones[ouv].append(zone_id)
-                        found = True
-                except Exception:
-                    # fallback: bounding box intersection already true, but geometry op failed; skip
-                    continue
-            # if no zone found, keep empty list (ouvrage non assigné)
-            if idx % 200 == 0:
-                feedback.setProgress(int(100.0 * idx / max(1, len(ouv_map))))
+            # si aucune zone trouvée, ouvrage non assigné
+            assign_rows.extend([idx] * len(labels))
+            assign_zones.extend(labels)
         if missing_geom_count > 0:
             feedback.pushInfo(f"{missing_geom_count} ouvrages sans géométrie 'latest' et non assignés à des zones.")
 
-        # 4) Agréger volumes par zone x year (multi-affectation -> ouvrage affecté à toutes les zones correspondantes)
-        zone_year_sum = defaultdict(float)   # (zone_id, year) -> sum volumes
-        zone_year_count_valid = defaultdict(int)
-        for o, pairs in ouv_map.items():
-            zones_for_o = ouv_to_zones.get(o, [])
-            if not zones_for_o:
-                # on n'affecte pas l'ouvrage s'il n'est dans aucune zone
-                continue
-            for (y, v) in pairs:
-                for zid in zones_for_o:
-                    zone_year_sum[(zid, y)] += v
-                    if not (v is None or (isinstance(v, float) and math.isnan(v))):
-                        zone_year_count_valid[(zid, y)] += 1
-
-        # 5) Construire structure zone -> list of (year, total)
-        zone_years_map = defaultdict(list)
-        for (z, y), tot in zone_year_sum.items():
-            zone_years_map[z].append((y, tot))
-
-        if not zone_years_map:
+        # 4) Agréger volumes par zone x year (multi-affectation -> ouvrage affecté à toutes les zones correspondantes) :
+        #    matrice creuse zone x ouvrage multipliée par le cube ouvrage x année
+        timer.stage('Agrégation zone x année', rows=len(assign_rows))
+        assignment = AssignmentMatrix(assign_rows, assign_zones, n_ouv)
+        feedback.pushInfo(f"Affectation : {assignment.nnz()} couples ouvrage/zone, {len(assignment)} zones touchées.")
+        zone_cube = regroup_cube(ouv_cube, assignment=assignment)
+        if not len(zone_cube):
             raise Exception(self.tr("Aucun agrégat zone×année n'a été produit (vérifie intersections / géométries)."))
 
-        # 6) Calculer pentes par zone (et metrics)
-        zone_to_slope = {}
-        zone_to_nyears = {}
-        zone_mean_vol = {}
-        zone_first3_mean = {}
-        zone_last3_mean = {}
-        zone_slope_pct_mean = {}
-        zone_slope_pct_first = {}
-        zone_cagr_pct = {}
-
-        # first compute slopes and n_years and means
-        for z, lst in zone_years_map.items():
-            lst_sorted = sorted(lst, key=lambda x: x[0])
-            yrs = [x[0] for x in lst_sorted]
-            tots = [x[1] for x in lst_sorted]
-            nyrs = len([val for val in tots if not (isinstance(val, float) and math.isnan(val))])
-            zone_to_nyears[z] = nyrs
-            if nyrs >= min_years:
-                s = compute_slope_years(yrs, tots, method=method)
-            else:
-                s = None
-            zone_to_slope[z] = s
-            vals = [v for (_, v) in lst_sorted if not (isinstance(v, float) and math.isnan(v))]
-            zone_mean_vol[z] = (sum(vals) / len(vals)) if vals else float('nan')
-            non_nan_pairs = [(y, v) for (y, v) in lst_sorted if not (isinstance(v, float) and math.isnan(v))]
-            if non_nan_pairs:
-                first3 = [v for (_, v) in non_nan_pairs[:3]]
-                last3 = [v for (_, v) in non_nan_pairs[-3:]]
-                first3_mean = sum(first3) / len(first3) if first3 else float('nan')
-                last3_mean = sum(last3) / len(last3) if last3 else float('nan')
-            else:
-                first3_mean = float('nan')
-                last3_mean = float('nan')
-            zone_first3_mean[z] = first3_mean
-            zone_last3_mean[z] = last3_mean
-
-        for z in zone_to_slope.keys():
-            slope = zone_to_slope.get(z)
-            meanv = zone_mean_vol.get(z)
-            first3 = zone_first3_mean.get(z)
-            last3 = zone_last3_mean.get(z)
-            if slope is None or meanv is None or (isinstance(meanv, float) and math.isnan(meanv)) or meanv == 0:
-                zone_slope_pct_mean[z] = None
-            else:
-                zone_slope_pct_mean[z] = 100.0 * (slope / meanv)
-            if slope is None or first3 is None or (isinstance(first3, float) and math.isnan(first3)) or first3 == 0:
-                zone_slope_pct_first[z] = None
-            else:
-                zone_slope_pct_first[z] = 100.0 * (slope / first3)
-            # CAGR using mean first3 / mean last3
-            lst_sorted = sorted(zone_years_map.get(z, []), key=lambda x: x[0])
-            if len(lst_sorted) >= 2:
-                year_first = lst_sorted[0][0]
-                year_last = lst_sorted[-1][0]
-                n_periods = year_last - year_first
-                if n_periods > 0 and first3 is not None and last3 is not None and first3 > 0:
-                    try:
-                        cagr = (last3 / first3) ** (1.0 / n_periods) - 1.0
-                        zone_cagr_pct[z] = 100.0 * cagr
-                    except Exception:
-                        zone_cagr_pct[z] = None
-                else:
-                    zone_cagr_pct[z] = None
-            else:
-                zone_cagr_pct[z] = None
-
-        # 7) z-score on slope_pct_mean across zones
-        all_pct = [v for v in list(zone_slope_pct_mean.values()) if v is not None]
-        if len(all_pct) >= 2:
-            mean_pct = sum(all_pct) / len(all_pct)
-            sd_pct = (sum((x - mean_pct) ** 2 for x in all_pct) / (len(all_pct) - 1)) ** 0.5
-        else:
-            mean_pct = None
-            sd_pct = None
-        zone_slope_pct_z = {}
-        for z, pct in zone_slope_pct_mean.items():
-            if pct is None or mean_pct is None or sd_pct is None or sd_pct == 0:
-                zone_slope_pct_z[z] = None
-            else:
-                zone_slope_pct_z[z] = (pct - mean_pct) / sd_pct
+        # 5) Calculer pentes par zone et indicateurs (pct / an, CAGR 3 premières / 3 dernières années, z-score)
+        timer.stage(f'Pentes ({method})', rows=len(zone_cube))
+        zone_slopes = cube_slopes(zone_cube, method=method, min_years=min_years)
+        ind = series_indicators(zone_cube, zone_slopes)
+        zone_row = zone_cube.row_index()
 
         # 8) Préparer sink de sortie (une ligne par zone)
+        timer.stage('Écriture des zones')
         out_fields = QgsFields()
         out_fields.append(QgsField(zone_id_field, QVariant.String))
         out_fields.append(QgsField('slope_zone', QVariant.Double))
@@ -448,30 +283,31 @@ class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
                                                zones_lyr.wkbType(), zones_lyr.sourceCrs())
 
         # remplir le sink : parcourir les features des zones et écrire les valeurs correspondantes (pour garder la géométrie originale)
-        total_z = zones_lyr.featureCount()
-        p = 0
-        for zf in zones_lyr.getFeatures():
-            p += 1
-            if feedback.isCanceled():
-                break
-            zid = zf[zone_id_field]
-            feat = QgsFeature()
-            feat.setFields(out_fields)
-            feat.setGeometry(zf.geometry())
-            feat[zone_id_field] = str(zid)
-            feat['slope_zone'] = float(zone_to_slope.get(zid)) if zone_to_slope.get(zid) is not None else None
-            feat['n_years_zone'] = int(zone_to_nyears.get(zid, 0))
-            feat['mean_vol_zone'] = float(zone_mean_vol.get(zid)) if zone_mean_vol.get(zid) is not None else None
-            feat['slope_pct_mean'] = float(zone_slope_pct_mean.get(zid)) if zone_slope_pct_mean.get(zid) is not None else None
-            feat['slope_pct_first'] = float(zone_slope_pct_first.get(zid)) if zone_slope_pct_first.get(zid) is not None else None
-            feat['cagr_pct'] = float(zone_cagr_pct.get(zid)) if zone_cagr_pct.get(zid) is not None else None
-            feat['slope_pct_z'] = float(zone_slope_pct_z.get(zid)) if zone_slope_pct_z.get(zid) is not None else None
-            # add feature
-            try:
-                sink.addFeature(feat, QgsFeatureSink.FastInsert)
-            except TypeError:
-                sink.addFeature(feat)
-            feedback.setProgress(int(100 * p / total_z) if total_z else 100)
+        progress = Progress(feedback, zones_lyr.featureCount())
+        with SinkWriter(sink) as out:
+            for zf in zones_lyr.getFeatures():
+                if progress.stopped():
+                    break
+                zid = zf[zone_id_field]
+                feat = QgsFeature()
+                feat.setFields(out_fields)
+                feat.setGeometry(zf.geometry())
+                feat[zone_id_field] = str(zid)
+                i = zone_row.get(zid)
+                if i is None:
+                    feat['n_years_zone'] = 0
+                else:
+                    feat['slope_zone'] = optional_float(zone_slopes[i])
+                    feat['n_years_zone'] = int(ind['n_years'][i])
+                    feat['mean_vol_zone'] = optional_float(ind['mean'][i])
+                    feat['slope_pct_mean'] = optional_float(ind['slope_pct_mean'][i])
+                    feat['slope_pct_first'] = optional_float(ind['slope_pct_first'][i])
+                    feat['cagr_pct'] = optional_float(ind['cagr_pct'][i])
+                    feat['slope_pct_z'] = optional_float(ind['slope_pct_z'][i])
+                # add feature (par lots)
+                out.add(feat)
+        progress.finish()
+        timer.rows(out.written)
 
         # 9) Optionnel : produire une table zone x year (utile pour diagnostics)
         (sink2, dest_id2) = self.parameterAsSink(parameters, self.OUTPUT_ZONE_YEAR, context,
@@ -506,22 +342,89 @@ class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
                 zy_fields.append(QgsField(zone_id_field, QVariant.String))
                 zy_fields.append(QgsField('year', QVariant.Int))
                 zy_fields.append(QgsField('sum_vol', QVariant.Double))
-                # add features from zone_year_sum
-                for (z, y), tot in sorted(zone_year_sum.items()):
-                    fzy = QgsFeature()
-                    fzy.setFields(zy_fields)
-                    fzy[zone_id_field] = str(z)
-                    fzy['year'] = int(y)
-                    fzy['sum_vol'] = float(tot) if tot is not None else None
-                    try:
-                        ctx_sink.addFeature(fzy, QgsFeatureSink.FastInsert)
-                    except TypeError:
-                        ctx_sink.addFeature(fzy)
+                # add features from the zone x year cube
+                timer.stage('Table zone x année')
+                with SinkWriter(ctx_sink) as zy_out:
+                    for z, y, tot in zone_cube.items():
+                        fzy = QgsFeature()
+                        fzy.setFields(zy_fields)
+                        fzy[zone_id_field] = str(z)
+                        fzy['year'] = int(y)
+                        fzy['sum_vol'] = float(tot) if tot is not None else None
+                        zy_out.add(fzy)
+                timer.rows(zy_out.written)
         except Exception:
             # ignore optional table write errors (not critical)
             pass
 
+        # 9 bis) Optionnel : agrégation par niveaux. Chaque zone est rattachée à sa zone englobante
+        #        (relation calculée une fois puis mise en cache) ; un ouvrage compte une fois par zone
+        #        englobante même s'il touche plusieurs zones filles. Le cube ouvrage x année n'est pas relu.
+        rollup_layers = self.parameterAsLayerList(parameters, self.ROLLUP_LAYERS, context) if self.ROLLUP_LAYERS in parameters else []
+        dest_rollup = None
+        if rollup_layers:
+            rollup_fields = [f.strip() for f in (self.parameterAsString(parameters, self.ROLLUP_FIELDS, context) or '').split(';')]
+            if len(rollup_fields) != len(rollup_layers) or not all(rollup_fields):
+                raise Exception(self.tr("Agrégation par niveaux : indiquer un champ libellé par zonage englobant (séparés par ';')."))
+            ru_fields = QgsFields()
+            ru_fields.append(QgsField('niveau', QVariant.String))
+            ru_fields.append(QgsField('zone', QVariant.String))
+            for name in ('slope_zone', 'n_years_zone', 'mean_vol_zone', 'slope_pct_mean', 'slope_pct_first', 'cagr_pct', 'slope_pct_z'):
+                ru_fields.append(QgsField(name, QVariant.Int if name == 'n_years_zone' else QVariant.Double))
+            (ru_sink, dest_rollup) = self.parameterAsSink(parameters, self.OUTPUT_ROLLUP, context,
+                                                          ru_fields, zones_lyr.wkbType(), zones_lyr.sourceCrs())
+            if ru_sink is None:
+                feedback.pushInfo(self.tr("Agrégation par niveaux ignorée : aucune table de sortie n'est définie (OUTPUT_ROLLUP)."))
+                rollup_layers = []
+        if rollup_layers:
+            timer.stage(f'Agrégation par niveaux ({len(rollup_layers) + 1} niveaux)')
+            ru_written = 0
+            levels = [(zones_lyr, zone_id_field)] + list(zip(rollup_layers, rollup_fields))
+            level_rows = assign_rows
+            level_zones = [plain_value(z) for z in assign_zones]
+            for depth, (level_lyr, level_field) in enumerate(levels):
+                if feedback.isCanceled():
+                    break
+                if level_lyr.fields().indexFromName(level_field) < 0:
+                    raise Exception(self.tr(f"Champ {level_field} introuvable dans {level_lyr.name()}."))
+                if depth:
+                    child_lyr, child_field = levels[depth - 1]
+                    parent_of, cached = zone_parents(child_lyr, child_field, level_lyr, level_field)
+                    pairs = sorted({(r, parent_of[z]) for r, z in zip(level_rows, level_zones) if z in parent_of})
+                    feedback.pushInfo(self.tr(f"Niveau {level_lyr.name()} : {len(parent_of)} zones rattachées"
+                                              f"{' (cache)' if cached else ''}, {len(pairs)} couples ouvrage/zone."))
+                    level_rows = [r for r, _ in pairs]
+                    level_zones = [z for _, z in pairs]
+                level_cube = regroup_cube(ouv_cube, assignment=AssignmentMatrix(level_rows, level_zones, n_ouv))
+                level_slopes = cube_slopes(level_cube, method=method, min_years=min_years)
+                level_ind = series_indicators(level_cube, level_slopes)
+                level_row = level_cube.row_index()
+                with SinkWriter(ru_sink) as ru_out:
+                    for zf in level_lyr.getFeatures():
+                        zid = plain_value(zf[level_field])
+                        feat = QgsFeature()
+                        feat.setFields(ru_fields)
+                        feat.setGeometry(zf.geometry())
+                        feat['niveau'] = level_lyr.name()
+                        feat['zone'] = str(zid)
+                        i = level_row.get(zid)
+                        if i is None:
+                            feat['n_years_zone'] = 0
+                        else:
+                            feat['slope_zone'] = optional_float(level_slopes[i])
+                            feat['n_years_zone'] = int(level_ind['n_years'][i])
+                            feat['mean_vol_zone'] = optional_float(level_ind['mean'][i])
+                            feat['slope_pct_mean'] = optional_float(level_ind['slope_pct_mean'][i])
+                            feat['slope_pct_first'] = optional_float(level_ind['slope_pct_first'][i])
+                            feat['cagr_pct'] = optional_float(level_ind['cagr_pct'][i])
+                            feat['slope_pct_z'] = optional_float(level_ind['slope_pct_z'][i])
+                        ru_out.add(feat)
+                ru_written += ru_out.written
+                timer.rows(ru_written)
+
         # 10) Appliquer le QML si demandé (sur la couche de sortie zones)
+        if apply_qml:
+            timer.stage('Style QML')
         try:
             if apply_qml:
                 result_layer = QgsProcessingUtils.mapLayerFromString(dest_id, context)
@@ -555,6 +458,7 @@ class ZonesSlopesAlgorithm(QgsProcessingAlgorithm):
         except Exception as e:
             feedback.pushInfo("Erreur lors de l'application du style QML : {}".format(e))
 
-        return {self.OUTPUT: dest_id, self.OUTPUT_ZONE_YEAR: dest_id2 if 'dest_id2' in locals() else None}
+        return {self.OUTPUT: dest_id, self.OUTPUT_ZONE_YEAR: dest_id2 if 'dest_id2' in locals() else None,
+                self.OUTPUT_ROLLUP: dest_rollup}
 
 # Fin du script - sauvegarder dans Processing > Scripts > Tools
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+vocal_core : moteur de calcul partagé par les scripts Processing du VOCAL et par le plugin.
+
+Le moteur travaille sur des colonnes entières (NumPy) plutôt que valeur par valeur :
+- parsing : conversion des assiettes (format français) et des années,
+- cube : agrégation clé × année (YearCube), affectation creuse ouvrages -> zones (AssignmentMatrix)
+  et indicateurs d'évolution,
+- slopes : pentes OLS / Theil-Sen (theilsen : Theil-Sen vectorisé),
+- prefix : sommes cumulées par année, OLS de n'importe quelle fenêtre d'années en temps constant
+  et balayage de fenêtres glissantes,
+- ratios : index des volumes autorisés et ratios VP/VA,
+- zones : zones d'étude préparées (GEOS) pour le filtrage spatial et affectation des ouvrages
+  aux zones d'un zonage (mise en cache),
+- columns : colonnes nettoyées d'une lecture de couche (FeatureColumns),
+- reading : requêtes de lecture réduites (emprise, années, champs) et lecture en colonnes,
+- cache : cache local des lectures coûteuses et des affectations aux zones (SQLite, .npy),
+  invalidé quand la source change,
+- backend : NumPy / SciPy importés au premier calcul (modules paresseux), moteur retenu pour le journal,
+- output : écriture des sorties par lots (SinkWriter) et avancement limité à quelques mises à jour
+  par seconde (Progress),
+- stages : durée, lignes, débit et pic mémoire de chaque étape d'un algorithme (journal, rapport JSON).
+
+Le paquet ne dépend pas de QGIS (zones et reading n'importent qgis.core qu'à l'usage) : il reste
+utilisable hors QGIS (tests, benchmarks). Son import ne charge ni NumPy ni SciPy.
+"""
+
+from .backend import (
+    backend_summary,
+    require_numpy,
+)
+from .parsing import (
+    parse_number,
+    parse_year_to_int,
+    year_parser,
+    parse_numbers,
+    parse_years,
+    clean_text,
+)
+from .cube import (
+    YearCube,
+    build_year_cube,
+    regroup_cube,
+    AssignmentMatrix,
+    factorize,
+    group_sum,
+    pick_by_key,
+    series_indicators,
+    zscore,
+    optional_float,
+)
+from .slopes import (
+    METHODS,
+    median_of_pairwise_slopes,
+    compute_slope_years,
+    ols_slopes,
+    cube_slopes,
+)
+from .prefix import PrefixStats, rolling_indicators
+from .theilsen import (
+    theil_sen_matrix,
+    theil_sen_long,
+)
+from .ratios import (
+    clean_keys,
+    build_autor_index,
+    ratio_indicators,
+    autor_volumes,
+    join_autor,
+    ratio_history,
+    group_ratio_history,
+)
+from .zones import (
+    PreparedZones,
+    assign_to_zones,
+    precompute_assignments,
+    zone_parents,
+    ZONAGE_SOURCE_PROPERTY,
+)
+from .reading import (
+    year_window_expression,
+    feature_request,
+    request_fraction,
+    layer_cache_key,
+    point_xy,
+    scan_columns,
+    scan_latest_year,
+    read_columns,
+    fetch_geometries,
+    rows_in_zones,
+    row_geometries,
+)
+from .columns import (
+    FeatureColumns,
+    ColumnsBuilder,
+    plain_value,
+)
+from .output import (
+    SinkWriter,
+    Progress,
+)
+from .stages import (
+    StageTimer,
+    run_stages,
+)
+from .cache import (
+    cache_dir,
+    source_signature,
+    load_autor_index,
+    store_autor_index,
+    load_columns,
+    store_columns,
+    load_zone_catalog,
+    store_zone_catalog,
+)
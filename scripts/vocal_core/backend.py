@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Dépendances optionnelles (NumPy, SciPy) importées à la demande.
+
+Importer vocal_core, ou un script qui l'utilise, ne charge ni NumPy ni SciPy : `np`, `sparse` et
+`stats` sont des modules paresseux, importés au premier attribut demandé (premier calcul).
+`backend_summary` indique dans le journal d'un algorithme le moteur retenu : Python pur, NumPy,
+NumPy + SciPy.
+"""
+
+import importlib
+
+
+class LazyModule:
+    """
+    Module importé au premier accès à l'un de ses attributs.
+    Après l'import, les attributs du module sont recopiés sur l'objet : les accès suivants
+    (np.float64, np.where, ...) ne repassent plus par __getattr__. Les méthodes propres sont
+    préfixées `_lazy_` pour ne pas masquer ni être masquées par celles du module (np.load, ...).
+    """
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_state'] = None  # None : pas encore essayé, False : import impossible
+
+    def _lazy_load(self):
+        """Module importé, ou None s'il n'est pas installé (ou ne s'importe pas)."""
+        state = self.__dict__['_lazy_state']
+        if state is None:
+            try:
+                state = importlib.import_module(self.__dict__['_lazy_name'])
+            except Exception:
+                state = False
+            else:
+                self.__dict__.update(vars(state))
+            self.__dict__['_lazy_state'] = state
+        return state or None
+
+    def __getattr__(self, attr):
+        module = self._lazy_load()
+        if module is None:
+            raise ImportError(f"{self.__dict__['_lazy_name']} n'est pas disponible.")
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<module paresseux {self.__dict__['_lazy_name']}>"
+
+
+np = LazyModule('numpy')
+sparse = LazyModule('scipy.sparse')
+stats = LazyModule('scipy.stats')
+
+
+def available(module):
+    """True si le module paresseux `module` s'importe (l'importe au premier appel)."""
+    return module._lazy_load() is not None
+
+
+def require_numpy():
+    """Lève une erreur explicite si NumPy n'est pas disponible (calculs colonne)."""
+    if not available(np):
+        raise ImportError("NumPy est requis pour le moteur de calcul VOCAL (vocal_core).")
+
+
+def backend_summary(scipy=False):
+    """
+    Ligne de journal décrivant le moteur de calcul : 'Python pur', 'NumPy x.y' ou 'NumPy x.y + SciPy x.y'.
+    scipy=True : l'algorithme utilise SciPy s'il est présent (matrices creuses, theilslopes) ;
+    sinon SciPy n'est ni importé ni mentionné.
+    """
+    if not available(np):
+        return "Moteur de calcul : Python pur (NumPy indisponible)"
+    text = f"Moteur de calcul : NumPy {np.__version__}"
+    if scipy:
+        if available(sparse) and available(stats):
+            import scipy
+            text += f" + SciPy {scipy.__version__}"
+        else:
+            text += " (SciPy indisponible : repli NumPy)"
+    return text
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+Cache local des lectures coûteuses, réutilisé tant que la source n'a pas changé.
+
+Une source est identifiée par sa signature : chemin du fichier, date de modification et taille
+(y compris le journal -wal d'un GeoPackage et le .dbf d'un shapefile), nombre d'entités,
+filtre de la couche et champs lus.
+Toute modification de la source change la signature : l'entrée est alors reconstruite et
+l'ancienne entrée de la même source est remplacée.
+
+Les sources qui ne sont pas des fichiers locaux (PostGIS, WFS, couches mémoire) n'ont pas de
+signature et ne sont jamais mises en cache. Le cache est un simple confort : toute erreur de
+lecture / écriture est ignorée et le calcul se fait comme sans cache.
+
+Quatre contenus :
+- l'index des volumes autorisés (SQLite, autor_index.sqlite),
+- l'affectation ouvrage -> zones d'un zonage (SQLite, zone_assign.sqlite), partagée par les
+  algorithmes par zonage : chaque ouvrage est mémorisé avec l'empreinte de sa géométrie et n'est
+  re-testé que s'il est nouveau ou a bougé ; un zonage modifié repart de zéro,
+- le catalogue des zones d'un GeoPackage de zonage (catalog/<empreinte du chemin>.json : couche,
+  champ libellé, valeurs distinctes avec emprise et fid), valable tant que le fichier n'a pas changé,
+- les colonnes nettoyées des prélèvements (columns/<signature>/ : fichiers .npy chargés avec
+  mmap_mode='r' + meta.json), complétées champ par champ quand un script en demande un nouveau,
+  et entité par entité quand la couche n'a reçu que des ajouts (previous_columns : cache de
+  l'état précédent de la même source).
+
+Emplacement : variable d'environnement VOCAL_CACHE_DIR (défaut ~/.cache/vocal) ;
+VOCAL_CACHE=0 désactive le cache.
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from .parsing import np
+from .columns import FeatureColumns, normalize_specs
+
+CACHE_DIR_ENV = 'VOCAL_CACHE_DIR'
+CACHE_SWITCH_ENV = 'VOCAL_CACHE'
+AUTOR_DB = 'autor_index.sqlite'
+ASSIGN_DB = 'zone_assign.sqlite'
+COLUMNS_DIR = 'columns'
+CATALOG_DIR = 'catalog'
+# attente maximale (s) d'un verrou SQLite posé par un autre poste / processus
+SQLITE_TIMEOUT = 30.0
+
+
+def cache_dir():
+    """Dossier du cache (créé au besoin), ou None si le cache est désactivé / inaccessible."""
+    if os.environ.get(CACHE_SWITCH_ENV, '1').strip().lower() in ('0', 'false', 'no', 'off'):
+        return None
+    path = os.environ.get(CACHE_DIR_ENV) or os.path.join(os.path.expanduser('~'), '.cache', 'vocal')
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError:
+        return None
+    return path
+
+
+def _file_state(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _companions(path):
+    """Fichiers annexes dont la modification change aussi les entités lues."""
+    root, ext = os.path.splitext(path)
+    if ext.lower() == '.shp':
+        return [root + '.dbf', root + '.DBF']
+    return [path + '-wal']
+
+
+def source_signature(path, feature_count, field_names, extra=None):
+    """
+    Signature (hex) d'une source fichier, ou None si `path` n'est pas un fichier local.
+    - feature_count : nombre d'entités annoncé par le fournisseur
+    - field_names : champs lus (l'ordre compte : il fixe la signification des colonnes)
+    - extra : éléments JSON supplémentaires (URI complète, filtre de couche, ...)
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    path = os.path.normcase(os.path.abspath(path))
+    try:
+        state = _file_state(path)
+        for other in _companions(path):
+            if os.path.isfile(other):
+                state += _file_state(other)
+    except OSError:
+        return None
+    payload = json.dumps([path, state, int(feature_count), [n or '' for n in field_names], extra],
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _connect(name):
+    folder = cache_dir()
+    if folder is None:
+        return None
+    return sqlite3.connect(os.path.join(folder, name), timeout=SQLITE_TIMEOUT)
+
+
+def _autor_schema(con):
+    con.execute('CREATE TABLE IF NOT EXISTS autor_source (sig TEXT PRIMARY KEY, source TEXT NOT NULL)')
+    con.execute('CREATE TABLE IF NOT EXISTS autor_entry (sig TEXT NOT NULL, key TEXT NOT NULL, vol_max REAL, ddtm TEXT NOT NULL)')
+    con.execute('CREATE INDEX IF NOT EXISTS autor_entry_sig ON autor_entry (sig)')
+
+
+def load_autor_index(signature):
+    """Index autorisé (format de build_autor_index) mémorisé pour cette signature, ou None."""
+    if signature is None:
+        return None
+    try:
+        con = _connect(AUTOR_DB)
+        if con is None:
+            return None
+        try:
+            _autor_schema(con)
+            if con.execute('SELECT 1 FROM autor_source WHERE sig = ?', (signature,)).fetchone() is None:
+                return None
+            rows = con.execute('SELECT key, vol_max, ddtm FROM autor_entry WHERE sig = ?', (signature,)).fetchall()
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError):
+        return None
+    return {k: {'vol_max': math.nan if v is None else float(v), 'ddtm': set(json.loads(d))} for k, v, d in rows}
+
+
+def store_autor_index(signature, source, autor_index):
+    """
+    Mémorise l'index pour `signature` et supprime les entrées plus anciennes de la même `source`
+    (identifiant stable de la lecture : URI + champs, sans l'état du fichier).
+    Retourne True si l'écriture a réussi.
+    """
+    if signature is None:
+        return False
+    try:
+        con = _connect(AUTOR_DB)
+        if con is None:
+            return False
+        try:
+            with con:
+                _autor_schema(con)
+                stale = [r[0] for r in con.execute('SELECT sig FROM autor_source WHERE source = ? OR sig = ?', (source, signature))]
+                for sig in stale:
+                    con.execute('DELETE FROM autor_entry WHERE sig = ?', (sig,))
+                    con.execute('DELETE FROM autor_source WHERE sig = ?', (sig,))
+                con.executemany(
+                    'INSERT INTO autor_entry (sig, key, vol_max, ddtm) VALUES (?, ?, ?, ?)',
+                    ((signature, k, None if math.isnan(e['vol_max']) else e['vol_max'], json.dumps(sorted(e['ddtm'])))
+                     for k, e in autor_index.items()))
+                con.execute('INSERT INTO autor_source (sig, source) VALUES (?, ?)', (signature, source))
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError):
+        return False
+    return True
+
+
+# ---------- affectation ouvrage -> zones ----------
+def _assign_schema(con):
+    con.execute('CREATE TABLE IF NOT EXISTS assign_source (sig TEXT PRIMARY KEY, source TEXT NOT NULL)')
+    con.execute('CREATE TABLE IF NOT EXISTS assign_entry (sig TEXT NOT NULL, key TEXT NOT NULL, geom TEXT NOT NULL, '
+                'zones TEXT NOT NULL, PRIMARY KEY (sig, key))')
+
+
+def assignment_key(key):
+    """Clé texte d'un identifiant d'ouvrage (JSON : 12 et '12' restent distincts)."""
+    return json.dumps(key, default=str)
+
+
+def load_assignments(signature):
+    """Affectations mémorisées pour ce zonage : clé texte -> (empreinte géométrie, [zones]) ; {} si rien."""
+    if signature is None:
+        return {}
+    try:
+        con = _connect(ASSIGN_DB)
+        if con is None:
+            return {}
+        try:
+            _assign_schema(con)
+            rows = con.execute('SELECT key, geom, zones FROM assign_entry WHERE sig = ?', (signature,)).fetchall()
+        finally:
+            con.close()
+        return {k: (g, json.loads(z)) for k, g, z in rows}
+    except (sqlite3.Error, OSError, ValueError):
+        return {}
+
+
+def store_assignments(signature, source, entries):
+    """
+    Ajoute / remplace les affectations `entries` (clé texte -> (empreinte, [zones])) de ce zonage et
+    supprime celles d'un état précédent de la même `source`. Retourne True si l'écriture a réussi.
+    """
+    if signature is None:
+        return False
+    try:
+        con = _connect(ASSIGN_DB)
+        if con is None:
+            return False
+        try:
+            with con:
+                _assign_schema(con)
+                stale = [r[0] for r in con.execute('SELECT sig FROM assign_source WHERE source = ? AND sig != ?', (source, signature))]
+                for sig in stale:
+                    con.execute('DELETE FROM assign_entry WHERE sig = ?', (sig,))
+                    con.execute('DELETE FROM assign_source WHERE sig = ?', (sig,))
+                con.execute('INSERT OR REPLACE INTO assign_source (sig, source) VALUES (?, ?)', (signature, source))
+                con.executemany(
+                    'INSERT OR REPLACE INTO assign_entry (sig, key, geom, zones) VALUES (?, ?, ?, ?)',
+                    ((signature, k, g, json.dumps(z)) for k, (g, z) in entries.items()))
+        finally:
+            con.close()
+    except (sqlite3.Error, OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+# ---------- catalogue des zones ----------
+def _catalog_file(path):
+    folder = cache_dir()
+    if folder is None or not path:
+        return None
+    path = os.path.normcase(os.path.abspath(path))
+    return os.path.join(folder, CATALOG_DIR, hashlib.sha1(path.encode('utf-8')).hexdigest() + '.json')
+
+
+def _catalog_state(path):
+    try:
+        return _file_state(path)
+    except OSError:
+        return None
+
+
+def load_zone_catalog(path):
+    """Catalogue mémorisé pour le fichier `path` s'il n'a pas changé depuis (date, taille), sinon None."""
+    target = _catalog_file(path)
+    state = _catalog_state(path)
+    if target is None or state is None:
+        return None
+    try:
+        with open(target, encoding='utf-8') as fh:
+            entry = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if entry.get('state') != state:
+        return None
+    return entry.get('catalog')
+
+
+def store_zone_catalog(path, catalog):
+    """Mémorise le catalogue (dict JSON) du fichier `path`. Retourne True si l'écriture a réussi."""
+    target = _catalog_file(path)
+    state = _catalog_state(path)
+    if target is None or state is None:
+        return False
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _write_atomic(target, lambda fh: json.dump({'state': state, 'catalog': catalog}, fh))
+    except (OSError, TypeError, ValueError):
+        return False
+    return True
+
+
+def _write_atomic(path, write, binary=False):
+    """
+    write(fichier) dans un fichier temporaire propre à cet appel (deux processus QGIS peuvent
+    écrire la même entrée), renommé en `path` une fois complet ; supprimé en cas d'échec.
+    """
+    fh = tempfile.NamedTemporaryFile('wb' if binary else 'w', encoding=None if binary else 'utf-8',
+                                     dir=os.path.dirname(path), prefix=os.path.basename(path) + '.',
+                                     suffix='.tmp', delete=False)
+    try:
+        with fh:
+            write(fh)
+        os.replace(fh.name, path)
+    except BaseException:
+        try:
+            os.remove(fh.name)
+        except OSError:
+            pass
+        raise
+
+
+# ---------- colonnes des prélèvements ----------
+def _columns_folder(signature):
+    folder = cache_dir()
+    if folder is None or signature is None:
+        return None
+    return os.path.join(folder, COLUMNS_DIR, signature)
+
+
+def _read_meta(folder):
+    try:
+        with open(os.path.join(folder, 'meta.json'), encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _column_base(field, kind):
+    return kind + '_' + hashlib.sha1(field.encode('utf-8')).hexdigest()[:16]
+
+
+def _save_npy(folder, name, arr):
+    path = os.path.join(folder, name + '.npy')
+    _write_atomic(path, lambda fh: np.save(fh, np.ascontiguousarray(arr)), binary=True)
+    return path
+
+
+def _load_npy(folder, name):
+    return np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')
+
+
+def load_columns(signature, specs, geometry=True):
+    """
+    Colonnes mémorisées pour cette signature -> (FeatureColumns ou None, specs manquantes).
+    None si rien n'est en cache (ou cache construit sans géométrie alors qu'elle est demandée).
+    """
+    specs = normalize_specs(specs)
+    folder = _columns_folder(signature)
+    if folder is None:
+        return None, specs
+    meta = _read_meta(folder)
+    if meta is None or (geometry and not meta.get('geometry')):
+        return None, specs
+    data = {}
+    missing = []
+    try:
+        base = [_load_npy(folder, n) for n in ('fid', 'x', 'y', 'complex')]
+        for field, kind in specs:
+            entry = meta['columns'].get(f"{kind}:{field}")
+            if entry is None:
+                missing.append((field, kind))
+                continue
+            name = entry['file']
+            if kind == 'number':
+                data[(field, kind)] = _load_npy(folder, name)
+            elif kind == 'year':
+                data[(field, kind)] = (_load_npy(folder, name), _load_npy(folder, name + '_valid'))
+            else:
+                with open(os.path.join(folder, name + '.json'), encoding='utf-8') as fh:
+                    data[(field, kind)] = (_load_npy(folder, name), json.load(fh))
+    except (OSError, ValueError, KeyError):
+        return None, specs
+    return FeatureColumns(*base, data, geometry=bool(meta.get('geometry'))), missing
+
+
+def previous_columns(source, signature):
+    """Signature d'un cache de colonnes de la même `source` construit pour un autre état du fichier, ou None."""
+    folder = _columns_folder(signature)
+    if folder is None:
+        return None
+    parent = os.path.dirname(folder)
+    try:
+        names = os.listdir(parent)
+    except OSError:
+        return None
+    for other in names:
+        meta = _read_meta(os.path.join(parent, other))
+        if other != signature and meta is not None and meta.get('source') == source:
+            return other
+    return None
+
+
+def store_columns(signature, source, cols):
+    """
+    Enregistre les colonnes de `cols` absentes du cache de cette signature (les lignes doivent
+    être celles du cache existant : même fid) ; supprime les caches périmés de la même `source`.
+    Retourne True si l'écriture a réussi ; sinon les fichiers écrits par cet appel sont supprimés
+    (aucun .npy orphelin sans meta.json).
+    """
+    folder = _columns_folder(signature)
+    if folder is None:
+        return False
+    created = False
+    written = []
+    try:
+        meta = _read_meta(folder)
+        if meta is not None and meta.get('n') != len(cols):
+            shutil.rmtree(folder, ignore_errors=True)
+            meta = None
+        if meta is None:
+            parent = os.path.dirname(folder)
+            if os.path.isdir(parent):
+                for other in os.listdir(parent):
+                    other_meta = _read_meta(os.path.join(parent, other))
+                    if other != signature and other_meta is not None and other_meta.get('source') == source:
+                        shutil.rmtree(os.path.join(parent, other), ignore_errors=True)
+            created = True
+            os.makedirs(folder, exist_ok=True)
+            for name in ('fid', 'x', 'y', 'complex'):
+                written.append(_save_npy(folder, name, getattr(cols, name)))
+            meta = {'source': source, 'n': len(cols), 'geometry': bool(cols.geometry), 'columns': {}}
+        for (field, kind), arr in cols.data.items():
+            cid = f"{kind}:{field}"
+            if cid in meta['columns']:
+                continue
+            name = _column_base(field, kind)
+            if kind == 'number':
+                written.append(_save_npy(folder, name, arr))
+            elif kind == 'year':
+                written.append(_save_npy(folder, name, arr[0]))
+                written.append(_save_npy(folder, name + '_valid', arr[1]))
+            else:
+                written.append(_save_npy(folder, name, arr[0]))
+                labels = arr[1]
+                path = os.path.join(folder, name + '.json')
+                _write_atomic(path, lambda fh: json.dump(labels, fh))
+                written.append(path)
+            meta['columns'][cid] = {'file': name}
+        _write_atomic(os.path.join(folder, 'meta.json'), lambda fh: json.dump(meta, fh))
+    except (OSError, ValueError, TypeError):
+        if created:
+            shutil.rmtree(folder, ignore_errors=True)
+        else:
+            for path in written:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return False
+    return True
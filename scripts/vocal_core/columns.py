@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Colonnes nettoyées d'une couche de prélèvements : une lecture QGIS -> tableaux NumPy.
+
+Chaque entité lue donne une ligne : fid, coordonnées x / y (point simple, NaN sinon) et
+les champs demandés, convertis une seule fois selon leur nature :
+- 'number' : float64 via parse_numbers (assiettes au format français), NaN si illisible,
+- 'year' : int64 via parse_years, avec masque de validité,
+- 'value' : valeurs brutes encodées par dictionnaire (codes int32, -1 = NULL) ; identifiants
+  et textes, que les scripts nettoient ensuite comme avant (clean_keys, clean_text).
+Les conversions se font par blocs de CHUNK_ROWS lignes pendant la lecture : seules les valeurs brutes
+d'un bloc sont gardées, mais les colonnes converties couvrent toutes les entités lues.
+`concat_columns` ajoute les entités d'une lecture incrémentale (nouvelle campagne) à des colonnes existantes.
+Le stockage disque (fichiers .npy mappables en mémoire) est dans cache.py.
+"""
+
+from array import array
+
+from .parsing import np, require_numpy, parse_numbers, parse_years
+
+KINDS = ('value', 'number', 'year')
+# taille des blocs convertis en cours de lecture
+CHUNK_ROWS = 65536
+
+
+def plain_value(v):
+    """Valeur d'attribut -> None / str / int / float (NULL QGIS -> None, autres types -> str)."""
+    if v is None or isinstance(v, (str, int, float)):
+        return v
+    try:
+        if v.isNull():
+            return None
+    except AttributeError:
+        pass
+    return str(v)
+
+
+def normalize_specs(specs):
+    """(champ, nature) sans doublon, champs vides ignorés ; nature inconnue -> ValueError."""
+    out = []
+    for field, kind in specs:
+        if not field:
+            continue
+        if kind not in KINDS:
+            raise ValueError(f"Nature de colonne inconnue : {kind}")
+        if (field, kind) not in out:
+            out.append((field, kind))
+    return out
+
+
+class FeatureColumns:
+    """
+    Colonnes alignées d'une lecture de couche.
+    - fid : identifiants QGIS (int64)
+    - x, y : coordonnées du point (float64, NaN sans géométrie ou si la géométrie n'est pas un point simple)
+    - complex : True si la géométrie n'est pas un point simple (à relire par fid pour les tests spatiaux)
+    - data : (champ, nature) -> float64 | (années int64, masque) | (codes int32, valeurs distinctes)
+    """
+
+    def __init__(self, fid, x, y, complex_mask, data, geometry=True):
+        self.fid = fid
+        self.x = x
+        self.y = y
+        self.complex = complex_mask
+        self.data = data
+        self.geometry = geometry
+
+    def __len__(self):
+        return self.fid.shape[0]
+
+    def has(self, field, kind):
+        return (field, kind) in self.data
+
+    def number(self, field):
+        return self.data[(field, 'number')]
+
+    def year(self, field):
+        """(années int64, masque des années lisibles)."""
+        return self.data[(field, 'year')]
+
+    def value(self, field, rows=None):
+        """Valeurs brutes (np.ndarray object, None pour NULL), pour toutes les lignes ou `rows`."""
+        codes, values = self.data[(field, 'value')]
+        lut = np.empty(len(values) + 1, dtype=object)
+        lut[:-1] = values
+        lut[-1] = None
+        return lut[codes if rows is None else codes[rows]]
+
+    def has_geometry(self):
+        """Masque des lignes ayant une géométrie (point lu ou géométrie complexe)."""
+        return np.isfinite(self.x) | self.complex
+
+    def take(self, rows):
+        """Sous-ensemble de lignes (copie, dictionnaires de valeurs partagés)."""
+        data = {}
+        for spec, arr in self.data.items():
+            if spec[1] == 'number':
+                data[spec] = arr[rows]
+            elif spec[1] == 'year':
+                data[spec] = (arr[0][rows], arr[1][rows])
+            else:
+                data[spec] = (arr[0][rows], arr[1])
+        return FeatureColumns(self.fid[rows], self.x[rows], self.y[rows], self.complex[rows], data, geometry=self.geometry)
+
+    def same_rows(self, other):
+        """True si les deux lectures ont les mêmes lignes (fid, coordonnées, valeurs converties)."""
+        if len(self) != len(other) or not (self.fid == other.fid).all() or not (self.complex == other.complex).all():
+            return False
+        for a, b in ((self.x, other.x), (self.y, other.y)):
+            if not ((a == b) | (np.isnan(a) & np.isnan(b))).all():
+                return False
+        for field, kind in self.data:
+            if (field, kind) not in other.data:
+                return False
+            if kind == 'number':
+                a, b = self.number(field), other.number(field)
+                if not ((a == b) | (np.isnan(a) & np.isnan(b))).all():
+                    return False
+            elif kind == 'year':
+                (ya, va), (yb, vb) = self.year(field), other.year(field)
+                if not (va == vb).all() or not (ya[va] == yb[vb]).all():
+                    return False
+            elif self.value(field).tolist() != other.value(field).tolist():
+                return False
+        return True
+
+
+class ColumnsBuilder:
+    """Accumule les entités lues et convertit les champs par blocs."""
+
+    def __init__(self, specs, geometry=True):
+        require_numpy()
+        self.specs = normalize_specs(specs)
+        self.geometry = geometry
+        self.fid = array('q')
+        self.x = array('d')
+        self.y = array('d')
+        self.complex = array('b')
+        self._buffers = {s: [] for s in self.specs if s[1] != 'value'}
+        self._parts = {s: [] for s in self.specs if s[1] != 'value'}
+        self._dicts = {s: {} for s in self.specs if s[1] == 'value'}
+        self._codes = {s: array('i') for s in self.specs if s[1] == 'value'}
+
+    def __len__(self):
+        return len(self.fid)
+
+    def add(self, fid, xy, values):
+        """
+        Ajoute une entité : `xy` = (x, y) d'un point simple, None sans géométrie,
+        False pour une géométrie non ponctuelle ; `values` dans l'ordre de `specs`.
+        """
+        self.fid.append(fid)
+        if xy:
+            self.x.append(xy[0])
+            self.y.append(xy[1])
+        else:
+            self.x.append(np.nan)
+            self.y.append(np.nan)
+        self.complex.append(xy is False)
+        for spec, v in zip(self.specs, values):
+            v = plain_value(v)
+            if spec[1] == 'value':
+                if v is None:
+                    self._codes[spec].append(-1)
+                else:
+                    d = self._dicts[spec]
+                    self._codes[spec].append(d.setdefault(v, len(d)))
+            else:
+                self._buffers[spec].append(v)
+        if self._buffers and len(self.fid) % CHUNK_ROWS == 0:
+            self._flush()
+
+    def _flush(self):
+        for spec, buf in self._buffers.items():
+            if not buf:
+                continue
+            if spec[1] == 'number':
+                self._parts[spec].append(parse_numbers(buf))
+            else:
+                self._parts[spec].append(parse_years(buf))
+            self._buffers[spec] = []
+
+    def finish(self):
+        self._flush()
+        data = {}
+        for spec in self.specs:
+            if spec[1] == 'value':
+                values = [None] * len(self._dicts[spec])
+                for v, c in self._dicts[spec].items():
+                    values[c] = v
+                data[spec] = (np.frombuffer(self._codes[spec], dtype=np.int32).copy(), values)
+            elif spec[1] == 'number':
+                parts = self._parts[spec]
+                data[spec] = np.concatenate(parts) if parts else np.empty(0, dtype=np.float64)
+            else:
+                parts = self._parts[spec]
+                if parts:
+                    data[spec] = (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+                else:
+                    data[spec] = (np.empty(0, dtype=np.int64), np.empty(0, dtype=bool))
+        return FeatureColumns(
+            np.frombuffer(self.fid, dtype=np.int64).copy(),
+            np.frombuffer(self.x, dtype=np.float64).copy(),
+            np.frombuffer(self.y, dtype=np.float64).copy(),
+            np.frombuffer(self.complex, dtype=np.int8).astype(bool),
+            data,
+            geometry=self.geometry,
+        )
+
+
+def concat_columns(first, second):
+    """Lignes de `first` suivies de celles de `second` (mêmes champs) ; dictionnaires de valeurs fusionnés."""
+    require_numpy()
+    data = {}
+    for spec, arr in first.data.items():
+        other = second.data[spec]
+        if spec[1] == 'number':
+            data[spec] = np.concatenate([arr, other])
+        elif spec[1] == 'year':
+            data[spec] = (np.concatenate([arr[0], other[0]]), np.concatenate([arr[1], other[1]]))
+        else:
+            values = list(arr[1])
+            index = {v: i for i, v in enumerate(values)}
+            # codes de `second` -> codes du dictionnaire fusionné (dernière case : NULL reste -1)
+            remap = np.full(len(other[1]) + 1, -1, dtype=np.int32)
+            for i, v in enumerate(other[1]):
+                if v not in index:
+                    index[v] = len(values)
+                    values.append(v)
+                remap[i] = index[v]
+            data[spec] = (np.concatenate([arr[0], remap[other[0]]]), values)
+    return FeatureColumns(
+        np.concatenate([first.fid, second.fid]),
+        np.concatenate([first.x, second.x]),
+        np.concatenate([first.y, second.y]),
+        np.concatenate([first.complex, second.complex]),
+        data,
+        geometry=first.geometry,
+    )
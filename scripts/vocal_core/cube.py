@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Cube dense clé (ouvrage ou zone) × année et indicateurs d'évolution associés.
+Toutes les opérations travaillent sur des colonnes NumPy : aucune boucle Python par ligne.
+Le passage ouvrages -> zones (multi-affectation) passe par une matrice d'affectation creuse
+zone × ouvrage (AssignmentMatrix, scipy.sparse si disponible) : un produit matriciel par agrégat.
+"""
+
+from .parsing import np, require_numpy
+from .backend import sparse, available
+
+# False : agrégation par np.add.at même si SciPy est installé (scipy.sparse importé au premier usage)
+use_sparse = True
+
+
+def factorize(keys):
+    """
+    Encode une colonne de clés -> (uniques, codes).
+    Les uniques sont triées si les clés sont comparables, sinon gardées dans l'ordre de rencontre.
+    """
+    require_numpy()
+    if isinstance(keys, np.ndarray) and keys.dtype.kind in 'biuU':
+        arr = keys
+    elif set(map(type, keys)) in ({str}, {int}):
+        # types homogènes : tri et encodage directement par NumPy
+        arr = np.asarray(keys)
+    else:
+        arr = None
+    if arr is not None and len(arr):
+        uniq, codes = np.unique(arr, return_inverse=True)
+        return uniq.astype(object), codes.reshape(-1).astype(np.int64)
+    index = {}
+    codes = np.fromiter((index.setdefault(k, len(index)) for k in keys), dtype=np.int64, count=len(keys))
+    uniq = np.empty(len(index), dtype=object)
+    uniq[:] = list(index.keys())
+    try:
+        order = sorted(range(len(uniq)), key=lambda i: uniq[i])
+    except TypeError:
+        return uniq, codes
+    order = np.asarray(order, dtype=np.int64)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    return uniq[order], rank[codes]
+
+
+def group_sum(keys, values):
+    """Somme de `values` par clé (NaN compté comme 0) -> (uniques, sommes)."""
+    uniq, codes = factorize(keys)
+    vals = np.nan_to_num(np.asarray(values, dtype=np.float64), nan=0.0)
+    return uniq, np.bincount(codes, weights=vals, minlength=len(uniq))
+
+
+def pick_by_key(keys, values, order=None, last=True):
+    """
+    Une valeur par clé parmi les lignes où `values` n'est pas None :
+    - last=True : ligne de plus grand `order` (à égalité, la dernière lue),
+    - last=False : première ligne lue.
+    Retourne un dict clé -> valeur.
+    """
+    require_numpy()
+    idx = np.fromiter((i for i, v in enumerate(values) if v is not None), dtype=np.int64)
+    if idx.size == 0:
+        return {}
+    uniq, codes = factorize([keys[i] for i in idx])
+    rows = np.arange(idx.size)
+    if last:
+        rank = np.zeros(idx.size) if order is None else np.asarray(order, dtype=np.float64)[idx]
+        sel = np.lexsort((rows, rank, codes))
+        take = sel[np.r_[codes[sel][1:] != codes[sel][:-1], True]]
+    else:
+        sel = np.lexsort((rows, codes))
+        take = sel[np.r_[True, codes[sel][1:] != codes[sel][:-1]]]
+    return {uniq[codes[t]]: values[idx[t]] for t in take.tolist()}
+
+
+class YearCube:
+    """
+    Cube dense clé × année.
+    - keys : identifiants (np.ndarray object), une ligne par clé
+    - years : années des colonnes (np.ndarray int64, croissantes)
+    - values : sommes annuelles (float64, 0 si absent)
+    - mask : True si au moins un enregistrement (clé, année) existe
+    """
+
+    def __init__(self, keys, years, values, mask):
+        self.keys = keys
+        self.years = years
+        self.values = values
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.keys)
+
+    def n_years(self):
+        return self.mask.sum(axis=1)
+
+    def row_index(self):
+        """Dictionnaire clé -> numéro de ligne."""
+        return {k: i for i, k in enumerate(self.keys)}
+
+    def items(self):
+        """Itère (clé, année, somme) sur les cellules présentes, triées par clé puis année."""
+        rows, cols = np.nonzero(self.mask)
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            yield self.keys[r], int(self.years[c]), float(self.values[r, c])
+
+
+class AssignmentMatrix:
+    """
+    Matrice d'affectation creuse groupe × ligne (ex : zone × ouvrage) : la ligne `rows[i]` appartient
+    au groupe `group_keys[i]` ; un couple répété compte plusieurs fois (comme une double affectation).
+    - keys : groupes (uniques de factorize), une ligne de matrice par groupe
+    - matrix : scipy.sparse.csr_matrix (n_groupes, n_lignes), None sans SciPy (repli np.add.at)
+    `aggregate(values)` donne les sommes groupe × colonne d'un tableau ligne × colonne (ex : années).
+    """
+
+    def __init__(self, rows, group_keys, n_rows):
+        require_numpy()
+        self.rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        self.keys, self.codes = factorize(group_keys)
+        self.n_rows = int(n_rows)
+        self.matrix = None
+        if use_sparse and available(sparse):
+            self.matrix = sparse.csr_matrix(
+                (np.ones(self.rows.size), (self.codes, self.rows)),
+                shape=(len(self.keys), self.n_rows))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def nnz(self):
+        """Nombre de couples (ligne, groupe) distincts."""
+        if self.matrix is not None:
+            return int(self.matrix.nnz)
+        return int(np.unique(self.codes * max(1, self.n_rows) + self.rows).size)
+
+    def aggregate(self, values):
+        """Sommes par groupe d'un tableau (n_lignes,) ou (n_lignes, k) -> (n_groupes,) ou (n_groupes, k)."""
+        values = np.asarray(values, dtype=np.float64)
+        if self.matrix is not None:
+            return np.asarray(self.matrix @ values)
+        out = np.zeros((len(self.keys),) + values.shape[1:])
+        if self.rows.size:
+            np.add.at(out, self.codes, values[self.rows])
+        return out
+
+    def any(self, mask):
+        """True si au moins une ligne du groupe a la cellule à True."""
+        return self.aggregate(np.asarray(mask, dtype=np.float64)) > 0
+
+
+def regroup_cube(cube, rows=None, group_keys=None, assignment=None):
+    """
+    Agrège les lignes d'un cube vers des groupes (ex : ouvrages -> zones, multi-affectation possible).
+    `rows[i]` (ligne du cube) est affectée au groupe `group_keys[i]` ; une ligne peut apparaître plusieurs fois.
+    `assignment` (AssignmentMatrix déjà construite sur les lignes du cube) remplace rows / group_keys
+    quand plusieurs agrégats partagent la même affectation.
+    Retourne un YearCube groupe × année (mêmes colonnes années).
+    """
+    require_numpy()
+    if assignment is None:
+        assignment = AssignmentMatrix(rows, group_keys, len(cube))
+    values = assignment.aggregate(cube.values)
+    mask = assignment.any(cube.mask)
+    # ne garder que les groupes ayant au moins une année
+    keep = mask.any(axis=1)
+    return YearCube(assignment.keys[keep], cube.years, values[keep], mask[keep])
+
+
+def build_year_cube(keys, years, volumes, start_year=None, end_year=None, valid=None):
+    """
+    Agrège des colonnes (clé, année, volume) en YearCube.
+    Les volumes NaN comptent pour 0 mais marquent l'année comme présente (comportement historique).
+    `valid` (optionnel) exclut des lignes (ex : année non parsable).
+    """
+    require_numpy()
+    years = np.asarray(years, dtype=np.int64)
+    volumes = np.asarray(volumes, dtype=np.float64)
+    keep = np.ones(years.shape[0], dtype=bool) if valid is None else np.asarray(valid, dtype=bool).copy()
+    if start_year is not None:
+        keep &= years >= int(start_year)
+    if end_year is not None:
+        keep &= years <= int(end_year)
+    if not keep.all():
+        idx = np.flatnonzero(keep)
+        keys = [keys[i] for i in idx] if not isinstance(keys, np.ndarray) else keys[idx]
+        years = years[idx]
+        volumes = volumes[idx]
+    uniq, codes = factorize(keys)
+    col_years, col_codes = np.unique(years, return_inverse=True)
+    col_codes = col_codes.reshape(-1)
+    n_k, n_y = len(uniq), len(col_years)
+    flat = codes * n_y + col_codes
+    sums = np.bincount(flat, weights=np.nan_to_num(volumes, nan=0.0), minlength=n_k * n_y)
+    counts = np.bincount(flat, minlength=n_k * n_y)
+    return YearCube(uniq, col_years.astype(np.int64), sums.reshape(n_k, n_y), (counts > 0).reshape(n_k, n_y))
+
+
+def _edge_means(values, mask, k=3):
+    """Moyenne des k premières et k dernières années présentes de chaque ligne."""
+    fwd = np.cumsum(mask, axis=1)
+    bwd = np.cumsum(mask[:, ::-1], axis=1)[:, ::-1]
+    first_sel = mask & (fwd <= k)
+    last_sel = mask & (bwd <= k)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        first = (values * first_sel).sum(axis=1) / first_sel.sum(axis=1)
+        last = (values * last_sel).sum(axis=1) / last_sel.sum(axis=1)
+    return first, last
+
+
+def zscore(values):
+    """z-score (écart-type d'échantillon) en ignorant les NaN ; NaN si < 2 valeurs ou écart-type nul."""
+    values = np.asarray(values, dtype=np.float64)
+    ok = np.isfinite(values)
+    out = np.full(values.shape, np.nan)
+    if ok.sum() < 2:
+        return out
+    sd = values[ok].std(ddof=1)
+    if sd == 0 or not np.isfinite(sd):
+        return out
+    out[ok] = (values[ok] - values[ok].mean()) / sd
+    return out
+
+
+def cagr_pct(first_mean, last_mean, year_first, year_last):
+    """
+    Taux de croissance annuel moyen (%) entre la moyenne des premières et des dernières années,
+    sur year_last - year_first années ; NaN si non calculable (base nulle ou négative, une seule année).
+    """
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        n_periods = (year_last - year_first).astype(np.float64)
+        ok = (n_periods > 0) & (first_mean > 0) & np.isfinite(last_mean)
+        cagr = np.full(np.shape(first_mean), np.nan)
+        cagr[ok] = 100.0 * (np.power(last_mean[ok] / first_mean[ok], 1.0 / n_periods[ok]) - 1.0)
+    # base négative (volumes négatifs) -> NaN plutôt qu'un nombre complexe
+    cagr[~np.isfinite(cagr)] = np.nan
+    return cagr
+
+
+def series_indicators(cube, slopes):
+    """
+    Indicateurs normalisés par ligne du cube, à partir des pentes (NaN si pas de pente) :
+    n_years, mean, first3_mean, last3_mean, year_first, year_last,
+    slope_pct_mean, slope_pct_first, cagr_pct, slope_pct_z.
+    Toutes les valeurs non calculables valent NaN.
+    """
+    require_numpy()
+    values, mask = cube.values, cube.mask
+    n_years = mask.sum(axis=1)
+    has = n_years > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(mask, values, 0.0).sum(axis=1) / n_years
+    first3, last3 = _edge_means(values, mask)
+    n_y = len(cube.years)
+    first_idx = np.argmax(mask, axis=1)
+    last_idx = n_y - 1 - np.argmax(mask[:, ::-1], axis=1) if n_y else first_idx
+    year_first = np.where(has, cube.years[first_idx] if n_y else 0, 0)
+    year_last = np.where(has, cube.years[last_idx] if n_y else 0, 0)
+
+    slopes = np.asarray(slopes, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        pct_mean = np.where(mean != 0, 100.0 * slopes / mean, np.nan)
+        pct_first = np.where(first3 != 0, 100.0 * slopes / first3, np.nan)
+    cagr = cagr_pct(first3, last3, year_first, year_last)
+
+    return {
+        'n_years': n_years,
+        'mean': mean,
+        'first3_mean': first3,
+        'last3_mean': last3,
+        'year_first': year_first,
+        'year_last': year_last,
+        'slope_pct_mean': pct_mean,
+        'slope_pct_first': pct_first,
+        'cagr_pct': cagr,
+        'slope_pct_z': zscore(pct_mean),
+    }
+
+
+def optional_float(x):
+    """NaN / None -> None, sinon float (pour l'écriture des attributs QGIS)."""
+    if x is None:
+        return None
+    x = float(x)
+    return None if x != x else x
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Écriture des sorties Processing et suivi d'avancement des boucles longues.
+
+- SinkWriter : entités mises en tampon puis écrites par lots (sink.addFeatures, FastInsert)
+  plutôt qu'une par une ;
+- Progress : setProgress au plus toutes les PROGRESS_INTERVAL secondes et isCanceled tous les
+  CHECK_ROWS pas, quel que soit le nombre de lignes parcourues (pas de flot de signaux Qt).
+"""
+
+import time
+
+# entités écrites par appel à addFeatures
+BATCH_SIZE = 4096
+# délai minimal (s) entre deux setProgress
+PROGRESS_INTERVAL = 0.25
+# pas entre deux tests d'annulation / de l'horloge
+CHECK_ROWS = 256
+
+
+class SinkWriter:
+    """
+    Écriture par lots dans un QgsFeatureSink (ou une couche) ; à utiliser en contexte :
+        with SinkWriter(sink) as out:
+            out.add(feat)
+    Le tampon restant est écrit en sortie de bloc (y compris après une annulation).
+    - written : nombre d'entités transmises au sink
+    """
+
+    def __init__(self, sink, batch_size=BATCH_SIZE):
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size))
+        self.buffer = []
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    def add(self, feat):
+        self.buffer.append(feat)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        from qgis.core import QgsFeatureSink
+
+        try:
+            self.sink.addFeatures(self.buffer, QgsFeatureSink.FastInsert)
+        except TypeError:
+            self.sink.addFeatures(self.buffer)
+        self.written += len(self.buffer)
+        self.buffer = []
+
+
+class Progress:
+    """
+    Avancement d'une boucle de `total` pas pour un QgsProcessingFeedback (ou None : rien à suivre).
+    `stopped()` compte un pas et renvoie True si l'utilisateur a annulé ; l'avancement n'est transmis
+    que toutes les `interval` secondes.
+    """
+
+    def __init__(self, feedback, total, interval=PROGRESS_INTERVAL):
+        self.feedback = feedback
+        self.total = max(1, int(total or 0))
+        self.interval = interval
+        self.count = 0
+        self.canceled = False
+        self._last = time.monotonic()
+
+    def stopped(self, n=1):
+        self.count += n
+        if self.feedback is None or self.count % CHECK_ROWS >= n:
+            return self.canceled
+        if self.feedback.isCanceled():
+            self.canceled = True
+            return True
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.feedback.setProgress(int(100 * min(self.count, self.total) / self.total))
+        return False
+
+    def finish(self):
+        """Avancement final (100 % si la boucle est allée au bout)."""
+        if self.feedback is not None:
+            self.feedback.setProgress(int(100 * min(self.count, self.total) / self.total))
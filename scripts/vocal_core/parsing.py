@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Conversion des valeurs brutes (assiettes au format français, années) en nombres.
+Deux niveaux :
+- fonctions scalaires `parse_number` / `parse_year_to_int` (comportement historique des scripts),
+- fonctions colonne `parse_numbers` / `parse_years` qui travaillent sur des colonnes entières
+  et retombent sur les fonctions scalaires uniquement pour les valeurs atypiques.
+"""
+
+import re
+
+# NumPy importé au premier calcul colonne (backend.LazyModule)
+from .backend import np, require_numpy
+
+
+# ---------- scalaires ----------
+def parse_number(x):
+    """
+    Parse un nombre donné au format français ou anglais :
+    - Accepte 12000,56 ou 12 000,56 ou 12.000,56 ou 12000.56
+    - Supprime unités (ex: ' m3') et caractères non numériques
+    - Retourne float ou NaN
+    """
+    if x is None:
+        return float('nan')
+    if isinstance(x, (int, float)):
+        try:
+            return float(x)
+        except:
+            return float('nan')
+    s = str(x).strip()
+    if s == '':
+        return float('nan')
+    s = s.replace('\xa0', ' ')
+    s_nosp = s.replace(' ', '')
+    if '.' in s_nosp and ',' in s_nosp:
+        # point avant virgule -> point = milliers, virgule = décimale
+        if s_nosp.find('.') < s_nosp.find(','):
+            s_clean = s_nosp.replace('.', '').replace(',', '.')
+        else:
+            s_clean = s_nosp.replace(',', '')
+    elif ',' in s_nosp:
+        s_clean = s_nosp.replace(',', '.')
+    else:
+        s_clean = s_nosp
+    s_clean = re.sub(r'[^0-9\.\-]', '', s_clean)
+    if s_clean in ['', '.', '-', '-.']:
+        return float('nan')
+    try:
+        return float(s_clean)
+    except:
+        return float('nan')
+
+
+def parse_year_to_int(y_raw):
+    """
+    Convertit une valeur d'année en int si possible.
+    Accepte int, float, chaînes numériques ou contenant une année sur 4 chiffres.
+    Retourne int ou None.
+    """
+    if y_raw is None:
+        return None
+    if isinstance(y_raw, int):
+        return y_raw
+    if isinstance(y_raw, float):
+        try:
+            return int(y_raw)
+        except:
+            pass
+    s = str(y_raw).strip()
+    if s == '':
+        return None
+    try:
+        return int(float(s))
+    except:
+        pass
+    m = re.search(r'(\d{4})', s)
+    if m:
+        try:
+            return int(m.group(1))
+        except:
+            return None
+    return None
+
+
+def year_parser():
+    """Retourne `parse_year_to_int` mémoïsée : les années n'ont que quelques valeurs distinctes."""
+    memo = {}
+
+    def parse(y_raw):
+        try:
+            return memo[y_raw]
+        except KeyError:
+            y = memo[y_raw] = parse_year_to_int(y_raw)
+            return y
+        except TypeError:
+            # valeur non hashable
+            return parse_year_to_int(y_raw)
+    return parse
+
+
+# ---------- colonnes ----------
+_KIND_NONE = 0
+_KIND_NUMBER = 1
+_KIND_OTHER = 2
+
+
+def _as_object_array(values):
+    if isinstance(values, np.ndarray):
+        return values
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = list(values)
+    return arr
+
+
+def _value_kinds(arr):
+    """0 = None, 1 = int/float natif, 2 = autre (chaîne, QVariant...)."""
+    return np.fromiter(
+        (_KIND_NONE if v is None else (_KIND_NUMBER if isinstance(v, (int, float)) else _KIND_OTHER) for v in arr),
+        dtype=np.int8, count=arr.shape[0]
+    )
+
+
+def _map_unique(arr, func, dtype, fill):
+    """Applique `func` (scalaire) une seule fois par valeur distincte de `arr`."""
+    out = np.full(arr.shape[0], fill, dtype=dtype)
+    if arr.shape[0] == 0:
+        return out
+    cache = {}
+    for i, v in enumerate(arr):
+        try:
+            r = cache[v]
+        except KeyError:
+            r = cache[v] = func(v)
+        except TypeError:
+            # valeur non hashable
+            r = func(v)
+        if r is not None:
+            out[i] = r
+    return out
+
+
+def _clean_number_strings(s):
+    """Applique les règles de séparateurs de parse_number sur un tableau de chaînes numpy."""
+    s = np.char.replace(np.char.replace(np.char.strip(s), '\xa0', ''), ' ', '')
+    dot = np.char.find(s, '.')
+    comma = np.char.find(s, ',')
+    both = (dot >= 0) & (comma >= 0)
+    dot_first = both & (dot < comma)
+    comma_first = both & ~dot_first
+    comma_only = (comma >= 0) & (dot < 0)
+    out = s.copy()
+    if dot_first.any():
+        out[dot_first] = np.char.replace(np.char.replace(s[dot_first], '.', ''), ',', '.')
+    if comma_first.any():
+        out[comma_first] = np.char.replace(s[comma_first], ',', '')
+    if comma_only.any():
+        out[comma_only] = np.char.replace(s[comma_only], ',', '.')
+    return out
+
+
+def _ascii_mask(strings):
+    """Masque des chaînes (array unicode) sans caractère hors ASCII, lu sur les points de code UCS-4."""
+    codes = np.ascontiguousarray(strings).view(np.uint32).reshape(strings.shape[0], -1)
+    return (codes < 128).all(axis=1)
+
+
+def parse_numbers(values):
+    """
+    Version colonne de `parse_number` : séquence / array -> np.ndarray float64 (NaN si non parsable).
+    Les colonnes déjà numériques sont converties directement ; les chaînes sont nettoyées
+    par opérations vectorisées, seules les valeurs atypiques repassent par `parse_number`.
+    """
+    require_numpy()
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        return values.astype(np.float64)
+    arr = _as_object_array(values)
+    out = np.full(arr.shape[0], np.nan, dtype=np.float64)
+    if arr.shape[0] == 0:
+        return out
+    kinds = _value_kinds(arr)
+    num = kinds == _KIND_NUMBER
+    if num.any():
+        out[num] = arr[num].astype(np.float64)
+    other = np.flatnonzero(kinds == _KIND_OTHER)
+    if other.size == 0:
+        return out
+    cleaned = _clean_number_strings(arr[other].astype(str))
+    # chaînes "simples" (chiffres ASCII, au plus un point, signe '-' en tête) -> conversion directe ;
+    # '1.2.3', '1-2' ou les chiffres non ASCII ('１２') restent à la version scalaire,
+    # sans entraîner le reste du bloc
+    digits = np.char.replace(np.char.replace(cleaned, '.', ''), '-', '')
+    simple = (np.char.isdigit(digits)
+              & _ascii_mask(digits)
+              & (np.char.count(cleaned, '.') <= 1)
+              & (np.char.count(cleaned, '-') <= 1)
+              & (np.char.find(cleaned, '-') <= 0))
+    if simple.any():
+        idx = np.flatnonzero(simple)
+        try:
+            out[other[idx]] = cleaned[idx].astype(np.float64)
+        except ValueError:
+            # chiffres que float() refuse (ex : exposants '²') : conversion valeur par valeur
+            # de ce sous-ensemble, les échecs passent à la version scalaire
+            for i in idx.tolist():
+                try:
+                    out[other[i]] = float(cleaned[i])
+                except ValueError:
+                    simple[i] = False
+    rest = other[~simple]
+    if rest.size:
+        out[rest] = _map_unique(arr[rest], parse_number, np.float64, np.nan)
+    return out
+
+
+def parse_years(values):
+    """
+    Version colonne de `parse_year_to_int`.
+    Retourne (years, valid) : np.ndarray int64 (0 si invalide) et masque booléen des années lues.
+    Les années ayant peu de valeurs distinctes, les chaînes sont converties une fois par valeur.
+    """
+    require_numpy()
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biu':
+        return values.astype(np.int64), np.ones(values.shape[0], dtype=bool)
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        valid = np.isfinite(values)
+        years = np.zeros(values.shape[0], dtype=np.int64)
+        years[valid] = values[valid].astype(np.int64)
+        return years, valid
+    arr = _as_object_array(values)
+    years = np.zeros(arr.shape[0], dtype=np.int64)
+    valid = np.zeros(arr.shape[0], dtype=bool)
+    if arr.shape[0] == 0:
+        return years, valid
+    missing = -(2 ** 62)
+    parsed = _map_unique(arr, parse_year_to_int, np.int64, missing)
+    valid = parsed != missing
+    years[valid] = parsed[valid]
+    return years, valid
+
+
+def clean_text(values):
+    """Colonne de textes -> liste de chaînes strip() (None si vide)."""
+    out = []
+    for v in values:
+        if v is None:
+            out.append(None)
+            continue
+        s = str(v).strip()
+        out.append(s if s != '' else None)
+    return out
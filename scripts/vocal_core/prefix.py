@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Sommes cumulées par année (n, Σx, Σy, Σxy, Σx²) des lignes d'un YearCube (ouvrages ou zones).
+
+Une fois le cube agrégé, la pente OLS, la moyenne et slope_pct_mean de n'importe quelle fenêtre
+[start, end] s'obtiennent par différence de deux colonnes cumulées : coût constant par ligne,
+quelle que soit la longueur de la fenêtre. Les années sont comptées depuis une origine fixe
+(milieu de la plage du cube) pour limiter les erreurs d'arrondi des sommes.
+Les moyennes des 3 premières / dernières années présentes d'une fenêtre (base du CAGR) viennent
+de sommes cumulées dans l'ordre des années présentes de chaque ligne.
+`rolling_indicators` balaie toutes les fenêtres glissantes de k années d'un cube en une passe.
+"""
+
+from .parsing import np, require_numpy
+from .cube import YearCube, cagr_pct
+
+
+class PrefixStats:
+    """
+    Sommes cumulées d'un cube clé × année.
+    - keys, years : ceux du cube
+    - origin : année de référence des x
+    - cum : tableau (5, n_lignes, n_années + 1) de n, Σx, Σy, Σxy, Σx² cumulés (colonne 0 = 0)
+    - present : colonnes des années présentes de chaque ligne, en tête et dans l'ordre des années
+    - present_cum : Σy cumulé dans cet ordre (colonne 0 = 0)
+    """
+
+    def __init__(self, cube, origin=None):
+        require_numpy()
+        self.keys = cube.keys
+        self.years = np.asarray(cube.years, dtype=np.int64)
+        if origin is None:
+            origin = (int(self.years[0]) + int(self.years[-1])) / 2.0 if len(self.years) else 0.0
+        self.origin = float(origin)
+        w = np.asarray(cube.mask, dtype=np.float64)
+        x = (self.years - self.origin).astype(np.float64)[None, :]
+        y = np.where(cube.mask, cube.values, 0.0)
+        n_rows = w.shape[0]
+        self.cum = np.zeros((5, n_rows, len(self.years) + 1))
+        for k, term in enumerate((w, w * x, y, y * x, w * x * x)):
+            np.cumsum(term, axis=1, out=self.cum[k, :, 1:])
+        # la m-ième année présente d'une ligne est present[ligne, m] ; le nombre d'années présentes
+        # avant une colonne est cum[0] : les k premières années d'une fenêtre en découlent
+        self.present = np.argsort(~np.asarray(cube.mask, dtype=bool), axis=1, kind='stable')
+        self.present_cum = np.zeros((n_rows, len(self.years) + 1))
+        np.cumsum(np.take_along_axis(y, self.present, axis=1), axis=1, out=self.present_cum[:, 1:])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _bounds(self, start=None, end=None):
+        lo = 0 if start is None else int(np.searchsorted(self.years, int(start), 'left'))
+        hi = len(self.years) if end is None else int(np.searchsorted(self.years, int(end), 'right'))
+        return lo, max(lo, hi)
+
+    def window(self, start=None, end=None):
+        """(n, Σx, Σy, Σxy, Σx²) de chaque ligne sur les années start..end incluses (bornes None = tout)."""
+        lo, hi = self._bounds(start, end)
+        return self.cum[:, :, hi] - self.cum[:, :, lo]
+
+    def ols(self, start=None, end=None, min_years=2):
+        """Pentes OLS sur la fenêtre ; NaN si moins de `min_years` (au moins 2) années présentes."""
+        return self.window_indicators(start, end, min_years)['slope']
+
+    def window_indicators(self, start=None, end=None, min_years=2):
+        """
+        n_years, mean, slope et slope_pct_mean (100 × slope / mean) de chaque ligne sur la fenêtre.
+        Valeurs non calculables : NaN (n_years vaut 0 sans donnée).
+        """
+        n, sx, sy, sxy, sxx = self.window(start, end)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sy / n
+            den = sxx - sx * sx / n
+            slope = (sxy - sx * sy / n) / den
+            # den nul à l'arrondi près (une seule année distincte) : pas de pente
+            slope[(n < max(2, int(min_years))) | ~(den > 1e-9 * np.maximum(sxx, 1.0))] = np.nan
+            pct_mean = np.where(mean != 0, 100.0 * slope / mean, np.nan)
+        return {
+            'n_years': n.astype(np.int64),
+            'mean': mean,
+            'slope': slope,
+            'slope_pct_mean': pct_mean,
+        }
+
+    def edges(self, start=None, end=None, k=3):
+        """
+        Moyennes des k premières et k dernières années présentes de chaque ligne sur la fenêtre,
+        et années de la première / dernière année présente -> (first, last, year_first, year_last).
+        Sans donnée : moyennes NaN, années 0.
+        """
+        lo, hi = self._bounds(start, end)
+        rows = np.arange(len(self.keys))
+        a = self.cum[0, :, lo].astype(np.int64)
+        b = self.cum[0, :, hi].astype(np.int64)
+        head = np.minimum(a + k, b)
+        tail = np.maximum(b - k, a)
+        pc = self.present_cum
+        with np.errstate(invalid='ignore', divide='ignore'):
+            first = (pc[rows, head] - pc[rows, a]) / (head - a)
+            last = (pc[rows, b] - pc[rows, tail]) / (b - tail)
+        has = b > a
+        year_first = np.zeros(len(rows), dtype=np.int64)
+        year_last = np.zeros(len(rows), dtype=np.int64)
+        if has.any():
+            year_first[has] = self.years[self.present[rows[has], a[has]]]
+            year_last[has] = self.years[self.present[rows[has], b[has] - 1]]
+        return first, last, year_first, year_last
+
+
+def rolling_indicators(cube, length, start=None, end=None, method='OLS', min_years=2):
+    """
+    Indicateurs de chaque fenêtre glissante de `length` années entre start et end (bornes du cube par défaut).
+    Pentes OLS, moyennes et bornes du CAGR par différences de sommes cumulées (PrefixStats) ;
+    Theil-Sen sur les seules colonnes de la fenêtre. min_years est ramené à `length` au plus.
+    Retourne une liste de dicts (un par fenêtre) : start, end, n_years, mean, slope, slope_pct_mean,
+    cagr_pct (tableaux alignés sur cube.keys, NaN si non calculable).
+    """
+    from .slopes import cube_slopes
+
+    require_numpy()
+    length = int(length)
+    if length < 2 or not len(cube.years):
+        return []
+    first = int(cube.years[0]) if start is None else int(start)
+    last = int(cube.years[-1]) if end is None else int(end)
+    min_years = min(max(2, int(min_years)), length)
+    stats = PrefixStats(cube)
+    out = []
+    for w_start in range(first, last - length + 2):
+        w_end = w_start + length - 1
+        lo, hi = np.searchsorted(cube.years, [w_start, w_end + 1])
+        if hi == lo:
+            # aucune année de données dans la fenêtre
+            continue
+        ind = stats.window_indicators(w_start, w_end, min_years)
+        slopes = ind['slope']
+        if method == 'Theil-Sen':
+            window = YearCube(cube.keys, cube.years[lo:hi], cube.values[:, lo:hi], cube.mask[:, lo:hi])
+            slopes = cube_slopes(window, method=method, min_years=min_years)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ind['slope_pct_mean'] = np.where(ind['mean'] != 0, 100.0 * slopes / ind['mean'], np.nan)
+        mean_first, mean_last, year_first, year_last = stats.edges(w_start, w_end)
+        out.append({
+            'start': w_start,
+            'end': w_end,
+            'n_years': ind['n_years'],
+            'mean': ind['mean'],
+            'slope': slopes,
+            'slope_pct_mean': ind['slope_pct_mean'],
+            'cagr_pct': cagr_pct(mean_first, mean_last, year_first, year_last),
+        })
+    return out
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Jointure volumes prélevés (VP) / volumes autorisés (VA) et indicateurs de ratio, en colonnes.
+"""
+
+from .parsing import np, require_numpy, parse_numbers
+from .cube import YearCube, AssignmentMatrix, factorize, regroup_cube
+
+
+def clean_keys(values):
+    """Identifiants bruts -> liste de str strip() (None conservé pour les identifiants absents)."""
+    return [None if v is None else str(v).strip() for v in values]
+
+
+def build_autor_index(keys, volumes, ddtm=None):
+    """
+    Index des volumes autorisés par ID ouvrage, depuis des colonnes brutes :
+    MAX(VA) par ouvrage (NaN ignorés) et ensemble des identifiants DDTM distincts.
+    Retourne un dict clé -> {'vol_max': float ou NaN, 'ddtm': set()}.
+    """
+    require_numpy()
+    keys = clean_keys(keys)
+    vols = parse_numbers(volumes)
+    keep = np.fromiter((k is not None for k in keys), dtype=bool, count=len(keys))
+    idx = np.flatnonzero(keep)
+    kept_keys = [keys[i] for i in idx]
+    if not kept_keys:
+        return {}
+    uniq, codes = factorize(kept_keys)
+    # MAX en ignorant les NaN : -inf pour les NaN, puis -inf -> NaN si aucun volume lisible
+    vmax = np.full(len(uniq), -np.inf)
+    np.maximum.at(vmax, codes, np.where(np.isnan(vols[idx]), -np.inf, vols[idx]))
+    vmax[np.isneginf(vmax)] = np.nan
+
+    ddtm_sets = [set() for _ in range(len(uniq))]
+    if ddtm is not None:
+        for c, i in zip(codes.tolist(), idx.tolist()):
+            d = ddtm[i]
+            if d is None:
+                continue
+            d = str(d).strip()
+            if d:
+                ddtm_sets[c].add(d)
+
+    return {k: {'vol_max': float(v), 'ddtm': s} for k, v, s in zip(uniq.tolist(), vmax.tolist(), ddtm_sets)}
+
+
+def ratio_indicators(prelev, autor):
+    """
+    Indicateurs VP/VA sur des colonnes alignées (VA NaN = pas de volume autorisé).
+    Retourne dict : ratio, ratio_possible (0/1), percent_prelev_auth, percent_overrun (NaN si impossible).
+    """
+    require_numpy()
+    prelev = np.asarray(prelev, dtype=np.float64)
+    autor = np.asarray(autor, dtype=np.float64)
+    possible = np.isfinite(autor) & (autor != 0)
+    ratio = np.full(prelev.shape, np.nan)
+    overrun = np.full(prelev.shape, np.nan)
+    ratio[possible] = prelev[possible] / autor[possible]
+    overrun[possible] = (prelev[possible] - autor[possible]) / autor[possible] * 100.0
+    return {
+        'ratio': ratio,
+        'ratio_possible': possible.astype(np.int64),
+        'percent_prelev_auth': ratio * 100.0,
+        'percent_overrun': overrun,
+    }
+
+
+def autor_volumes(keys, autor_index):
+    """Clés -> (matched bool, volume autorisé MAX float64, NaN si absent de l'index)."""
+    require_numpy()
+    matched = np.fromiter((k in autor_index for k in keys), dtype=bool, count=len(keys))
+    vol = np.fromiter((autor_index[k]['vol_max'] if m else np.nan for k, m in zip(keys, matched)),
+                      dtype=np.float64, count=len(keys))
+    return matched, vol
+
+
+def join_autor(keys, prelev, autor_index):
+    """
+    Joint des sommes prélevées (alignées sur `keys`) avec l'index des volumes autorisés.
+    Retourne dict : matched (bool), vol_autorise (NaN si absent) + indicateurs de `ratio_indicators`.
+    """
+    matched, vol = autor_volumes(keys, autor_index)
+    out = ratio_indicators(prelev, vol)
+    out['matched'] = matched
+    out['vol_autorise'] = vol
+    return out
+
+
+def ratio_history(prelev, autor, mask, years):
+    """
+    Indicateurs VP/VA de toutes les cellules d'une matrice série × année (une passe pour toutes les années).
+    `autor` est une matrice de même forme ou une colonne (VA constant par série) ; les cellules hors `mask` valent NaN / 0.
+    Ajoute un résumé par série : n_years, n_years_overrun (VP > VA), ratio_max, year_ratio_max (0 si aucun ratio).
+    """
+    require_numpy()
+    prelev = np.asarray(prelev, dtype=np.float64)
+    mask = np.asarray(mask, dtype=bool)
+    years = np.asarray(years, dtype=np.int64)
+    autor = np.where(mask, np.broadcast_to(np.asarray(autor, dtype=np.float64), prelev.shape), np.nan)
+    out = ratio_indicators(prelev, autor)
+    possible = out['ratio_possible'].astype(bool)
+    ratio = np.where(possible, out['ratio'], -np.inf)
+    if ratio.shape[1] == 0:
+        # aucune année : une colonne fictive sans ratio
+        ratio = np.full((ratio.shape[0], 1), -np.inf)
+        years = np.zeros(1, dtype=np.int64)
+    best = np.argmax(ratio, axis=1)
+    has = possible.any(axis=1)
+    out['n_years'] = mask.sum(axis=1)
+    out['n_years_overrun'] = (possible & (prelev > np.nan_to_num(autor))).sum(axis=1)
+    out['ratio_max'] = np.where(has, ratio[np.arange(ratio.shape[0]), best], np.nan)
+    out['year_ratio_max'] = np.where(has, years[best], 0)
+    return out
+
+
+def group_ratio_history(cube, autor, rows, group_keys):
+    """
+    Agrège un cube ouvrage × année (VP) et le VA de chaque ouvrage (`autor`, aligné sur cube.keys, NaN si absent)
+    vers des groupes (ex : zones, multi-affectation : `rows[i]` -> `group_keys[i]`), puis `ratio_history` par groupe × année.
+    La somme des VA d'une cellule vaut NaN si aucun ouvrage présent n'a de VA.
+    Retourne (cube groupe × année des VP, indicateurs) ; les indicateurs contiennent aussi autor_sum et n_ouvrages.
+    """
+    require_numpy()
+    autor = np.asarray(autor, dtype=np.float64)
+    has = cube.mask & np.isfinite(autor)[:, None]
+
+    # une seule matrice d'affectation pour les quatre agrégats
+    assignment = AssignmentMatrix(rows, group_keys, len(cube))
+
+    def regroup(values):
+        return regroup_cube(YearCube(cube.keys, cube.years, values, cube.mask), assignment=assignment).values
+
+    prelev_cube = regroup_cube(cube, assignment=assignment)
+    autor_sum = np.where(regroup(has.astype(np.float64)) > 0, regroup(np.where(has, autor[:, None], 0.0)), np.nan)
+    out = ratio_history(prelev_cube.values, autor_sum, prelev_cube.mask, prelev_cube.years)
+    out['autor_sum'] = autor_sum
+    out['n_ouvrages'] = regroup(cube.mask.astype(np.float64)).astype(np.int64)
+    return prelev_cube, out
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Requêtes de lecture QGIS : ne demander au fournisseur que ce qui est utile.
+
+`feature_request` construit un QgsFeatureRequest avec :
+- l'emprise de la zone d'étude (setFilterRect -> index R-tree GeoPackage / PostGIS),
+- la fenêtre d'années en expression, lorsque le champ année est numérique
+  (les années texte restent filtrées côté Python par year_parser),
+- les seuls champs utilisés (setSubsetOfAttributes) et NoGeometry si la géométrie est inutile.
+Le filtrage Python des scripts est conservé : la requête ne fait que réduire la lecture.
+`layer_cache_key` identifie une lecture de couche fichier pour le cache local (vocal_core.cache).
+`read_columns` lit une couche en colonnes nettoyées (vocal_core.columns) : depuis le cache si la
+source est un fichier inchangé, en ne lisant que les entités ajoutées si la couche n'a reçu que des
+ajouts (nouvelle campagne de redevances). Sans cache utilisable, le cache couvre toute la couche :
+sa construction lit et garde en mémoire toutes les entités, quel que soit `request`. Elle n'est donc
+faite que si la requête couvre une bonne part de la couche (`request_fraction`) ; une requête étroite
+(une zone, quelques années) ou une source non fichier est lue seule, sans mise en cache.
+`scan_latest_year` garde en lecture les seules entités de la dernière année (année 0 des ratios).
+qgis.core n'est importé qu'à l'appel.
+"""
+
+from .parsing import np, year_parser
+from .columns import ColumnsBuilder, FeatureColumns, normalize_specs, concat_columns
+from .output import Progress
+
+# entités déjà en cache relues pour vérifier qu'elles n'ont pas changé avant un ajout incrémental
+CHECK_ROWS = 256
+# sans cache utilisable : en dessous de cette part estimée de la couche, seule la requête est lue
+NARROW_FRACTION = 0.25
+
+
+def year_window_expression(layer, year_field, start_year=None, end_year=None):
+    """
+    Expression QGIS équivalente à start_year <= int(année) <= end_year, ou None
+    si le champ n'est pas numérique ou si aucune borne n'est donnée.
+    """
+    from qgis.core import QgsExpression
+
+    fields = layer.fields()
+    idx = fields.indexFromName(year_field) if year_field else -1
+    if idx < 0 or not fields.at(idx).isNumeric():
+        return None
+    col = QgsExpression.quotedColumnRef(year_field)
+    parts = []
+    if start_year is not None:
+        parts.append(f"{col} >= {int(start_year)}")
+    if end_year is not None:
+        # int() tronque : 2023.5 appartient à l'année 2023
+        parts.append(f"{col} < {int(end_year) + 1}")
+    return ' AND '.join(parts) or None
+
+
+def feature_request(layer, field_names, rect=None, year_field=None, start_year=None, end_year=None, geometry=True):
+    """
+    QgsFeatureRequest limité aux champs `field_names` (None / '' ignorés), à l'emprise `rect`
+    et à la fenêtre d'années sur `year_field`. geometry=False -> NoGeometry (sans emprise).
+    Si un champ est absent de la couche, tous les attributs sont lus (l'erreur de champ reste
+    signalée par le script, comme avant).
+    """
+    from qgis.core import QgsFeatureRequest
+
+    req = QgsFeatureRequest()
+    fields = layer.fields()
+    names = []
+    for n in field_names:
+        if n and n not in names:
+            names.append(n)
+    if names and all(fields.indexFromName(n) >= 0 for n in names):
+        req.setSubsetOfAttributes(names, fields)
+    if rect is not None and not rect.isEmpty():
+        req.setFilterRect(rect)
+    elif not geometry:
+        req.setFlags(req.flags() | QgsFeatureRequest.NoGeometry)
+    expr = year_window_expression(layer, year_field, start_year, end_year)
+    if expr:
+        req.setFilterExpression(expr)
+    return req
+
+
+def request_fraction(layer, rect=None, year_field=None, start_year=None, end_year=None):
+    """
+    Part estimée (0 à 1) de `layer` lue par une requête limitée à l'emprise `rect` et à la fenêtre
+    d'années : surface de l'emprise dans l'étendue de la couche, multipliée par la part de la plage
+    d'années min..max (statistiques du fournisseur, champ année numérique seulement).
+    """
+    fraction = 1.0
+    if rect is not None and not rect.isEmpty():
+        extent = layer.extent()
+        if extent is not None and not extent.isEmpty() and extent.width() * extent.height() > 0:
+            inter = rect.intersect(extent)
+            covered = 0.0 if inter.isEmpty() else inter.width() * inter.height()
+            fraction *= min(1.0, covered / (extent.width() * extent.height()))
+    if year_window_expression(layer, year_field, start_year, end_year):
+        idx = layer.fields().indexFromName(year_field)
+        try:
+            lo, hi = int(layer.minimumValue(idx)), int(layer.maximumValue(idx))
+        except (TypeError, ValueError):
+            return fraction
+        first = lo if start_year is None else max(lo, int(start_year))
+        last = hi if end_year is None else min(hi, int(end_year))
+        fraction *= max(0, last - first + 1) / (hi - lo + 1) if hi >= lo else 1.0
+    return fraction
+
+
+def layer_cache_key(layer, field_names):
+    """
+    (signature, source) d'une lecture de `layer` limitée à `field_names`, pour vocal_core.cache.
+    signature vaut None si la couche n'est pas un fichier local (PostGIS, mémoire, ...).
+    """
+    from .cache import source_signature
+
+    uri = layer.source()
+    names = [n for n in field_names if n]
+    source = '|'.join([uri, layer.subsetString() or ''] + names)
+    path = uri.split('|')[0]
+    return source_signature(path, layer.featureCount(), names, extra=[uri, layer.subsetString() or '']), source
+
+
+def point_xy(geom):
+    """(x, y) d'un point simple (ou multipoint à une partie), None sans géométrie, False sinon."""
+    from qgis.core import QgsWkbTypes
+
+    if geom is None or geom.isNull() or geom.isEmpty():
+        return None
+    if geom.type() != QgsWkbTypes.PointGeometry:
+        return False
+    if geom.isMultipart():
+        pts = geom.asMultiPoint()
+        if len(pts) != 1:
+            return False
+        p = pts[0]
+    else:
+        p = geom.asPoint()
+    return p.x(), p.y()
+
+
+def scan_columns(layer, specs, request=None, geometry=True, feedback=None):
+    """
+    Lit `layer` (toutes les entités, ou celles de `request`) en FeatureColumns.
+    Retourne None si l'utilisateur annule. Un champ absent de la couche lève KeyError.
+    """
+    specs = normalize_specs(specs)
+    fields = layer.fields()
+    absent = sorted({f for f, _ in specs if fields.indexFromName(f) < 0})
+    if absent:
+        raise KeyError(', '.join(absent))
+    names = [f for f, _ in specs]
+    if request is None:
+        request = feature_request(layer, names, geometry=geometry)
+    builder = ColumnsBuilder(specs, geometry=geometry)
+    progress = Progress(feedback, layer.featureCount())
+    for f in layer.getFeatures(request):
+        if progress.stopped():
+            return None
+        builder.add(f.id(), point_xy(f.geometry()) if geometry else None, [f[n] for n in names])
+    return builder.finish()
+
+
+def scan_latest_year(layer, specs, year_field, request=None, zones=None, geometry=True, feedback=None):
+    """
+    Lit `layer` (ou `request`) en ne gardant que les entités de la dernière année lisible de
+    `year_field` : les colonnes sont reprises à zéro à chaque nouvelle année maximale, la mémoire est
+    bornée par une seule année. Avec `zones` (PreparedZones), seules les entités qui intersectent une
+    zone comptent, y compris pour déterminer la dernière année.
+    Retourne None si l'utilisateur annule. Un champ absent de la couche lève KeyError.
+    """
+    specs = normalize_specs(specs)
+    fields = layer.fields()
+    absent = sorted({f for f, _ in specs if fields.indexFromName(f) < 0})
+    if absent:
+        raise KeyError(', '.join(absent))
+    names = [f for f, _ in specs]
+    if request is None:
+        request = feature_request(layer, names, geometry=geometry)
+    parse_year = year_parser()
+    target = None
+    builder = ColumnsBuilder(specs, geometry=geometry)
+    progress = Progress(feedback, layer.featureCount())
+    for f in layer.getFeatures(request):
+        if progress.stopped():
+            return None
+        y = parse_year(f[year_field])
+        if y is None or (target is not None and y < target):
+            continue
+        geom = f.geometry() if geometry else None
+        if zones is not None and not zones.intersects_any(geom):
+            continue
+        if target is None or y > target:
+            target = y
+            builder = ColumnsBuilder(specs, geometry=geometry)
+        builder.add(f.id(), point_xy(geom) if geometry else None, [f[n] for n in names])
+    return builder.finish()
+
+
+def append_columns(layer, cached, specs, geometry=True, feedback=None):
+    """
+    Complète des colonnes en cache avec les entités ajoutées depuis (fid > plus grand fid en cache).
+    Retourne None si la couche n'a pas seulement reçu des ajouts : aucun ajout, nombre d'entités
+    incohérent (suppressions) ou échantillon d'entités existantes modifié -> reconstruction complète.
+    """
+    specs = normalize_specs(specs)
+    names = [f for f, _ in specs]
+    n_old = len(cached)
+    n_added = layer.featureCount() - n_old
+    if n_old == 0 or n_added <= 0:
+        return None
+    request = feature_request(layer, names, geometry=geometry)
+    request.setFilterExpression(f"$id > {int(cached.fid.max())}")
+    added = scan_columns(layer, specs, request=request, geometry=geometry, feedback=feedback)
+    if added is None or len(added) != n_added:
+        return None
+    # échantillon réparti sur les entités en cache (dont la dernière), relu et comparé
+    rows = np.unique(np.linspace(0, n_old - 1, min(n_old, CHECK_ROWS)).astype(np.int64))
+    expected = cached.take(rows)
+    request = feature_request(layer, names, geometry=geometry)
+    request.setFilterFids(expected.fid.tolist())
+    check = scan_columns(layer, specs, request=request, geometry=geometry)
+    if check is None:
+        return None
+    if not check.take(np.argsort(check.fid, kind='stable')).same_rows(expected.take(np.argsort(expected.fid, kind='stable'))):
+        return None
+    return concat_columns(cached, added)
+
+
+def read_columns(layer, specs, request=None, geometry=True, feedback=None, fraction=1.0, cold=None):
+    """
+    Colonnes nettoyées de `layer` -> (FeatureColumns ou None si annulé, origine).
+    origine : 'cache' (aucune lecture), 'cache+lecture' (champs ajoutés au cache),
+    'cache+ajouts' (seules les entités ajoutées depuis le cache précédent sont lues),
+    'lecture+cache' (toute la couche lue, cache construit) ou 'lecture' (sans mise en cache : source
+    non fichier ou, sans cache utilisable, lecture `cold()` si donnée, sinon lecture limitée à
+    `request` lorsque `fraction` (part estimée de la couche, voir request_fraction) < NARROW_FRACTION).
+    Les colonnes couvrent au moins `request` : les filtres (zone, années) restent à appliquer.
+    """
+    from .cache import load_columns, store_columns, previous_columns
+
+    specs = normalize_specs(specs)
+    signature, source = layer_cache_key(layer, [])
+    if signature is None:
+        return scan_columns(layer, specs, request=request, geometry=geometry, feedback=feedback), 'lecture'
+    cols, missing = load_columns(signature, specs, geometry=geometry)
+    if cols is not None and not missing:
+        return cols, 'cache'
+    if cols is not None:
+        extra = scan_columns(layer, missing, geometry=False, feedback=feedback)
+        if extra is None:
+            return None, 'lecture'
+        if extra.fid.shape == cols.fid.shape and (extra.fid == cols.fid).all():
+            data = dict(cols.data)
+            data.update(extra.data)
+            cols = FeatureColumns(cols.fid, cols.x, cols.y, cols.complex, data, geometry=cols.geometry)
+            store_columns(signature, source, cols)
+            return cols, 'cache+lecture'
+    else:
+        # la source a changé : si elle n'a reçu que des ajouts, on ne lit que ceux-ci
+        previous = previous_columns(source, signature)
+        if previous is not None:
+            old, old_missing = load_columns(previous, specs, geometry=geometry)
+            cols = append_columns(layer, old, specs, geometry=geometry, feedback=feedback) if old is not None and not old_missing else None
+            # libérer les fichiers mappés de l'ancien cache avant son remplacement
+            old = None
+            if cols is not None:
+                store_columns(signature, source, cols)
+                return cols, 'cache+ajouts'
+    # pas de cache utilisable : le construire demande de lire toute la couche
+    if cold is not None:
+        return cold(), 'lecture'
+    if fraction < NARROW_FRACTION:
+        return scan_columns(layer, specs, request=request, geometry=geometry, feedback=feedback), 'lecture'
+    cols = scan_columns(layer, specs, geometry=geometry, feedback=feedback)
+    if cols is None:
+        return None, 'lecture'
+    store_columns(signature, source, cols)
+    return cols, 'lecture+cache'
+
+
+def fetch_geometries(layer, fids):
+    """fid -> QgsGeometry des entités demandées, en une seule requête."""
+    from qgis.core import QgsFeatureRequest
+
+    fids = [int(f) for f in fids]
+    if not fids:
+        return {}
+    req = QgsFeatureRequest()
+    req.setFilterFids(fids)
+    req.setNoAttributes()
+    return {f.id(): f.geometry() for f in layer.getFeatures(req)}
+
+
+def rows_in_zones(layer, cols, zones, rows=None):
+    """
+    Masque des lignes (toutes, ou `rows`) dont la géométrie intersecte une zone préparée :
+    points testés par coordonnées, géométries non ponctuelles relues par fid.
+    """
+    rows = np.arange(len(cols)) if rows is None else np.asarray(rows, dtype=np.int64)
+    out = zones.intersects_points(cols.x[rows], cols.y[rows])
+    odd = np.flatnonzero(cols.complex[rows])
+    if odd.size:
+        geoms = fetch_geometries(layer, cols.fid[rows[odd]].tolist())
+        for i in odd.tolist():
+            g = geoms.get(int(cols.fid[rows[i]]))
+            out[i] = g is not None and zones.intersects_any(g)
+    return out
+
+
+def row_geometries(layer, cols, rows):
+    """Ligne -> QgsGeometry (relue par fid : géométrie exacte de la couche) pour les lignes `rows`."""
+    rows = [int(r) for r in rows]
+    geoms = fetch_geometries(layer, cols.fid[rows].tolist())
+    out = {}
+    for r in rows:
+        g = geoms.get(int(cols.fid[r]))
+        if g is not None and not g.isEmpty():
+            out[r] = g
+    return out
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Estimation des pentes (vol / an) : OLS ou Theil-Sen.
+`compute_slope_years` traite une série ; `cube_slopes` traite toutes les lignes d'un YearCube.
+L'OLS est calculé pour toutes les lignes à la fois (`ols_slopes`) à partir de la matrice
+clé × année et de son masque de validité, sans appel à np.polyfit par série.
+Theil-Sen passe par `theilsen` (tenseur de pentes ou sélection randomisée), sans boucle O(n²) par série.
+Pour balayer plusieurs fenêtres d'années sur un même cube, voir `prefix.PrefixStats`.
+"""
+
+import math
+
+from .backend import np, stats, available, require_numpy
+from .theilsen import PAIRWISE_MAX_POINTS, theil_sen_matrix, theil_sen_long
+
+METHODS = ['OLS', 'Theil-Sen']
+
+
+def median_of_pairwise_slopes(xs, ys):
+    """Fallback Theil-Sen: médiane des pentes pairwise (O(n^2))."""
+    n = len(xs)
+    slopes = []
+    for i in range(n - 1):
+        for j in range(i + 1, n):
+            dx = xs[j] - xs[i]
+            if dx != 0:
+                slopes.append((ys[j] - ys[i]) / dx)
+    if not slopes:
+        return None
+    slopes.sort()
+    m = len(slopes)
+    if m % 2 == 1:
+        return float(slopes[m // 2])
+    else:
+        return float((slopes[m // 2 - 1] + slopes[m // 2]) / 2.0)
+
+
+def compute_slope_years(years, values, method='OLS'):
+    """Retourne la pente (units = vol / an). method: 'OLS' ou 'Theil-Sen'"""
+    pairs = [(y, v) for y, v in zip(years, values) if v is not None and not (isinstance(v, float) and math.isnan(v))]
+    if len(pairs) < 2:
+        return None
+    ys, vs = zip(*pairs)
+    if method == 'Theil-Sen':
+        try:
+            if available(np) and available(stats):
+                # theilslopes returns (slope, intercept, lower, upper)
+                res = stats.theilslopes(np.array(vs, dtype=float), np.array(ys, dtype=float))
+                return float(res[0])
+            else:
+                return median_of_pairwise_slopes(list(ys), list(vs))
+        except Exception:
+            return median_of_pairwise_slopes(list(ys), list(vs))
+    else:
+        try:
+            if available(np):
+                m, b = np.polyfit(np.array(ys, dtype=float), np.array(vs, dtype=float), 1)
+                return float(m)
+            else:
+                n = len(ys)
+                x_mean = sum(ys) / n
+                y_mean = sum(vs) / n
+                num = sum((xi - x_mean) * (yi - y_mean) for xi, yi in zip(ys, vs))
+                den = sum((xi - x_mean) ** 2 for xi in ys)
+                if den == 0:
+                    return None
+                return float(num / den)
+        except Exception:
+            return None
+
+
+def ols_slopes(values, mask, years):
+    """
+    Pentes OLS de toutes les lignes d'une matrice (n_series × n_years) en une passe.
+    Seules les cellules où `mask` est vrai participent ; NaN si moins de 2 points.
+    Les années sont centrées sur la moyenne de chaque ligne pour rester stables numériquement.
+    """
+    require_numpy()
+    w = np.asarray(mask, dtype=np.float64)
+    x = np.asarray(years, dtype=np.float64)[None, :]
+    y = np.where(mask, values, 0.0)
+    n = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = (w * x).sum(axis=1) / n
+        y_mean = y.sum(axis=1) / n
+        dx = (x - x_mean[:, None]) * w
+        num = (dx * (y - y_mean[:, None] * w)).sum(axis=1)
+        den = (dx * dx).sum(axis=1)
+        slopes = num / den
+    slopes[(n < 2) | (den == 0)] = np.nan
+    return slopes
+
+
+def cube_slopes(cube, method='OLS', min_years=2):
+    """
+    Pente de chaque ligne du cube (NaN si moins de `min_years` années présentes).
+    Retourne un np.ndarray float64 aligné sur cube.keys.
+    """
+    require_numpy()
+    n_years = cube.n_years()
+    eligible = n_years >= max(2, int(min_years))
+    if method != 'Theil-Sen':
+        out = ols_slopes(cube.values, cube.mask, cube.years)
+        out[~eligible] = np.nan
+        return out
+    if len(cube.years) <= PAIRWISE_MAX_POINTS:
+        # séries annuelles courtes : tenseur des pentes deux à deux, toutes lignes à la fois
+        out = theil_sen_matrix(cube.values, cube.mask, cube.years)
+        out[~eligible] = np.nan
+        return out
+    out = np.full(len(cube.keys), np.nan)
+    for i in np.flatnonzero(eligible):
+        m = cube.mask[i]
+        s = theil_sen_long(cube.years[m], cube.values[i, m])
+        if s is not None:
+            out[i] = s
+    return out
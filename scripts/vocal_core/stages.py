@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Chronométrage des étapes d'un algorithme : durée, lignes traitées, débit et pic de mémoire Python
+(tracemalloc) de chaque étape, journalisés dans le feedback et exportables en JSON.
+
+`run_stages` enveloppe le corps d'un processAlgorithm : le rapport est écrit (fichier JSON du
+paramètre OUTPUT_REPORT s'il est renseigné) même si l'algorithme échoue ou est annulé.
+Le suivi mémoire ralentit les boucles Python : il n'est actif que si un rapport est demandé, ou
+forcé par VOCAL_TRACEMALLOC=1 (VOCAL_TRACEMALLOC=0 le désactive même avec un rapport).
+tracemalloc est global au processus : un seul chronométrage à la fois le pilote (démarrage, remise
+à zéro du pic, arrêt) ; les exécutions simultanées n'ont pas de pic mémoire.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+REPORT_PARAM = 'OUTPUT_REPORT'
+
+# chronométrage qui pilote tracemalloc (None : aucun)
+_trace_lock = threading.Lock()
+_trace_owner = None
+
+
+def _memory_enabled(report=False):
+    flag = os.environ.get('VOCAL_TRACEMALLOC', '').strip().lower()
+    if not flag:
+        return report
+    return flag not in ('0', 'false', 'no', 'off')
+
+
+class StageTimer:
+    """
+    Étapes successives d'une exécution.
+    - stage(nom, rows=None) : clôt l'étape en cours et ouvre la suivante
+    - rows(n) : nombre de lignes traitées par l'étape en cours
+    - finish(status) : clôt la dernière étape, journalise le total et retourne le rapport (dict)
+    memory=True : pic mémoire par étape si tracemalloc ne tourne pas déjà (démarré ici, arrêté par finish).
+    """
+
+    def __init__(self, feedback, algorithm, memory=False):
+        global _trace_owner
+        self.feedback = feedback
+        self.algorithm = algorithm
+        self.stages = []
+        self.report = None
+        self._current = None
+        self._own_trace = False
+        if memory:
+            with _trace_lock:
+                if _trace_owner is None and not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    _trace_owner = self
+                    self._own_trace = True
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self._t0 = time.perf_counter()
+
+    def _log(self, text):
+        if self.feedback is not None:
+            self.feedback.pushInfo(text)
+
+    def stage(self, name, rows=None):
+        self._close()
+        if self._own_trace and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._current = {'name': name, 'rows': rows, 't0': time.perf_counter()}
+
+    def rows(self, n):
+        if self._current is not None:
+            self._current['rows'] = int(n)
+
+    def _close(self):
+        cur = self._current
+        if cur is None:
+            return
+        self._current = None
+        seconds = time.perf_counter() - cur['t0']
+        entry = {'name': cur['name'], 'seconds': round(seconds, 4), 'rows': cur['rows'], 'rows_per_s': None, 'peak_mb': None}
+        text = f"[étape] {cur['name']} : {seconds:.2f} s"
+        if cur['rows'] is not None:
+            rate = cur['rows'] / seconds if seconds > 0 else None
+            entry['rows_per_s'] = round(rate, 1) if rate is not None else None
+            text += f", {cur['rows']} lignes" + (f" ({rate:.0f} lignes/s)" if rate is not None else '')
+        if self._own_trace:
+            peak = tracemalloc.get_traced_memory()[1] / 1048576.0
+            entry['peak_mb'] = round(peak, 2)
+            text += f", pic mémoire Python {peak:.1f} Mo"
+        self.stages.append(entry)
+        self._log(text)
+
+    def finish(self, status='ok'):
+        global _trace_owner
+        if self.report is not None:
+            return self.report
+        self._close()
+        total = time.perf_counter() - self._t0
+        peak = max((s['peak_mb'] for s in self.stages if s['peak_mb'] is not None), default=None)
+        if self._own_trace:
+            with _trace_lock:
+                tracemalloc.stop()
+                _trace_owner = None
+            self._own_trace = False
+        self.report = {
+            'algorithm': self.algorithm,
+            'started': self.started,
+            'status': status,
+            'total_s': round(total, 4),
+            'peak_mb': peak,
+            'stages': self.stages,
+        }
+        self._log(f"[étape] Total : {total:.2f} s ({len(self.stages)} étapes, statut {status}).")
+        return self.report
+
+    def write_json(self, path):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.finish(), f, ensure_ascii=False, indent=2)
+
+
+def run_stages(algorithm, parameters, context, feedback, process):
+    """
+    Exécute process(parameters, context, feedback, timer) avec un StageTimer et retourne ses résultats,
+    complétés du chemin du rapport JSON (paramètre OUTPUT_REPORT de `algorithm`, facultatif).
+    Le pic mémoire n'est mesuré que si le rapport est demandé (ou VOCAL_TRACEMALLOC=1).
+    """
+    path = ''
+    if algorithm.parameterDefinition(REPORT_PARAM) is not None:
+        path = algorithm.parameterAsFileOutput(parameters, REPORT_PARAM, context) or ''
+    timer = StageTimer(feedback, algorithm.name(), memory=_memory_enabled(bool(path)))
+    status = 'error'
+    try:
+        results = process(parameters, context, feedback, timer)
+        status = 'canceled' if feedback is not None and feedback.isCanceled() else 'ok'
+    finally:
+        timer.finish(status)
+        if path:
+            try:
+                timer.write_json(path)
+                timer._log(f"Rapport des étapes écrit : {path}")
+            except OSError as e:
+                timer._log(f"Impossible d'écrire le rapport des étapes {path} : {e}")
+    results = dict(results or {})
+    if path:
+        results[REPORT_PARAM] = path
+    return results
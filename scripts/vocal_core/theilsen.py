@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Estimateur de Theil-Sen (médiane des pentes deux à deux) pour de nombreuses séries à la fois.
+
+Deux chemins, qui redonnent exactement la médiane des pentes flottantes (y_j - y_i) / (x_j - x_i)
+calculée par scipy.stats.theilslopes ou par `median_of_pairwise_slopes` :
+- séries annuelles courtes : tenseur des pentes deux à deux (séries × paires d'années),
+  pentes invalides masquées (NaN), tri par ligne puis médiane selon le nombre de paires valides ;
+- séries longues : sélection randomisée de la pente médiane, par comptage d'inversions
+  (O(n log² n)) et énumération des seules paires d'une bande étroite autour de la médiane.
+"""
+
+import math
+
+from .parsing import np, require_numpy
+
+# au-delà, une série est traitée par sélection randomisée plutôt que par toutes ses paires
+PAIRWISE_MAX_POINTS = 64
+# mémoire de travail visée pour un bloc du tenseur de pentes (octets)
+CHUNK_BYTES = 32 * 1024 * 1024
+
+
+def _median_sorted_rows(sorted_slopes, counts):
+    """Médiane de chaque ligne triée (NaN en fin de ligne) dont `counts` valeurs sont valides."""
+    rows = np.arange(sorted_slopes.shape[0])
+    lo = np.maximum(counts - 1, 0) // 2
+    hi = counts // 2
+    hi = np.minimum(hi, sorted_slopes.shape[1] - 1)
+    med = (sorted_slopes[rows, lo] + sorted_slopes[rows, hi]) / 2.0
+    med[counts == 0] = np.nan
+    return med
+
+
+def theil_sen_matrix(values, mask, years):
+    """
+    Pentes de Theil-Sen de toutes les lignes d'une matrice séries × années (années croissantes).
+    Seules les cellules où `mask` est vrai participent ; NaN si moins de 2 points.
+    """
+    require_numpy()
+    values = np.asarray(values, dtype=np.float64)
+    mask = np.asarray(mask, dtype=bool)
+    years = np.asarray(years, dtype=np.float64)
+    n_rows, n_years = values.shape
+    out = np.full(n_rows, np.nan)
+    if n_years < 2 or n_rows == 0:
+        return out
+    iu, ju = np.triu_indices(n_years, 1)
+    dx = years[ju] - years[iu]
+    step = max(1, CHUNK_BYTES // (8 * 2 * len(iu)))
+    for start in range(0, n_rows, step):
+        v = values[start:start + step]
+        m = mask[start:start + step]
+        ok = m[:, ju] & m[:, iu]
+        with np.errstate(invalid='ignore'):
+            s = (v[:, ju] - v[:, iu]) / dx
+        s[~ok] = np.nan
+        s.sort(axis=1)
+        out[start:start + step] = _median_sorted_rows(s, ok.sum(axis=1))
+    return out
+
+
+# ---------- séries longues : sélection randomisée ----------
+def _dense_rank(a):
+    """Rangs denses (ex-aequo = même rang)."""
+    return np.unique(a, return_inverse=True)[1].reshape(-1)
+
+
+def _count_inversions(a):
+    """Nombre de couples p < q tels que a[p] >= a[q] (fusion par niveaux, vectorisée)."""
+    n = a.shape[0]
+    r = _dense_rank(a).astype(np.int64)
+    idx = np.arange(n)
+    total = 0
+    size = 1
+    while size < n:
+        block = idx // (2 * size)
+        right = (idx // size) % 2 == 1
+        left_keys = np.sort(block[~right] * n + r[~right])
+        rb = block[right] * n
+        start = np.searchsorted(left_keys, rb + r[right], 'left')
+        end = np.searchsorted(left_keys, rb + n, 'left')
+        total += int((end - start).sum())
+        size *= 2
+    return total
+
+
+def _enumerate_inversions(a):
+    """Couples (p, q), p < q, tels que a[p] >= a[q] -> deux tableaux d'indices."""
+    n = a.shape[0]
+    r = _dense_rank(a).astype(np.int64)
+    idx = np.arange(n)
+    out_p = []
+    out_q = []
+    size = 1
+    while size < n:
+        block = idx // (2 * size)
+        right = (idx // size) % 2 == 1
+        left_ids = idx[~right]
+        order = np.argsort(block[~right] * n + r[~right], kind='stable')
+        left_keys = (block[~right] * n + r[~right])[order]
+        left_ids = left_ids[order]
+        right_ids = idx[right]
+        rb = block[right] * n
+        start = np.searchsorted(left_keys, rb + r[right], 'left')
+        end = np.searchsorted(left_keys, rb + n, 'left')
+        counts = end - start
+        tot = int(counts.sum())
+        if tot:
+            offs = np.repeat(start - (np.cumsum(counts) - counts), counts) + np.arange(tot)
+            out_p.append(left_ids[offs])
+            out_q.append(np.repeat(right_ids, counts))
+        size *= 2
+    if not out_p:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(out_p), np.concatenate(out_q)
+
+
+def _pairwise_median(x, y):
+    """Médiane exacte de toutes les pentes (x croissants distincts), par blocs de lignes."""
+    n = x.shape[0]
+    slopes = []
+    step = max(1, CHUNK_BYTES // (8 * max(1, n)))
+    for i0 in range(0, n - 1, step):
+        i = np.arange(i0, min(n - 1, i0 + step))
+        ii, jj = np.nonzero(np.arange(n)[None, :] > i[:, None])
+        ii = i[ii]
+        slopes.append((y[jj] - y[ii]) / (x[jj] - x[ii]))
+    s = np.concatenate(slopes)
+    return float(np.median(s))
+
+
+def theil_sen_long(x, y, seed=0):
+    """
+    Pente de Theil-Sen d'une longue série (identique à la médiane des pentes deux à deux).
+
+    Un échantillon aléatoire de pentes fournit une bande [lo, hi] qui contient la médiane
+    avec une forte probabilité ; les paires dont la pente est dans la bande sont exactement
+    les inversions entre l'ordre des points selon y - lo·x et selon y - hi·x, ce qui permet
+    de les compter puis de les énumérer sans parcourir les n² paires.
+    Les pentes à moins de l'erreur d'arrondi d'une borne sont écartées de la bande ; si la
+    médiane n'est plus dans la bande (rare), on calcule toutes les pentes.
+    """
+    require_numpy()
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.argsort(x, kind='stable')
+    x = x[order]
+    y = y[order]
+    n = x.shape[0]
+    if n < 2:
+        return None
+    if np.any(np.diff(x) == 0):
+        # abscisses dupliquées : les paires dx = 0 sont exclues, calcul direct
+        ii, jj = np.triu_indices(n, 1)
+        ok = x[jj] != x[ii]
+        if not ok.any():
+            return None
+        ii, jj = ii[ok], jj[ok]
+        return float(np.median((y[jj] - y[ii]) / (x[jj] - x[ii])))
+    if n <= PAIRWISE_MAX_POINTS:
+        return _pairwise_median(x, y)
+
+    m_total = n * (n - 1) // 2
+    k1, k2 = (m_total - 1) // 2, m_total // 2
+    rng = np.random.default_rng(seed)
+    m = int(min(m_total, max(4 * n, 2000)))
+    i = rng.integers(0, n, size=m)
+    j = rng.integers(0, n - 1, size=m)
+    j = j + (j >= i)
+    a, b = np.minimum(i, j), np.maximum(i, j)
+    sample = np.sort((y[b] - y[a]) / (x[b] - x[a]))
+    q1, q2 = k1 / m_total, k2 / m_total
+    margin = 4.0 * math.sqrt(m) / 2.0
+    lo = sample[max(0, int(q1 * m - margin))]
+    hi = sample[min(m - 1, int(q2 * m + margin))]
+    if not lo < hi:
+        return _pairwise_median(x, y)
+
+    # nombre de pentes <= lo : couples x-ordonnés inversés selon y - lo·x
+    below = _count_inversions(y - lo * x)
+    # pentes dans ]lo, hi] : inversions de l'ordre (y - hi·x) lorsque les points sont rangés selon (y - lo·x)
+    by_lo = np.lexsort((-x, y - lo * x))
+    p, q = _enumerate_inversions((y - hi * x)[by_lo])
+    pa, pb = by_lo[p], by_lo[q]
+    first = np.minimum(pa, pb)
+    second = np.maximum(pa, pb)
+    band = np.sort((y[second] - y[first]) / (x[second] - x[first]))
+    # garde-fou d'arrondi : une paire n'est mal classée par les comparaisons flottantes que si sa
+    # pente est à moins de `delta` d'une borne ; on retire ces pentes ambiguës de la bande
+    # (celles proches de lo rejoignent le compte des pentes inférieures)
+    scale = np.abs(y).max() + 2.0 * max(abs(lo), abs(hi)) * np.abs(x).max()
+    delta = 16.0 * np.finfo(np.float64).eps * scale / np.diff(x).min() + 4.0 * np.spacing(max(abs(lo), abs(hi)))
+    lo_cut = int(np.searchsorted(band, lo + delta, 'left'))
+    hi_cut = int(np.searchsorted(band, hi - delta, 'right'))
+    below += lo_cut
+    band = band[lo_cut:hi_cut]
+    if not (below <= k1 and k2 < below + band.shape[0]):
+        return _pairwise_median(x, y)
+    return float((band[k1 - below] + band[k2 - below]) / 2.0)
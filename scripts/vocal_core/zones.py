@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Test point / géométrie dans une zone d'étude avec des géométries préparées (GEOS).
+
+Chaque polygone de zone est préparé une seule fois (QgsGeometry.createGeometryEngine
++ prepareGeometry) ; un rejet rapide par emprise (globale puis par zone, via
+QgsSpatialIndex au-delà de quelques zones) évite l'appel GEOS pour la plupart des points.
+`intersects_points` teste des colonnes de coordonnées (une fois par point distinct).
+`assign_to_zones` affecte des ouvrages aux zones d'un zonage en réutilisant le cache
+d'affectation (seuls les ouvrages nouveaux ou déplacés sont testés) ; `precompute_assignments`
+remplit ce cache pour plusieurs zonages en une lecture des ouvrages ; `zone_parents` rattache
+les zones d'un zonage fin à celles d'un zonage plus grossier (agrégation par niveaux).
+qgis.core n'est importé qu'à l'usage.
+"""
+
+import hashlib
+import json
+from collections import Counter
+
+from .parsing import np, require_numpy
+from .columns import plain_value
+from .output import Progress
+
+# propriété posée sur une couche mémoire extraite d'un zonage fichier (orchestrateur) : URI du zonage complet
+ZONAGE_SOURCE_PROPERTY = 'vocal/zonage_source'
+
+# au-delà, les emprises des zones passent par un QgsSpatialIndex plutôt qu'un parcours linéaire
+INDEX_MIN_ZONES = 16
+
+
+class PreparedZones:
+    """
+    Zones d'étude préparées.
+    - zones : itérable de (identifiant, QgsGeometry) ; les géométries vides sont ignorées
+    - intersects_any(geom) : True si la géométrie intersecte au moins une zone
+    - matching(geom) : identifiants des zones intersectées (ordre d'insertion)
+    """
+
+    def __init__(self, zones):
+        from qgis.core import QgsGeometry, QgsRectangle, QgsSpatialIndex
+
+        self.ids = []
+        self.bboxes = []
+        self.engines = []
+        self.extent = None
+        for zid, zg in zones:
+            if zg is None or zg.isEmpty():
+                continue
+            engine = QgsGeometry.createGeometryEngine(zg.constGet())
+            engine.prepareGeometry()
+            bbox = zg.boundingBox()
+            self.ids.append(zid)
+            self.bboxes.append(bbox)
+            self.engines.append(engine)
+            if self.extent is None:
+                self.extent = QgsRectangle(bbox)
+            else:
+                self.extent.combineExtentWith(bbox)
+
+        self.index = None
+        if len(self.ids) > INDEX_MIN_ZONES:
+            self.index = QgsSpatialIndex()
+            for pos, bbox in enumerate(self.bboxes):
+                self.index.addFeature(pos, bbox)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _candidates(self, bbox):
+        if self.extent is None or not self.extent.intersects(bbox):
+            return []
+        if self.index is not None:
+            return sorted(self.index.intersects(bbox))
+        return [pos for pos, zb in enumerate(self.bboxes) if zb.intersects(bbox)]
+
+    def intersects_any(self, geom):
+        if geom is None or geom.isEmpty():
+            return False
+        g = geom.constGet()
+        for pos in self._candidates(geom.boundingBox()):
+            if self.engines[pos].intersects(g):
+                return True
+        return False
+
+    def matching(self, geom):
+        if geom is None or geom.isEmpty():
+            return []
+        g = geom.constGet()
+        return [self.ids[pos] for pos in self._candidates(geom.boundingBox()) if self.engines[pos].intersects(g)]
+
+    def intersects_points(self, xs, ys):
+        """Masque des points (x, y) qui intersectent au moins une zone ; NaN -> False."""
+        from qgis.core import QgsGeometry, QgsPointXY
+
+        require_numpy()
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        out = np.zeros(xs.shape[0], dtype=bool)
+        if self.extent is None or xs.shape[0] == 0:
+            return out
+        e = self.extent
+        with np.errstate(invalid='ignore'):
+            cand = np.flatnonzero((xs >= e.xMinimum()) & (xs <= e.xMaximum()) & (ys >= e.yMinimum()) & (ys <= e.yMaximum()))
+        if cand.size == 0:
+            return out
+        # un même ouvrage apparaît une fois par année : chaque point distinct n'est testé qu'une fois
+        pts, inverse = np.unique(np.column_stack((xs[cand], ys[cand])), axis=0, return_inverse=True)
+        hit = np.fromiter(
+            (self.intersects_any(QgsGeometry.fromPointXY(QgsPointXY(x, y))) for x, y in pts.tolist()),
+            dtype=bool, count=pts.shape[0])
+        out[cand] = hit[inverse.reshape(-1)]
+        return out
+
+
+def _cacheable(labels):
+    return all(isinstance(v, (str, int, float)) or v is None for v in labels)
+
+
+def _reference_zoning(zones_layer, label_field):
+    """
+    (couche dont la signature sert au cache, libellés retenus ou None).
+    Une couche mémoire extraite d'un zonage fichier, ou une vue filtrée de ce fichier (propriété
+    ZONAGE_SOURCE_PROPERTY), partage le cache du zonage complet : les affectations sont calculées sur celui-ci puis restreintes
+    aux zones présentes dans l'extrait. La restriction se fait par libellé : elle n'est retenue que si
+    chaque libellé de l'extrait désigne exactement les mêmes entités dans le zonage complet. Sinon
+    (homonymes, entité découpée en plusieurs parties dont une seule est extraite), l'extrait est
+    affecté directement.
+    """
+    from qgis.core import QgsVectorLayer
+    from .reading import feature_request
+
+    try:
+        uri = zones_layer.customProperty(ZONAGE_SOURCE_PROPERTY)
+    except AttributeError:
+        uri = None
+    if not uri:
+        return zones_layer, None
+    parent = QgsVectorLayer(str(uri), 'zonage', 'ogr')
+    if not parent.isValid() or parent.fields().indexFromName(label_field) < 0:
+        return zones_layer, None
+    wanted = Counter(plain_value(zf[label_field])
+                     for zf in zones_layer.getFeatures(feature_request(zones_layer, [label_field], geometry=False)))
+    found = Counter()
+    for zf in parent.getFeatures(feature_request(parent, [label_field], geometry=False)):
+        label = plain_value(zf[label_field])
+        if label in wanted:
+            found[label] += 1
+    if found != wanted:
+        return zones_layer, None
+    return parent, set(wanted)
+
+
+def assign_to_zones(zones_layer, label_field, points_layer, cols, rows_by_key, feedback=None):
+    """
+    Zones intersectées par chaque ouvrage -> (dict clé -> [libellés], nombre d'ouvrages repris du cache).
+    - rows_by_key : clé ouvrage -> ligne de `cols` (lecture en colonnes de `points_layer`) portant la
+      géométrie de référence de l'ouvrage
+    Un libellé par entité de zone intersectée (multi-affectation, doublons conservés) ; liste vide si
+    l'ouvrage n'intersecte aucune zone ; clé absente si l'ouvrage n'a pas de géométrie.
+    Un point simple est testé sur ses coordonnées lues ; les autres géométries sont relues par fid.
+    Le cache répond par identifiant d'ouvrage, ou à défaut par empreinte de géométrie (même position
+    déjà affectée sous un autre identifiant, ex : identifiant brut / nettoyé, pré-calcul).
+    """
+    from qgis.core import QgsGeometry, QgsPointXY
+    from .cache import assignment_key, load_assignments, store_assignments
+    from .reading import layer_cache_key, row_geometries
+
+    sig, source = layer_cache_key(zones_layer, [label_field])
+    keep = None
+    if sig is None or zones_layer.subsetString():
+        zones_layer, keep = _reference_zoning(zones_layer, label_field)
+        if keep is not None:
+            sig, source = layer_cache_key(zones_layer, [label_field])
+    known = load_assignments(sig)
+    by_footprint = {g: z for g, z in known.values()}
+    complex_rows = [r for r in rows_by_key.values() if cols.complex[r]]
+    shapes = row_geometries(points_layer, cols, complex_rows) if complex_rows else {}
+    out = {}
+    fresh = {}
+    todo = []  # (clé, clé texte, empreinte, géométrie)
+    for key, r in rows_by_key.items():
+        if cols.complex[r]:
+            geom = shapes.get(r)
+            if geom is None:
+                continue
+            footprint = 'g' + hashlib.sha1(bytes(geom.asWkb())).hexdigest()
+        else:
+            x, y = float(cols.x[r]), float(cols.y[r])
+            if x != x or y != y:
+                continue
+            geom = None
+            footprint = f"p{x!r} {y!r}"
+        skey = assignment_key(plain_value(key))
+        entry = known.get(skey)
+        if entry is not None and entry[0] == footprint:
+            out[key] = entry[1]
+        elif footprint in by_footprint:
+            out[key] = by_footprint[footprint]
+            fresh[skey] = (footprint, out[key])
+        else:
+            todo.append((key, skey, footprint, geom))
+    n_cached = len(out)
+    if todo:
+        zones = PreparedZones((zf[label_field], zf.geometry()) for zf in zones_layer.getFeatures())
+        progress = Progress(feedback, len(todo))
+        for key, skey, footprint, geom in todo:
+            if progress.stopped():
+                break
+            if geom is None:
+                x, y = float(cols.x[rows_by_key[key]]), float(cols.y[rows_by_key[key]])
+                geom = QgsGeometry.fromPointXY(QgsPointXY(x, y))
+            labels = zones.matching(geom)
+            out[key] = labels
+            if _cacheable(labels):
+                fresh[skey] = (footprint, labels)
+    if fresh and (feedback is None or not feedback.isCanceled()):
+        store_assignments(sig, source, fresh)
+    if keep is not None:
+        out = {k: [z for z in labels if plain_value(z) in keep] for k, labels in out.items()}
+    return out, n_cached
+
+
+def precompute_assignments(points_layer, key_field, zonings, feedback=None):
+    """
+    Affecte en une lecture tous les ouvrages de `points_layer` aux zones de chaque zonage et remplit le
+    cache d'affectation : les algorithmes par zonage n'ont ensuite plus de test spatial à faire.
+    - key_field : champ identifiant ouvrage ; position de référence = dernière entité lue de l'ouvrage
+    - zonings : liste de (nom, couche de zonage, champ libellé)
+    Retourne une liste de (nom, ouvrages affectés, ouvrages déjà en cache) ; None si annulé.
+    """
+    from .cube import pick_by_key
+    from .reading import read_columns
+
+    cols, origin = read_columns(points_layer, [(key_field, 'value')], geometry=True, feedback=feedback)
+    if cols is None:
+        return None
+    keys = cols.value(key_field)
+    with_geom = cols.has_geometry()
+    rows_by_key = pick_by_key(keys, [r if (k is not None and g) else None for r, (k, g) in enumerate(zip(keys.tolist(), with_geom.tolist()))])
+    if feedback is not None:
+        feedback.pushInfo(f"{len(rows_by_key)} ouvrages localisés ({len(cols)} entités, {origin}).")
+    summary = []
+    for name, layer, label_field in zonings:
+        if feedback is not None:
+            if feedback.isCanceled():
+                return None
+            feedback.pushInfo(f"Affectation : {name}...")
+        assigned, n_cached = assign_to_zones(layer, label_field, points_layer, cols, rows_by_key, feedback)
+        summary.append((name, len(assigned), n_cached))
+    return summary
+
+
+def zone_parents(child_layer, child_field, parent_layer, parent_field):
+    """
+    Zone englobante de chaque zone d'un zonage fin -> (dict libellé enfant -> libellé parent, repris du cache).
+    Une zone enfant est rattachée au parent qui contient un de ses points intérieurs (pointOnSurface) :
+    exact pour des zonages emboîtés (communes -> départements -> délégation), approché sinon.
+    Enfant sans parent : absent du dict. Relation mise en cache (zone_assign.sqlite) tant que les deux
+    zonages sont inchangés, enfants sans parent compris (mémorisés avec une liste vide).
+    """
+    from .cache import assignment_key, load_assignments, store_assignments
+    from .reading import layer_cache_key
+
+    child_sig, child_source = layer_cache_key(child_layer, [child_field])
+    parent_sig, parent_source = layer_cache_key(parent_layer, [parent_field])
+    sig = None
+    if child_sig is not None and parent_sig is not None:
+        sig = hashlib.sha1(f"{child_sig}>{parent_sig}".encode('utf-8')).hexdigest()
+    source = f"{child_source}>{parent_source}"
+    known = load_assignments(sig)
+    if known:
+        return {json.loads(k): zones[0] for k, (_, zones) in known.items() if zones}, True
+    parents = PreparedZones((zf[parent_field], zf.geometry()) for zf in parent_layer.getFeatures())
+    out = {}
+    entries = {}
+    for zf in child_layer.getFeatures():
+        label = plain_value(zf[child_field])
+        geom = zf.geometry()
+        found = [] if geom is None or geom.isEmpty() else parents.matching(geom.pointOnSurface())[:1]
+        key = assignment_key(label)
+        if found:
+            out[label] = found[0]
+        if found or key not in entries:
+            entries[key] = ('c', found)
+    if _cacheable(out.values()):
+        store_assignments(sig, source, entries)
+    return out, False
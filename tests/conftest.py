@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Tests du moteur vocal_core (sans QGIS) : `python -m pytest -q` depuis la racine du dépôt.
+Le moteur est importé depuis le dossier scripts, comme le font les scripts Processing.
+"""
+
+import os
+import sys
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Cube ouvrage × année, affectation aux zones et ratios VP/VA.
+Fige trois comportements historiques des scripts :
+- un volume NaN compte 0 mais l'année est présente,
+- le nom retenu est celui de la dernière année, à égalité celui de la dernière ligne lue,
+- un libellé de zone répété pour un ouvrage (multi-affectation) le compte deux fois.
+"""
+
+import math
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vocal_core import (
+    AssignmentMatrix,
+    build_autor_index,
+    build_year_cube,
+    group_ratio_history,
+    join_autor,
+    pick_by_key,
+    ratio_history,
+    regroup_cube,
+)
+
+
+def test_nan_volume_is_present_year_with_zero_volume():
+    cube = build_year_cube(['A', 'A', 'A', 'B'], [2020, 2021, 2021, 2020], [10.0, np.nan, 5.0, np.nan])
+    assert cube.keys.tolist() == ['A', 'B']
+    assert cube.years.tolist() == [2020, 2021]
+    assert cube.mask.tolist() == [[True, True], [True, False]]
+    assert cube.values.tolist() == [[10.0, 5.0], [0.0, 0.0]]
+    assert cube.n_years().tolist() == [2, 1]
+
+
+def test_year_window_and_valid_rows():
+    cube = build_year_cube(['A', 'A', 'A'], [2019, 2020, 2021], [1.0, 2.0, 4.0],
+                           start_year=2020, valid=[True, True, False])
+    assert cube.years.tolist() == [2020]
+    assert cube.values.tolist() == [[2.0]]
+
+
+def test_latest_year_name_wins_ties_to_last_row():
+    keys = ['A', 'A', 'A', 'B', 'B']
+    names = ['a 2021', 'a 2022 first', 'a 2022 last', 'b 2020', None]
+    years = [2021, 2022, 2022, 2020, 2023]
+    assert pick_by_key(keys, names, order=years) == {'A': 'a 2022 last', 'B': 'b 2020'}
+    # première ligne lue (géométrie de référence des scripts ratio)
+    assert pick_by_key(keys, names, last=False) == {'A': 'a 2021', 'B': 'b 2020'}
+
+
+def test_duplicate_zone_labels_count_twice():
+    cube = build_year_cube(['O1', 'O2'], [2020, 2020], [10.0, 1.0])
+    # O1 affecté deux fois à Z1 (deux entités de zone de même libellé), O2 à Z1 et Z2
+    rows = [0, 0, 1, 1]
+    zones = ['Z1', 'Z1', 'Z1', 'Z2']
+    assignment = AssignmentMatrix(rows, zones, len(cube))
+    assert assignment.keys.tolist() == ['Z1', 'Z2']
+    assert assignment.nnz() == 3
+    grouped = regroup_cube(cube, assignment=assignment)
+    assert grouped.values.tolist() == [[21.0], [1.0]]
+
+
+def test_assignment_matrix_without_scipy(monkeypatch):
+    from vocal_core import cube as cube_module
+
+    monkeypatch.setattr(cube_module, 'use_sparse', False)
+    assignment = AssignmentMatrix([0, 0, 1, 1], ['Z1', 'Z1', 'Z1', 'Z2'], 2)
+    assert assignment.matrix is None
+    assert assignment.aggregate(np.array([10.0, 1.0])).tolist() == [21.0, 1.0]
+    assert assignment.nnz() == 3
+
+
+def test_regroup_drops_groups_without_years():
+    cube = build_year_cube(['O1', 'O2'], [2020, 2021], [3.0, 4.0])
+    grouped = regroup_cube(cube, rows=[0], group_keys=['Z1'])
+    assert grouped.keys.tolist() == ['Z1']
+    assert grouped.mask.tolist() == [[True, False]]
+
+
+def test_autor_index_and_join():
+    index = build_autor_index([' O1 ', 'O1', 'O2', None, 'O3'], ['1 000', '2 500,5', '', '9', 'x'],
+                              ddtm=['D1', ' D2 ', None, 'D9', ''])
+    assert sorted(index) == ['O1', 'O2', 'O3']
+    assert index['O1'] == {'vol_max': 2500.5, 'ddtm': {'D1', 'D2'}}
+    assert math.isnan(index['O2']['vol_max'])
+    out = join_autor(['O1', 'O2', 'O4'], np.array([5001.0, 10.0, 3.0]), index)
+    assert out['matched'].tolist() == [True, True, False]
+    assert out['ratio_possible'].tolist() == [1, 0, 0]
+    assert out['ratio'][0] == pytest.approx(2.0)
+    assert out['percent_overrun'][0] == pytest.approx(100.0)
+    assert np.isnan(out['ratio'][1:]).all()
+
+
+def test_ratio_history_summary():
+    prelev = np.array([[50.0, 150.0, 80.0], [5.0, 0.0, 0.0]])
+    mask = np.array([[True, True, True], [True, False, False]])
+    out = ratio_history(prelev, np.array([[100.0], [np.nan]]), mask, np.array([2020, 2021, 2022]))
+    assert out['n_years'].tolist() == [3, 1]
+    assert out['n_years_overrun'].tolist() == [1, 0]
+    assert out['ratio_max'][0] == pytest.approx(1.5)
+    assert np.isnan(out['ratio_max'][1])
+    assert out['year_ratio_max'].tolist() == [2021, 0]
+
+
+def test_group_ratio_history_sums_autor_of_present_ouvrages():
+    cube = build_year_cube(['O1', 'O2', 'O2'], [2020, 2020, 2021], [30.0, 20.0, 60.0])
+    prelev_cube, out = group_ratio_history(cube, np.array([100.0, np.nan]), [0, 1], ['Z', 'Z'])
+    assert prelev_cube.values.tolist() == [[50.0, 60.0]]
+    # 2020 : VA de O1 seul (O2 sans VA) ; 2021 : aucun ouvrage présent avec VA
+    assert out['autor_sum'][0, 0] == 100.0
+    assert np.isnan(out['autor_sum'][0, 1])
+    assert out['ratio'][0, 0] == pytest.approx(0.5)
+    assert out['n_ouvrages'].tolist() == [[2, 1]]
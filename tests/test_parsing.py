@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Conversion des assiettes et des années : versions colonne = versions scalaires historiques."""
+
+import math
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vocal_core import parse_number, parse_numbers, parse_year_to_int, parse_years
+
+RAW_NUMBERS = [
+    '12000,56', '12 000,56', '12\xa0000,56', '12.000,56', '12000.56', '12,000.56', '1 234 m3',
+    '-5', '-0,5', '1-2', '1.2.3', '--1', '.', '-', '', '   ', 'abc', None, 7, 7.5, 0, '²', '1²',
+    '1e3', '  42  ', '3,', ',5',
+]
+
+
+def same_float(a, b):
+    return (math.isnan(a) and math.isnan(b)) or a == b
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('12000,56', 12000.56),
+    ('12 000,56', 12000.56),
+    ('12\xa0000,56', 12000.56),
+    ('12.000,56', 12000.56),
+    ('12,000.56', 12000.56),
+    ('1 234 m³', 1234.0),
+    # comportement historique : le chiffre d'une unité est conservé
+    ('1 234 m3', 12343.0),
+    ('-0,5', -0.5),
+    (7, 7.0),
+])
+def test_parse_number(raw, expected):
+    assert parse_number(raw) == expected
+
+
+@pytest.mark.parametrize('raw', [None, '', '   ', 'abc', '.', '-'])
+def test_parse_number_unreadable_is_nan(raw):
+    assert math.isnan(parse_number(raw))
+
+
+def test_parse_numbers_matches_scalar():
+    got = parse_numbers(RAW_NUMBERS)
+    assert got.dtype == np.float64
+    for raw, value in zip(RAW_NUMBERS, got.tolist()):
+        assert same_float(value, parse_number(raw)), raw
+
+
+def test_parse_numbers_bad_entry_does_not_spoil_block():
+    # une valeur que float() refuse ne doit pas faire repasser tout le bloc par la version scalaire
+    values = ['1', '2,5', '²', '4']
+    got = parse_numbers(values)
+    assert got[[0, 1, 3]].tolist() == [1.0, 2.5, 4.0]
+    assert same_float(got[2], parse_number('²'))
+
+
+@pytest.mark.parametrize('values', [
+    ['１２', '٣', '1٣', '-３', '٣.5', '12'],
+    ['１２ ٣٤٥,٦', '１,٢', '12'],
+])
+def test_parse_numbers_non_ascii_digits_match_scalar(values):
+    # float() accepte les chiffres Unicode, la version scalaire non : la version colonne suit la scalaire
+    for raw, value in zip(values, parse_numbers(values).tolist()):
+        assert same_float(value, parse_number(raw)), raw
+
+
+def test_parse_numbers_numeric_array():
+    assert parse_numbers(np.array([1, 2, 3])).tolist() == [1.0, 2.0, 3.0]
+
+
+def test_parse_years_matches_scalar():
+    raw = [2020, 2021.0, '2022', ' 2023 ', '2019.0', 'année 2018', 'x', None, '']
+    years, valid = parse_years(raw)
+    for r, y, ok in zip(raw, years.tolist(), valid.tolist()):
+        expected = parse_year_to_int(r)
+        assert ok == (expected is not None), r
+        if ok:
+            assert y == expected
+
+
+def test_parse_years_float_array_nan_invalid():
+    years, valid = parse_years(np.array([2020.0, np.nan, 2021.7]))
+    assert valid.tolist() == [True, False, True]
+    assert years[valid].tolist() == [2020, 2021]
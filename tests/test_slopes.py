@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Pentes OLS (NumPy) et Theil-Sen (SciPy) : résultats figés sur les implémentations de référence."""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vocal_core import PrefixStats, YearCube, ols_slopes, theil_sen_long, theil_sen_matrix
+from vocal_core.theilsen import PAIRWISE_MAX_POINTS
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(3)
+    years = np.arange(2008, 2024)
+    values = rng.uniform(100, 5000, (40, years.size)) + 30.0 * (years - 2008)
+    mask = rng.random((40, years.size)) < 0.7
+    mask[0] = False           # aucune année
+    mask[1] = False
+    mask[1, 4] = True         # une seule année
+    return years, values, mask
+
+
+def test_ols_slopes_match_polyfit(series):
+    years, values, mask = series
+    got = ols_slopes(values, mask, years)
+    for i in range(values.shape[0]):
+        m = mask[i]
+        if m.sum() < 2:
+            assert np.isnan(got[i])
+        else:
+            assert got[i] == pytest.approx(np.polyfit(years[m], values[i, m], 1)[0], rel=1e-9)
+
+
+def test_theil_sen_matrix_matches_scipy(series):
+    stats = pytest.importorskip('scipy.stats')
+    years, values, mask = series
+    got = theil_sen_matrix(values, mask, years)
+    for i in range(values.shape[0]):
+        m = mask[i]
+        if m.sum() < 2:
+            assert np.isnan(got[i])
+        else:
+            assert got[i] == pytest.approx(stats.theilslopes(values[i, m], years[m])[0], rel=1e-12)
+
+
+@pytest.mark.parametrize('n', [PAIRWISE_MAX_POINTS // 2, PAIRWISE_MAX_POINTS * 20])
+def test_theil_sen_long_matches_scipy(n):
+    stats = pytest.importorskip('scipy.stats')
+    rng = np.random.default_rng(n)
+    x = np.sort(rng.uniform(0, 1000, n))
+    y = 2.5 * x + rng.standard_cauchy(n) * 50.0
+    assert theil_sen_long(x, y) == pytest.approx(stats.theilslopes(y, x)[0], rel=1e-12)
+
+
+def test_theil_sen_long_duplicate_x():
+    stats = pytest.importorskip('scipy.stats')
+    x = np.array([0.0, 1.0, 1.0, 2.0, 3.0, 3.0, 4.0])
+    y = np.array([1.0, 2.0, 4.0, 3.0, 8.0, 5.0, 9.0])
+    # paires de même abscisse exclues, comme scipy
+    assert theil_sen_long(x, y) == pytest.approx(stats.theilslopes(y, x)[0])
+
+
+def test_prefix_stats_windows_match_direct(series):
+    years, values, mask = series
+    stats = PrefixStats(YearCube(np.arange(values.shape[0]).astype(object), years, np.where(mask, values, 0.0), mask))
+    for start, end in ((None, None), (2010, 2015), (2000, 2012), (2019, 2030)):
+        sel = np.ones(years.size, dtype=bool)
+        if start is not None:
+            sel &= years >= start
+        if end is not None:
+            sel &= years <= end
+        ind = stats.window_indicators(start, end)
+        n = mask[:, sel].sum(axis=1)
+        assert ind['n_years'].tolist() == n.tolist()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(mask[:, sel], values[:, sel], 0.0).sum(axis=1) / n
+        np.testing.assert_allclose(ind['mean'], mean, rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(ind['slope'], ols_slopes(values[:, sel], mask[:, sel], years[sel]),
+                                   rtol=1e-7, atol=1e-9, equal_nan=True)